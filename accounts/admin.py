@@ -2,9 +2,12 @@ from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
 from django.contrib.auth.forms import UserChangeForm, UserCreationForm
 from django.utils.translation import ugettext_lazy as _
-from .models import User, Profile
+from . import avatars, deletion
+from .models import User, Profile, GuestAccount, AccountDeletion
 
 admin.site.register(Profile)
+admin.site.register(GuestAccount)
+admin.site.register(AccountDeletion)
 
 class MyUserChangeForm(UserChangeForm):
     class Meta:
@@ -40,6 +43,27 @@ class MyUserAdmin(UserAdmin):
     list_filter = ('is_staff', 'is_superuser', 'is_active', 'groups')
     search_fields = ('email', 'username')
     ordering = ('email',)
+    actions = ['request_deletion']
+
+    # ユーザーをそのまま削除すると、タスク・メモをすべて読んで1つのトランザクションで消すことになるので、
+    # 管理画面からは削除させず（一覧の「削除」アクション・編集画面の削除ボタンも出なくなる）、退会させる
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+    @admin.action(description='選択したユーザーを退会させる（データは purge_accounts コマンドで消す）')
+    def request_deletion(self, request, queryset):
+        for user in queryset:
+            deletion.request_deletion(user)
+
+    def save_model(self, request, obj, form, change):
+        # 画像が変わった場合は、縮小版を作り直す
+        avatar_changed = 'avatar' in form.changed_data
+        old_hash = obj.avatar_hash
+        if avatar_changed:
+            obj.avatar_hash = ''
+        super().save_model(request, obj, form, change)
+        if avatar_changed:
+            avatars.schedule_variants(obj, old_hash)
 
 
 admin.site.register(User, MyUserAdmin)
\ No newline at end of file
@@ -0,0 +1,141 @@
+"""プロフィール画像の縮小版
+
+アップロードされた画像(User.avatar)から、SIZES の大きさの正方形の縮小版を WebP と JPEG で作る。
+ファイル名には元画像の内容のハッシュが入るので、同じ名前のファイルの中身が変わることはなく、
+ブラウザに長期間キャッシュさせてよい（avatar_file_view が Cache-Control を付けて返す）。
+
+縮小版はリクエストの処理を待たせないように、保存のコミット後にスレッドプールで作る。
+作り終わると User.avatar_hash にハッシュを書き、テンプレートは account_tags の {% avatar %} で
+表示する大きさに合った縮小版を読む。縮小版ができるまでは元画像をそのまま表示する。
+"""
+import hashlib
+import io
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from PIL import Image, ImageOps
+
+from task import caches
+from .models import User
+
+logger = logging.getLogger(__name__)
+
+# 作る縮小版の大きさ(px)。テンプレートでは表示する大きさと、高解像度の画面用にその2倍を使う
+SIZES = (32, 64, 128, 256)
+# 縮小版の形式と保存時のオプション。WebPに対応していないブラウザには JPEG を返す
+FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 6}),
+    'jpg': ('JPEG', {'quality': 85, 'optimize': True, 'progressive': True}),
+}
+# 縮小版を置くディレクトリ（MEDIA_ROOTから）
+VARIANT_DIR = 'avatars'
+
+WORKERS = getattr(settings, 'AVATAR_WORKERS', 2)
+CACHE_SECONDS = getattr(settings, 'AVATAR_CACHE_SECONDS', 60 * 60 * 24 * 365)
+
+executor = ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix='avatar')
+
+
+def variant_name(avatar_hash, size, ext):
+    """縮小版のファイル名（ストレージ上のパス）"""
+    return f'{VARIANT_DIR}/{avatar_hash}-{size}.{ext}'
+
+
+def variant_url(avatar_hash, size, ext):
+    return default_storage.url(variant_name(avatar_hash, size, ext))
+
+
+def get_size(size):
+    """表示する大きさ以上で一番小さい縮小版の大きさを返す（無ければ一番大きいもの）"""
+    for variant_size in SIZES:
+        if variant_size >= size:
+            return variant_size
+    return SIZES[-1]
+
+
+def open_square(data):
+    """画像を開いて、向きを直して中央を正方形に切り抜く。透過部分は白で塗る"""
+    image = Image.open(io.BytesIO(data))
+    image = ImageOps.exif_transpose(image)
+    if image.mode in ('RGBA', 'LA', 'P'):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, 'white')
+        background.paste(image, mask=image.getchannel('A'))
+        image = background
+    elif image.mode != 'RGB':
+        image = image.convert('RGB')
+
+    side = min(image.size)
+    return ImageOps.fit(image, (side, side), Image.LANCZOS)
+
+
+def build_variants(name):
+    """元画像 name の縮小版をすべて作り、元画像のハッシュを返す
+
+    同じ内容の画像の縮小版がすでにあれば、作り直さずにそれを使う。
+    """
+    with default_storage.open(name, 'rb') as f:
+        data = f.read()
+    avatar_hash = hashlib.sha256(data).hexdigest()[:16]
+
+    names = [
+        (size, ext, variant_name(avatar_hash, size, ext))
+        for size in SIZES for ext in FORMATS
+    ]
+    if all(default_storage.exists(variant) for _, _, variant in names):
+        return avatar_hash
+
+    square = open_square(data)
+    for size, ext, variant in names:
+        if default_storage.exists(variant):
+            continue
+        resized = square.resize((size, size), Image.LANCZOS) if square.width > size else square
+        image_format, options = FORMATS[ext]
+        buffer = io.BytesIO()
+        resized.save(buffer, image_format, **options)
+        default_storage.save(variant, ContentFile(buffer.getvalue()))
+    return avatar_hash
+
+
+def delete_variants(avatar_hash):
+    """どのユーザーも使っていなければ、そのハッシュの縮小版を消す"""
+    if not avatar_hash or User.objects.filter(avatar_hash=avatar_hash).exists():
+        return
+    for size in SIZES:
+        for ext in FORMATS:
+            default_storage.delete(variant_name(avatar_hash, size, ext))
+
+
+def generate_variants(user_id, name, old_hash=''):
+    """スレッドプールで実行する処理。縮小版を作って、元画像が変わっていなければ avatar_hash を保存する"""
+    try:
+        avatar_hash = build_variants(name)
+        # 作っている間に別の画像がアップロードされていたら、そちらの処理に任せる
+        if User.objects.filter(pk=user_id, avatar=name).update(avatar_hash=avatar_hash):
+            # update() ではシグナルが送られないので、ページのETagを変えるために直接記録する
+            caches.touch_watermark(user_id)
+        delete_variants(old_hash)
+    except Exception:
+        logger.exception('プロフィール画像の縮小版を作れませんでした: user=%s name=%s', user_id, name)
+    finally:
+        # スレッドごとの接続を開いたままにしない
+        connection.close()
+
+
+def schedule_variants(user, old_hash=''):
+    """保存のコミット後に、user.avatar の縮小版をバックグラウンドで作る
+
+    user.avatar_hash は呼び出し側で空にして保存しておくこと。
+    画像を消した場合は、古い縮小版の削除だけを行う。
+    """
+    if user.avatar:
+        args = (generate_variants, user.pk, user.avatar.name, old_hash)
+    elif old_hash:
+        args = (delete_variants, old_hash)
+    else:
+        return
+    transaction.on_commit(lambda: executor.submit(*args))
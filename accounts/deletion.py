@@ -0,0 +1,130 @@
+"""退会したアカウントのデータの削除
+
+User を delete() すると、Django はカスケードで消す行（タスク・メモ・検索用トークンなど）をすべてメモリに読み、
+1つのトランザクションで消すので、長く使ったユーザーだと表を長い時間ロックしてしまう。そこで退会は2段階にする。
+
+- 退会した時は request_deletion() で User.is_active を False にして、退会の記録(AccountDeletion)を残すだけにする。
+  ユーザーはその場でログインできなくなる。
+- purge_accounts コマンド（cronなどで定期的に実行する）が purge_user() で、外部キーで参照する側の表から順に
+  chunk_size 件ずつ消していき、最後にプロフィール画像と User を消す。
+  DELETE は1回ずつコミットされるので、途中で止まっても次の実行で続きから消せる。
+- 消すユーザーのタスク・メモは同期も集計もされないので、削除の記録(Tombstone)も集計の更新も行わない。
+- 管理画面で is_active を True に戻したユーザーは、退会を取り消したものとして消さない。
+  消している途中で戻された場合も、次の DELETE の前に確かめて止める。
+"""
+from django.conf import settings
+from django.db import transaction
+
+from task.models import (
+    ChangeCounter, Comment, ConsecutiveRecord, DailySummary, RecurringSkip, RecurringTask, SearchToken, Task,
+    TaskArchive, Tombstone,
+)
+from task.summaries import skip_refresh
+from task.sync import skip_tombstones
+
+from . import avatars
+from .models import AccountDeletion, Profile, User
+
+# 1回のDELETEで消す行の数
+CHUNK_SIZE = getattr(settings, 'ACCOUNT_PURGE_CHUNK_SIZE', 1000)
+
+
+def request_deletion(user):
+    """退会させる。データは後から purge_user() で消す"""
+    with transaction.atomic():
+        user.is_active = False
+        # パスワードを変えると、ほかの端末のセッションもログアウトされる
+        user.set_unusable_password()
+        user.save(update_fields=['is_active', 'password'])
+        AccountDeletion.objects.get_or_create(user=user)
+
+
+def get_pending_deletions():
+    """まだデータを消していない退会の記録を、退会した順に返す"""
+    return AccountDeletion.objects.filter(user__is_active=False).select_related('user').order_by('requested_at')
+
+
+def is_deletion_pending(user):
+    """退会したまま（退会の記録があり、有効に戻されていない）ユーザーか"""
+    return AccountDeletion.objects.filter(user=user, user__is_active=False).exists()
+
+
+def get_purge_targets(user):
+    """ユーザーのデータを、消す順に (名前, クエリセット) で返す。外部キーで参照される表ほど後にする"""
+    return [
+        ('検索用トークン', SearchToken.objects.filter(user=user)),
+        ('タスク', Task.objects.filter(created_by=user)),
+        ('メモ', Comment.objects.filter(created_by=user)),
+        ('繰り返しを削除した日', RecurringSkip.objects.filter(recurrence__created_by=user)),
+        ('繰り返し', RecurringTask.objects.filter(created_by=user)),
+        ('アーカイブ', TaskArchive.objects.filter(user=user)),
+        ('日ごとの集計', DailySummary.objects.filter(user=user)),
+        ('削除の記録', Tombstone.objects.filter(user=user)),
+        ('連続記録', ConsecutiveRecord.objects.filter(user=user)),
+        ('変更の版', ChangeCounter.objects.filter(user=user)),
+        ('プロフィール', Profile.objects.filter(user=user)),
+    ]
+
+
+def delete_chunk(queryset, chunk_size=CHUNK_SIZE):
+    """クエリセットの行を最大 chunk_size 件消して、消した件数を返す
+
+    タスク・メモを消しても、集計の更新と削除の記録(Tombstone)は行わない。
+    """
+    pks = list(queryset.values_list('pk', flat=True)[:chunk_size])
+    if not pks:
+        return 0
+    with transaction.atomic(), skip_refresh(), skip_tombstones():
+        _, deleted = queryset.filter(pk__in=pks).delete()
+    return deleted.get(queryset.model._meta.label, 0)
+
+
+def purge_user(user, chunk_size=CHUNK_SIZE, log=None, check=is_deletion_pending):
+    """ユーザーのデータを chunk_size 件ずつ消し、最後にユーザーを消す
+
+    Args:
+        chunk_size: 1回のDELETEで消す行の数
+        log: 進み具合を書き出す関数
+        check: 消し続けてよいかを返す関数。DELETEの前に毎回呼ぶ（Noneなら確かめない）
+
+    Returns:
+        dict: {消したものの名前: 件数}（0件のものは含めない）。途中で退会が取り消された時はNone
+    """
+    log = log or (lambda message: None)
+
+    def cancelled():
+        if check and not check(user):
+            log(f'{user}: 退会が取り消されたので止めました')
+            return True
+        return False
+
+    result = {}
+    for label, queryset in get_purge_targets(user):
+        total = 0
+        while True:
+            if cancelled():
+                return None
+            deleted = delete_chunk(queryset, chunk_size)
+            if not deleted:
+                break
+            total += deleted
+            log(f'{user}: {label} {total}件')
+        if total:
+            result[label] = total
+
+    if cancelled():
+        return None
+
+    # 縮小版は、どのユーザーも使っていない時だけ消せるので、先にユーザーから外す
+    if user.avatar or user.avatar_hash:
+        old_hash = user.avatar_hash
+        if user.avatar:
+            user.avatar.delete(save=False)
+        User.objects.filter(pk=user.pk).update(avatar=None, avatar_hash='')
+        avatars.delete_variants(old_hash)
+        result['プロフィール画像'] = 1
+        log(f'{user}: プロフィール画像')
+
+    # 残っているのは退会の記録など数行だけなので、カスケードで消してよい
+    user.delete()
+    return result
@@ -26,3 +26,18 @@ class ProfileForm(forms.ModelForm):
         fields = (
             'website', 'bio',
         )
+
+
+class AccountDeleteForm(forms.Form):
+    """退会の確認。本人が操作していることを確かめるために、パスワードを入力してもらう"""
+    password = forms.CharField(label='パスワード', strip=False, widget=forms.PasswordInput)
+
+    def __init__(self, user, *args, **kwargs):
+        self.user = user
+        super().__init__(*args, **kwargs)
+
+    def clean_password(self):
+        password = self.cleaned_data['password']
+        if not self.user.check_password(password):
+            raise forms.ValidationError('パスワードが正しくありません。')
+        return password
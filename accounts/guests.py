@@ -0,0 +1,204 @@
+"""ゲストアカウントのプール
+
+ゲストログインのたびに、空いているゲスト(GuestAccount)を1人貸し出す。ゲストは貸し出し時点で
+サンプルのタスク・メモを持っていて、GUEST_SESSION_AGE 秒たつと期限切れになる。
+期限切れのゲストは guest_pool コマンド（cronなどで定期的に実行する）が少しずつ作り直し、
+空きが GUEST_POOL_SIZE 人になるように補充する。
+"""
+import datetime
+import random
+import uuid
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from task import caches
+from task.consecutive import rebuild_consecutive_record
+from task.models import Task, Comment, ConsecutiveRecord, DailySummary, RecurringTask, TaskArchive, Tombstone
+from task.sampledata import generate_history, bulk_create_history
+from task.search import rebuild_search_index
+from task.summaries import deferred_refresh, rebuild_daily_summaries
+from task.sync import skip_tombstones
+
+from . import avatars, deletion
+from .models import User, Profile, GuestAccount
+
+POOL_SIZE = getattr(settings, 'GUEST_POOL_SIZE', 10)
+POOL_MAX = getattr(settings, 'GUEST_POOL_MAX', 100)
+SESSION_AGE = getattr(settings, 'GUEST_SESSION_AGE', 60 * 60 * 2)
+HISTORY_DAYS = getattr(settings, 'GUEST_HISTORY_DAYS', 90)
+
+GUEST_USERNAME = 'ゲスト'
+# 今日より先の予定として作る日数
+FUTURE_DAYS = 14
+# 作り直す時に、1回のDELETEで消すタスクの数
+CHUNK_SIZE = 500
+
+
+def seed_guest(user):
+    """ゲストにサンプルのタスク・メモを作る（bulk_createなので、集計などはまとめて作り直す）"""
+    today = datetime.date.today()
+    start = today - datetime.timedelta(days=HISTORY_DAYS)
+    end = today + datetime.timedelta(days=FUTURE_DAYS)
+
+    with transaction.atomic():
+        bulk_create_history(generate_history(user, start, end, random.Random(), today=today))
+        rebuild_daily_summaries(user)
+        rebuild_search_index(user)
+        rebuild_consecutive_record(user)
+    caches.invalidate_task_range(user.pk, start, end)
+
+
+def create_guest(checked_out=False):
+    """サンプルデータ付きのゲストを1人作る。checked_out=True なら、そのまま貸し出し中にする"""
+    now = timezone.now()
+    with transaction.atomic():
+        user = User(email=f'guest-{uuid.uuid4().hex[:12]}@guest.com', username=GUEST_USERNAME)
+        # ゲストはプールからしかログインできないようにする
+        user.set_unusable_password()
+        user.save()
+        guest = GuestAccount.objects.create(
+            user=user,
+            checked_out_at=now if checked_out else None,
+            expires_at=now + datetime.timedelta(seconds=SESSION_AGE) if checked_out else None,
+        )
+        seed_guest(user)
+    return guest
+
+
+def clear_guest_data(user, chunk_size=CHUNK_SIZE):
+    """ゲストのタスク・メモと、そこから作った集計をすべて消す
+
+    1つのトランザクションが長くならないように、タスクは chunk_size 件ずつ消す。
+    """
+    start, end = None, None
+    for model in (Task, Comment):
+        while True:
+            chunk = list(model.objects.filter(created_by=user).values_list('pk', 'created_at')[:chunk_size])
+            if not chunk:
+                break
+            days = [day for _, day in chunk]
+            start = min([start, *days]) if start else min(days)
+            end = max([end, *days]) if end else max(days)
+            # 集計の更新は日ごとに1回にまとめる。ゲストのデータは同期しないので、削除の記録も残さない
+            with transaction.atomic(), deferred_refresh(), skip_tombstones():
+                model.objects.filter(pk__in=[pk for pk, _ in chunk]).delete()
+
+    # アーカイブした月も、キャッシュを消す範囲に含める
+    archived_months = list(TaskArchive.objects.filter(user=user).values_list('month', flat=True))
+    if archived_months:
+        start = min([start, *archived_months]) if start else min(archived_months)
+        end = max([end, *archived_months]) if end else max(archived_months)
+        TaskArchive.objects.filter(user=user).delete()
+
+    # 繰り返しはタスクを消した後に消す（削除した日の記録もカスケードで消える）
+    RecurringTask.objects.filter(created_by=user).delete()
+    DailySummary.objects.filter(user=user).delete()
+    Tombstone.objects.filter(user=user).delete()
+    ConsecutiveRecord.objects.filter(user=user).delete()
+    if start:
+        caches.invalidate_task_range(user.pk, start, end)
+
+
+def reset_guest(guest, chunk_size=CHUNK_SIZE):
+    """ゲストを、作った直後と同じ状態に戻して空きにする"""
+    user = guest.user
+    clear_guest_data(user, chunk_size)
+
+    # ゲストが変えたかもしれないプロフィールも元に戻す
+    old_hash = user.avatar_hash
+    if user.avatar:
+        user.avatar.delete(save=False)
+    user.avatar_hash = ''
+    Profile.objects.filter(user=user).delete()
+    user.username = GUEST_USERNAME
+    user.week_status = False
+    # パスワードを変えると、貸し出していたセッションもログアウトされる
+    user.set_unusable_password()
+    user.save()
+    avatars.delete_variants(old_hash)
+
+    seed_guest(user)
+    guest.checked_out_at = None
+    guest.expires_at = None
+    guest.save(update_fields=['checked_out_at', 'expires_at'])
+
+
+def checkout_guest():
+    """空いているゲストを1人貸し出す。空きが無くて新しく作れない時はNoneを返す
+
+    同時にログインされても同じゲストを2人に貸さないように、
+    「まだ空いていれば貸し出し中にする」UPDATEが1件更新できたゲストだけを使う。
+    """
+    now = timezone.now()
+    expires_at = now + datetime.timedelta(seconds=SESSION_AGE)
+
+    candidates = GuestAccount.objects.filter(checked_out_at__isnull=True).order_by('pk').values_list('pk', flat=True)
+    for pk in candidates[:10]:
+        claimed = GuestAccount.objects.filter(pk=pk, checked_out_at__isnull=True).update(
+            checked_out_at=now, expires_at=expires_at
+        )
+        if claimed:
+            return GuestAccount.objects.select_related('user').get(pk=pk)
+
+    # 空きが無ければ、上限まではその場で作る
+    if GuestAccount.objects.count() < POOL_MAX:
+        return create_guest(checked_out=True)
+    return None
+
+
+def is_active_guest(user):
+    """貸し出し中で、期限が切れていないゲストか"""
+    try:
+        guest = user.guest_account
+    except GuestAccount.DoesNotExist:
+        return False
+    return guest.checked_out_at is not None and not guest.is_expired()
+
+
+def maintain_pool(chunk_size=CHUNK_SIZE, limit=None, log=None):
+    """期限切れのゲストを作り直し、空きが POOL_SIZE 人になるように補充・削除する
+
+    Args:
+        chunk_size: 1回のDELETEで消すタスクの数
+        limit: 1回に作り直す期限切れのゲストの最大数（Noneなら全員）
+        log: 進み具合を書き出す関数
+
+    Returns:
+        dict: 作り直した・作った・削除したゲストの数
+    """
+    log = log or (lambda message: None)
+    result = {'reset': 0, 'created': 0, 'purged': 0}
+
+    expired = GuestAccount.objects.filter(expires_at__lte=timezone.now()).select_related('user').order_by('expires_at')
+    for guest in expired[:limit] if limit else expired:
+        reset_guest(guest, chunk_size)
+        result['reset'] += 1
+        log(f'{guest}: 作り直しました')
+
+    available = GuestAccount.objects.filter(checked_out_at__isnull=True)
+    shortage = POOL_SIZE - available.count()
+    for _ in range(max(0, shortage)):
+        guest = create_guest()
+        result['created'] += 1
+        log(f'{guest}: 作りました')
+
+    # アクセスが多い時にその場で作ったゲストのうち、空きすぎている分は削除する。
+    # 削除している間に貸し出されないように、checkout_guest() と同じく「まだ空いていれば貸し出し中にする」
+    # UPDATEが1件更新できたゲストだけを消す。期限切れにしておくので、削除が途中で止まっても次の実行で作り直される
+    surplus = list(available.order_by('-pk').values_list('pk', flat=True)[:max(0, -shortage)])
+    now = timezone.now()
+    for pk in surplus:
+        claimed = GuestAccount.objects.filter(pk=pk, checked_out_at__isnull=True).update(
+            checked_out_at=now, expires_at=now
+        )
+        if not claimed:
+            continue
+        guest = GuestAccount.objects.select_related('user').get(pk=pk)
+        # ゲストは退会していないので、退会の取り消しは確かめない
+        deletion.purge_user(guest.user, chunk_size, log=log, check=None)
+        result['purged'] += 1
+        log(f'{guest}: 削除しました')
+
+    return result
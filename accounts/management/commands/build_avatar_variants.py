@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.avatars import build_variants
+from accounts.models import User
+from task import caches
+
+
+class Command(BaseCommand):
+    help = 'プロフィール画像の縮小版を作ります（縮小版の無い、アップロード済みの画像が対象です）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='対象ユーザーのメールアドレス（省略すると全ユーザー）')
+        parser.add_argument('--all', action='store_true', help='縮小版があるユーザーも作り直す')
+
+    def handle(self, *args, **options):
+        users = User.objects.exclude(avatar='').exclude(avatar=None).order_by('pk')
+        if options['user']:
+            users = users.filter(email=options['user'])
+            if not users.exists():
+                raise CommandError(f"画像を設定したユーザーが見つかりません: {options['user']}")
+        if not options['all']:
+            users = users.filter(avatar_hash='')
+
+        count = 0
+        for user in users.iterator():
+            try:
+                avatar_hash = build_variants(user.avatar.name)
+            except Exception as e:
+                self.stderr.write(f'{user}: {e}')
+                continue
+            if User.objects.filter(pk=user.pk, avatar=user.avatar.name).update(avatar_hash=avatar_hash):
+                caches.touch_watermark(user.pk)
+            count += 1
+            self.stdout.write(f'{user}: {avatar_hash}')
+
+        self.stdout.write(self.style.SUCCESS(f'{count}人の縮小版を作りました'))
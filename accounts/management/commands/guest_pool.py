@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from accounts.guests import CHUNK_SIZE, maintain_pool
+
+
+class Command(BaseCommand):
+    help = (
+        '期限切れのゲストアカウントをサンプルデータごと作り直し、空きのゲストを補充します。'
+        'cronなどで数分おきに実行してください'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help='1回のDELETEで消すタスクの数')
+        parser.add_argument('--limit', type=int, help='1回に作り直す期限切れのゲストの最大数（省略すると全員）')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        log = self.stdout.write if options['verbosity'] > 1 else None
+        result = maintain_pool(options['chunk_size'], options['limit'], log=log)
+        seconds = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"作り直し{result['reset']}人・追加{result['created']}人・削除{result['purged']}人（{seconds:.1f}秒）"
+        ))
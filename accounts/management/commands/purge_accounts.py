@@ -0,0 +1,36 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from accounts.deletion import CHUNK_SIZE, get_pending_deletions, purge_user
+
+
+class Command(BaseCommand):
+    help = (
+        '退会したアカウントのタスク・メモなどを少しずつ消し、最後にアカウントを消します。'
+        'cronなどで定期的に実行してください'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help='1回のDELETEで消す行の数')
+        parser.add_argument('--limit', type=int, help='1回に消すアカウントの最大数（省略すると全員）')
+
+    def handle(self, *args, **options):
+        log = self.stdout.write if options['verbosity'] > 1 else None
+        deletions = get_pending_deletions()
+        if options['limit']:
+            deletions = deletions[:options['limit']]
+
+        purged = 0
+        for deletion in deletions:
+            started = time.monotonic()
+            result = purge_user(deletion.user, options['chunk_size'], log=log)
+            seconds = time.monotonic() - started
+            if result is None:
+                self.stdout.write(f'{deletion.user}: 退会が取り消されたので止めました（{seconds:.1f}秒）')
+                continue
+            purged += 1
+            rows = '・'.join(f'{label}{count}件' for label, count in result.items()) or 'データなし'
+            self.stdout.write(f'{deletion.user}: {rows}（{seconds:.1f}秒）')
+
+        self.stdout.write(self.style.SUCCESS(f'{purged}人のアカウントを削除しました'))
@@ -0,0 +1,37 @@
+# Generated by Django 3.2.25 on 2026-10-18 15:37
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GuestAccount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='作成日時')),
+                ('checked_out_at', models.DateTimeField(blank=True, null=True, verbose_name='貸し出した日時')),
+                ('expires_at', models.DateTimeField(blank=True, null=True, verbose_name='貸し出しの期限')),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='guest_account', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'guest_account',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='guestaccount',
+            index=models.Index(fields=['checked_out_at'], name='guest_checked_out_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='guestaccount',
+            index=models.Index(fields=['expires_at'], name='guest_expires_idx'),
+        ),
+    ]
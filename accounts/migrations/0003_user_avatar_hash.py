@@ -0,0 +1,18 @@
+# Generated by Django 3.2.25 on 2026-10-18 15:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0002_guestaccount'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='avatar_hash',
+            field=models.CharField(blank=True, editable=False, max_length=16, verbose_name='プロフィール画像のハッシュ'),
+        ),
+    ]
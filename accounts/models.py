@@ -52,6 +52,8 @@ class User(AbstractBaseUser, PermissionsMixin):
         help_text='ホーム画面などで表示される名前です（日本語も使えます）',
     )
     avatar = models.ImageField('プロフィール画像', upload_to='uploads', null=True, blank=True)
+    # 縮小版(accounts/avatars.py)の元画像のハッシュ。縮小版ができるまでは空
+    avatar_hash = models.CharField('プロフィール画像のハッシュ', max_length=16, blank=True, editable=False)
     # カレンダーの週始まり設定。Trueで日曜始まりになる
     week_status = models.BooleanField('週の始まりを日曜にする（デフォルトは月曜）', default=False)
 
@@ -91,6 +93,13 @@ class User(AbstractBaseUser, PermissionsMixin):
         """Send an email to this user."""
         send_mail(subject, message, from_email, [self.email], **kwargs)
 
+    def delete(self, *args, **kwargs):
+        # タスク・メモもカスケードで消えるが、消えるユーザーの削除の記録(Tombstone)は残さない。
+        # 削除が失敗しても印が残らないよう、シグナルではなくここで囲む（task は accounts を読み込むので関数内で読む）
+        from task import sync
+        with sync.deleting_user(self.pk):
+            return super().delete(*args, **kwargs)
+
 
 class Profile(models.Model):
     """
@@ -108,3 +117,45 @@ class Profile(models.Model):
         # userオブジェクトをそのまま渡すとエラーになるのでstrにする
         return str(self.user)
 
+
+
+class GuestAccount(models.Model):
+    """
+    ゲストログイン用に用意しておくユーザー
+    1つのセッションに1人ずつ貸し出し、期限が切れたらサンプルデータごと作り直して使い回す。
+    貸し出し・作り直しは accounts/guests.py から行う
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='guest_account')
+    created_at = models.DateTimeField('作成日時', default=timezone.now)
+    checked_out_at = models.DateTimeField('貸し出した日時', null=True, blank=True)
+    expires_at = models.DateTimeField('貸し出しの期限', null=True, blank=True)
+
+    class Meta:
+        db_table = 'guest_account'
+        indexes = [
+            # 空いているゲスト・期限切れのゲストを探す用
+            models.Index(fields=['checked_out_at'], name='guest_checked_out_idx'),
+            models.Index(fields=['expires_at'], name='guest_expires_idx'),
+        ]
+
+    def __str__(self):
+        return str(self.user)
+
+    def is_expired(self, now=None):
+        return self.expires_at is not None and self.expires_at <= (now or timezone.now())
+
+
+class AccountDeletion(models.Model):
+    """
+    退会の申し込み
+    退会した時点でユーザーはログインできなくなり、タスク・メモなどは purge_accounts コマンドが
+    accounts/deletion.py で少しずつ消す。最後にユーザーを消すと、この行もカスケードで消える
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='deletion')
+    requested_at = models.DateTimeField('退会した日時', default=timezone.now)
+
+    class Meta:
+        db_table = 'account_deletion'
+
+    def __str__(self):
+        return str(self.user)
@@ -0,0 +1,16 @@
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from task import caches
+from .models import User, Profile
+
+
+@receiver(post_save, sender=User)
+def touch_user_watermark(sender, instance, **kwargs):
+    """ユーザー名・週の始まりなどはページに表示されるので、変わったらページのETagも変える"""
+    caches.touch_watermark(instance.pk)
+
+
+@receiver(post_save, sender=Profile)
+def touch_profile_watermark(sender, instance, **kwargs):
+    caches.touch_watermark(instance.user_id)
@@ -0,0 +1,27 @@
+from django import template
+from django.templatetags.static import static
+
+from accounts import avatars
+
+register = template.Library()
+
+
+@register.inclusion_tag('accounts/avatar.html')
+def avatar(user, size, css_class='avatar'):
+    """プロフィール画像を size px で表示する。縮小版があれば、大きさに合ったものを読む"""
+    context = {'size': size, 'css_class': css_class}
+    if user.avatar_hash:
+        # 高解像度の画面では2倍の大きさを使う
+        small, large = avatars.get_size(size), avatars.get_size(size * 2)
+        for ext in avatars.FORMATS:
+            context[ext] = (
+                f'{avatars.variant_url(user.avatar_hash, small, ext)} 1x, '
+                f'{avatars.variant_url(user.avatar_hash, large, ext)} 2x'
+            )
+        context['src'] = avatars.variant_url(user.avatar_hash, small, 'jpg')
+    elif user.avatar:
+        # 縮小版ができるまでは元画像を使う
+        context['src'] = user.avatar.url
+    else:
+        context['src'] = static('img/avatar.png')
+    return context
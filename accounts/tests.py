@@ -1,3 +1,271 @@
-from django.test import TestCase
+import datetime
+import hashlib
+import tempfile
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from task import archives, caches, recurring
+from task.models import (
+    ChangeCounter, Comment, DailySummary, RecurringSkip, RecurringTask, SearchToken, Task, TaskArchive, Tombstone,
+)
+
+from . import avatars, deletion, guests
+from .models import AccountDeletion, GuestAccount, Profile
+
+
+def create_user(email='user@example.com', **extra_fields):
+    return get_user_model().objects.create_user(email, 'password', **extra_fields)
+
+
+def create_records(user):
+    """退会で消す表に、それぞれ1行以上の行を作る"""
+    day = datetime.date(2024, 3, 4)
+    recurrence = RecurringTask.objects.create(
+        created_by=user, title='毎日', rule=RecurringTask.DAILY, interval=1, start_date=day,
+    )
+    task = recurring.materialize(user, day)[0]
+    recurring.skip_occurrence(task)
+    task.delete()
+    for i in range(3):
+        Task.objects.create(created_by=user, title=f'タスク{i}', created_at=day)
+    Comment.objects.create(created_by=user, created_at=day, body='メモ')
+    Task.objects.create(created_by=user, title='先月', created_at=datetime.date(2024, 2, 1))
+    archives.archive_month(user, datetime.date(2024, 2, 1))
+    Profile.objects.create(user=user)
+    return recurrence
+
+
+@mock.patch.object(guests, 'HISTORY_DAYS', 3)
+@mock.patch.object(guests, 'FUTURE_DAYS', 1)
+class GuestPoolTests(TestCase):
+    def test_checkout_hands_out_each_guest_once(self):
+        for _ in range(2):
+            guests.create_guest()
+        first, second = guests.checkout_guest(), guests.checkout_guest()
+        self.assertNotEqual(first.pk, second.pk)
+        self.assertTrue(guests.is_active_guest(first.user))
+        self.assertTrue(Task.objects.filter(created_by=first.user).exists())
+
+    @mock.patch.object(guests, 'POOL_SIZE', 2)
+    def test_maintain_pool_resets_expired_guests(self):
+        guest = guests.create_guest(checked_out=True)
+        Task.objects.filter(created_by=guest.user).delete()
+        Task.objects.create(created_by=guest.user, title='ゲストが追加', created_at=datetime.date.today())
+        GuestAccount.objects.filter(pk=guest.pk).update(expires_at=timezone.now())
+
+        result = guests.maintain_pool()
+        self.assertEqual(result, {'reset': 1, 'created': 1, 'purged': 0})
+        guest.refresh_from_db()
+        self.assertIsNone(guest.checked_out_at)
+        self.assertFalse(Task.objects.filter(created_by=guest.user, title='ゲストが追加').exists())
+        self.assertTrue(Task.objects.filter(created_by=guest.user).exists())
+
+    @mock.patch.object(guests, 'POOL_SIZE', 0)
+    def test_surplus_purge_skips_guests_checked_out_meanwhile(self):
+        pool = [guests.create_guest() for _ in range(3)]
+        purge_user = deletion.purge_user
+        checked_out = []
+
+        def checkout_during_purge(user, *args, **kwargs):
+            # 1人目を消している間に、ほかのリクエストがゲストを借りた
+            if not checked_out:
+                checked_out.append(guests.checkout_guest())
+            return purge_user(user, *args, **kwargs)
+
+        with mock.patch.object(deletion, 'purge_user', checkout_during_purge):
+            result = guests.maintain_pool()
+
+        self.assertEqual(result['purged'], 2)
+        self.assertEqual(checked_out[0].pk, pool[0].pk)
+        self.assertEqual(list(GuestAccount.objects.values_list('pk', flat=True)), [pool[0].pk])
+        self.assertTrue(Task.objects.filter(created_by=pool[0].user).exists())
+
+
+class PurgeUserTests(TestCase):
+    def setUp(self):
+        self.user = create_user()
+        self.other = create_user('other@example.com')
+        create_records(self.user)
+        create_records(self.other)
+        deletion.request_deletion(self.user)
+
+    def count_rows(self, user):
+        return {
+            model.__name__: model.objects.filter(**{field: user}).count()
+            for model, field in (
+                (Task, 'created_by'), (Comment, 'created_by'), (SearchToken, 'user'),
+                (RecurringTask, 'created_by'), (RecurringSkip, 'recurrence__created_by'),
+                (TaskArchive, 'user'), (DailySummary, 'user'), (Tombstone, 'user'), (ChangeCounter, 'user'),
+                (Profile, 'user'),
+            )
+        }
+
+    def test_request_deletion(self):
+        self.user.refresh_from_db()
+        self.assertFalse(self.user.is_active)
+        self.assertFalse(self.user.has_usable_password())
+        self.assertEqual(list(deletion.get_pending_deletions()), [AccountDeletion.objects.get(user=self.user)])
+
+        # 管理画面で有効に戻したユーザーは消さない
+        get_user_model().objects.filter(pk=self.user.pk).update(is_active=True)
+        self.assertEqual(list(deletion.get_pending_deletions()), [])
+
+    def test_purge_user_in_chunks(self):
+        before = self.count_rows(self.other)
+        self.assertTrue(all(before.values()), before)
+        user_id = self.user.pk
+
+        logs = []
+        result = deletion.purge_user(self.user, chunk_size=2, log=logs.append)
+        self.assertEqual(result['タスク'], 3)
+        self.assertEqual(result['メモ'], 1)
+        self.assertIn(f'{self.user}: タスク 2件', logs)
+        self.assertIn(f'{self.user}: タスク 3件', logs)
+
+        self.assertFalse(get_user_model().objects.filter(pk=user_id).exists())
+        self.assertFalse(AccountDeletion.objects.filter(user_id=user_id).exists())
+        self.assertFalse(any(self.count_rows(user_id).values()))
+        # ほかのユーザーのデータは消さない
+        self.assertEqual(self.count_rows(self.other), before)
+
+    def test_reactivated_user_is_not_purged(self):
+        def reactivate(message):
+            # 消している途中で、管理画面から有効に戻された
+            get_user_model().objects.filter(pk=self.user.pk).update(is_active=True)
+
+        self.assertIsNone(deletion.purge_user(self.user, chunk_size=2, log=reactivate))
+        self.assertTrue(get_user_model().objects.filter(pk=self.user.pk).exists())
+        self.assertTrue(Task.objects.filter(created_by=self.user).exists())
+
+    def test_purge_accounts_command(self):
+        out = StringIO()
+        call_command('purge_accounts', stdout=out)
+        self.assertIn('1人のアカウントを削除しました', out.getvalue())
+        self.assertFalse(get_user_model().objects.filter(pk=self.user.pk).exists())
+        self.assertTrue(get_user_model().objects.filter(pk=self.other.pk).exists())
+
+
+class UserDeleteTests(TestCase):
+    def test_delete_writes_no_tombstones(self):
+        user = create_user()
+        Task.objects.create(created_by=user, title='a', created_at=datetime.date(2024, 3, 4))
+        user_id = user.pk
+        user.delete()
+        self.assertFalse(Tombstone.objects.filter(user_id=user_id).exists())
+        self.assertFalse(get_user_model().objects.filter(pk=user_id).exists())
+
+    def test_failed_delete_still_records_tombstones_later(self):
+        user = create_user()
+        task = Task.objects.create(created_by=user, title='a', created_at=datetime.date(2024, 3, 4))
+        with mock.patch('django.db.models.Model.delete', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                user.delete()
+
+        # 削除に失敗しても、そのユーザーの削除の記録は残るようになる
+        task_id = task.pk
+        task.delete()
+        self.assertTrue(Tombstone.objects.filter(user=user, object_id=task_id).exists())
+
+
+class AccountDeleteViewTests(TestCase):
+    def setUp(self):
+        self.user = create_user()
+        self.client.force_login(self.user)
+
+    def test_wrong_password(self):
+        response = self.client.post(reverse('account:delete'), {'password': 'wrong'})
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(AccountDeletion.objects.exists())
+
+    def test_delete(self):
+        response = self.client.post(reverse('account:delete'), {'password': 'password'})
+        self.assertRedirects(response, reverse('task:top'), fetch_redirect_response=False)
+        self.assertTrue(AccountDeletion.objects.filter(user=self.user).exists())
+        self.assertFalse(self.client.login(email='user@example.com', password='password'))
+
+
+class AvatarTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        override = override_settings(MEDIA_ROOT=media_root.name)
+        override.enable()
+        self.addCleanup(override.disable)
+
+        self.user = create_user()
+        self.client.force_login(self.user)
+
+    def upload(self, color):
+        buffer = BytesIO()
+        Image.new('RGB', (300, 200), color).save(buffer, 'PNG')
+        data = buffer.getvalue()
+        # 縮小版はコミット後にスレッドプールで作るので、ここではその場で作る
+        # （テストの接続を閉じないように connection.close() は止める）
+        with mock.patch.object(avatars.executor, 'submit', lambda fn, *args: fn(*args)), \
+                mock.patch.object(avatars, 'connection'), \
+                self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('account:edit'), {
+                'username': 'user', 'email': self.user.email,
+                'avatar': SimpleUploadedFile('avatar.png', data, content_type='image/png'),
+            })
+        self.user.refresh_from_db()
+        return hashlib.sha256(data).hexdigest()[:16]
+
+    def test_variants(self):
+        watermark = caches.get_watermark(self.user.pk)
+        avatar_hash = self.upload('red')
+        self.assertEqual(self.user.avatar_hash, avatar_hash)
+        self.assertNotEqual(caches.get_watermark(self.user.pk), watermark)
+
+        for size in avatars.SIZES:
+            for ext, (image_format, _) in avatars.FORMATS.items():
+                with default_storage.open(avatars.variant_name(avatar_hash, size, ext)) as f:
+                    image = Image.open(f)
+                    self.assertEqual(image.format, image_format)
+                    # 元画像より大きくはしない。横長の画像は中央を正方形に切り抜く
+                    self.assertEqual(image.size, (min(size, 200),) * 2)
+
+        response = self.client.get(avatars.variant_url(avatar_hash, 64, 'webp'))
+        self.assertIn('immutable', response['Cache-Control'])
+
+        # 画像を変えると、ほかに使っているユーザーがいない古い縮小版は消す
+        new_hash = self.upload('blue')
+        self.assertEqual(self.user.avatar_hash, new_hash)
+        self.assertFalse(default_storage.exists(avatars.variant_name(avatar_hash, 64, 'webp')))
+        self.assertTrue(default_storage.exists(avatars.variant_name(new_hash, 64, 'webp')))
+
+
+class UserAdminTests(TestCase):
+    def setUp(self):
+        self.admin = create_user('admin@example.com', is_staff=True, is_superuser=True)
+        self.user = create_user()
+        self.client.force_login(self.admin)
+
+    def test_users_are_not_deleted_from_admin(self):
+        response = self.client.get(reverse('admin:accounts_user_changelist'))
+        actions = [name for name, _ in response.context['action_form'].fields['action'].choices]
+        self.assertNotIn('delete_selected', actions)
+        self.assertIn('request_deletion', actions)
+
+        response = self.client.get(reverse('admin:accounts_user_change', args=(self.user.pk,)))
+        self.assertNotContains(response, reverse('admin:accounts_user_delete', args=(self.user.pk,)))
+        response = self.client.post(reverse('admin:accounts_user_delete', args=(self.user.pk,)), {'post': 'yes'})
+        self.assertEqual(response.status_code, 403)
+        self.assertTrue(get_user_model().objects.filter(pk=self.user.pk).exists())
+
+    def test_request_deletion_action(self):
+        self.client.post(reverse('admin:accounts_user_changelist'), {
+            'action': 'request_deletion', '_selected_action': [self.user.pk],
+        })
+        self.user.refresh_from_db()
+        self.assertFalse(self.user.is_active)
+        self.assertTrue(AccountDeletion.objects.filter(user=self.user).exists())
@@ -1,10 +1,11 @@
 from django.urls import path
-from .views import profile_view, profile_edit_view, guest_login
+from .views import profile_view, profile_edit_view, account_delete_view, guest_login
 
 app_name = 'account'
 
 urlpatterns = [
     path('mypage/', profile_view, name='profile'),
     path('mypage/edit/', profile_edit_view, name='edit'),
+    path('mypage/delete/', account_delete_view, name='delete'),
     path('guest_login/', guest_login, name='guest-login'),
 ]
@@ -1,5 +1,8 @@
+import os
+
+from django.conf import settings
 from django.contrib import messages
-from django.contrib.auth import login
+from django.contrib.auth import login, logout
 from django.http import HttpResponseRedirect
 from django.shortcuts import redirect, render, get_object_or_404
 from django.urls import reverse_lazy
@@ -7,9 +10,12 @@ from django.views.generic import CreateView
 from django.contrib.auth.views import LoginView
 from django.core.exceptions import ObjectDoesNotExist
 from django.contrib.auth.decorators import login_required
+from django.utils.cache import patch_cache_control
+from django.views.static import serve
 
-from .models import User, Profile
-from .forms import ProfileForm, UserCreateForm, UserEditForm
+from . import avatars, deletion, guests
+from .models import User, Profile, GuestAccount
+from .forms import AccountDeleteForm, ProfileForm, UserCreateForm, UserEditForm
 
 
 class SignUpView(CreateView):
@@ -59,8 +65,17 @@ def profile_edit_view(request):
 
     if request.method == 'POST' and user_form.is_valid() and prof_form.is_valid():
 
-        user_form.save()
+        # 画像が変わった場合は、縮小版ができるまで元画像を表示する
+        avatar_changed = 'avatar' in user_form.changed_data
+        old_hash = user_form.instance.avatar_hash
+        if avatar_changed:
+            user_form.instance.avatar_hash = ''
+
+        user = user_form.save()
         prof_form.save()
+        if avatar_changed:
+            # 縮小版はバックグラウンドで作るので、ここでは待たない
+            avatars.schedule_variants(user, old_hash)
         messages.add_message(request, messages.SUCCESS, 'ユーザー情報を更新しました。')
         return redirect('account:profile')
 
@@ -72,7 +87,42 @@ def profile_edit_view(request):
     return render(request, 'accounts/mypage/edit.html', context)
 
 
+@login_required
+def account_delete_view(request):
+    """退会する。すぐにログアウトしてログインできなくし、データは purge_accounts コマンドが後から消す"""
+    # ゲストは作り直して使い回すので、退会させない
+    if GuestAccount.objects.filter(user=request.user).exists():
+        messages.add_message(request, messages.ERROR, 'ゲストアカウントは退会できません。')
+        return redirect('account:profile')
+
+    form = AccountDeleteForm(request.user, request.POST or None)
+    if request.method == 'POST' and form.is_valid():
+        deletion.request_deletion(request.user)
+        logout(request)
+        messages.add_message(request, messages.SUCCESS, '退会しました。ご利用ありがとうございました。')
+        return redirect('task:top')
+
+    return render(request, 'accounts/mypage/delete.html', {'form': form})
+
+
+def avatar_file_view(request, path):
+    """プロフィール画像の縮小版を返す。ファイル名に内容のハッシュが入っているので、長くキャッシュさせる"""
+    response = serve(request, path, document_root=os.path.join(settings.MEDIA_ROOT, avatars.VARIANT_DIR))
+    patch_cache_control(response, public=True, max_age=avatars.CACHE_SECONDS, immutable=True)
+    return response
+
+
 def guest_login(request):
-    guest_user = User.objects.get(email='guest@guest.com')
-    login(request, guest_user)
+    """プールからゲストを1人借りてログインする（訪問者ごとに別のゲストになる）"""
+    if request.user.is_authenticated and guests.is_active_guest(request.user):
+        return redirect('task:top')
+
+    guest = guests.checkout_guest()
+    if guest is None:
+        messages.add_message(request, messages.ERROR, 'ただいまゲストログインが混み合っています。しばらくしてからお試しください。')
+        return redirect('task:top')
+
+    login(request, guest.user)
+    # ゲストの貸し出し期限と一緒に、セッションも切れるようにする
+    request.session.set_expiry(guests.SESSION_AGE)
     return redirect('task:top')
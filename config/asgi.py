@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+# 日ごとの表示とタスクの完了切り替えを、非同期版のビューにする（settings.ASYNC_VIEWS）
+os.environ.setdefault('ASYNC_VIEWS', 'True')
 
 application = get_asgi_application()
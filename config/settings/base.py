@@ -31,6 +31,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # リクエストごとの処理時間・クエリ数の記録。全体を測るため先頭に置く
+    'task.middleware.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -81,6 +83,49 @@ AUTH_PASSWORD_VALIDATORS = [
 ]
 
 
+# Cache
+# https://docs.djangoproject.com/en/3.2/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+# 日ごとの表示とタスクの完了切り替えに、非同期版のビュー(task/async_views.py)を使う
+# ASGIで動かす時は config/asgi.py が True にする。WSGIでは False のままにすること
+ASYNC_VIEWS = env.bool('ASYNC_VIEWS', default=False)
+
+# 日ごとの表示・完了済みタスク一覧のETagに含める版。デプロイでテンプレートや静的ファイルを変えた時に変えると、
+# ブラウザに残っている古いページが使われなくなる
+PAGE_ETAG_VERSION = env('PAGE_ETAG_VERSION', default='1')
+
+# リクエストの処理時間・クエリ数を集計する期間（秒）。直近2期間分が /metrics/ で見られる
+REQUEST_METRICS_WINDOW = 300
+
+# 月間カレンダーのキャッシュ期間（タスク・コメントの変更時には個別に削除される）
+TASK_CALENDAR_CACHE_TIMEOUT = 60 * 60 * 24 * 7
+
+# 今月を含めて、この月数より前の月のタスク・メモを archive_tasks コマンドでアーカイブする
+TASK_ARCHIVE_MONTHS = 12
+
+# 差分同期(/sync/)で1回に返す変更の数の目安
+SYNC_PAGE_SIZE = 500
+
+# ゲストアカウントのプール。guest_poolコマンドを定期的に実行して、期限切れのゲストを作り直す
+GUEST_POOL_SIZE = 10                # 空きとして用意しておくゲストの数
+GUEST_POOL_MAX = 100                # ゲストの最大数（空きが無い時はこの数まで、その場で作る）
+GUEST_SESSION_AGE = 60 * 60 * 2     # 1人のゲストを貸し出す時間（秒）
+GUEST_HISTORY_DAYS = 90             # ゲストに用意するサンプルのタスクの日数
+
+# プロフィール画像の縮小版。アップロード後にバックグラウンドのスレッドで作る（accounts/avatars.py）
+AVATAR_WORKERS = 2                          # 縮小版を作るスレッドの数
+AVATAR_CACHE_SECONDS = 60 * 60 * 24 * 365   # 縮小版のキャッシュ期間（ファイル名に内容のハッシュが入るので長くてよい）
+
+# 退会したアカウントのデータは、purge_accountsコマンドを定期的に実行して少しずつ消す（accounts/deletion.py）
+ACCOUNT_PURGE_CHUNK_SIZE = 1000     # 1回のDELETEで消す行の数
+
+
 # Internationalization
 # https://docs.djangoproject.com/en/3.2/topics/i18n/
 
@@ -17,8 +17,16 @@ MIDDLEWARE += [
     "debug_toolbar.middleware.DebugToolbarMiddleware",
 ]
 INTERNAL_IPS = ['127.0.0.1']
+
+
+def show_toolbar(request):
+    # テストはDEBUG=Falseで動き、ツールバーのURLが登録されないので、その時は出さない
+    from django.conf import settings
+    return settings.DEBUG
+
+
 DEBUG_TOOLBAR_CONFIG = {
-    "SHOW_TOOLBAR_CALLBACK": lambda request: True,
+    "SHOW_TOOLBAR_CALLBACK": show_toolbar,
 }
 
 # Database settings
@@ -29,6 +37,9 @@ DATABASES = {
     }
 }
 
+# 静的ファイルはハッシュ付きの名前にしない（product.pyの設定はcollectstaticしないと使えない。テストはDEBUG=Falseで動く）
+STATICFILES_STORAGE = 'django.contrib.staticfiles.storage.StaticFilesStorage'
+
 # HTTPS settings
 SESSION_COOKIE_SECURE = False
 CSRF_COOKIE_SECURE = False
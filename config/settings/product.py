@@ -12,11 +12,28 @@ DATABASES = {
         'HOST': '/opt/bitnami/mariadb/tmp/mysql.sock',
         'PORT': '3306',
         'USER': env('DB_USER'),
-        'PASSWORD': env('DB_PASS')
+        'PASSWORD': env('DB_PASS'),
+        # 接続をリクエストごとに閉じずに使い回す（秒）。非同期版のビュー(task/async_views.py)はクエリを
+        # スレッドプールの複数のスレッドで同時に実行するので、0だと1リクエストで何本も接続し直すことになる。
+        # 接続はスレッドごとに持つので、MariaDBの max_connections は プロセス数 ×（スレッド数 + 1）より大きくしておくこと
+        'CONN_MAX_AGE': env.int('DB_CONN_MAX_AGE', default=60),
     }
 }
 
 STATIC_ROOT = BASE_DIR / 'static_files'
+# collectstatic でファイル名に内容のハッシュを付け、圧縮版(.gz / .br)も書き出す（config/staticfiles.py）
+# .br を作るには brotli パッケージが必要
+STATICFILES_STORAGE = 'config.staticfiles.CompressedManifestStaticFilesStorage'
+# ハッシュ付きの静的ファイルのキャッシュ期間
+STATIC_CACHE_SECONDS = 60 * 60 * 24 * 365
+
+# 複数のプロセスでキャッシュの削除を共有するため、ファイルベースのキャッシュを使う
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': env('CACHE_DIR', default=str(BASE_DIR / 'cache')),
+    }
+}
 
 # HTTPS settings
 SESSION_COOKIE_SECURE = True
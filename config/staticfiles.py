@@ -0,0 +1,132 @@
+"""静的ファイルのビルドと配信
+
+collectstatic で STATIC_ROOT に集める時に、ManifestStaticFilesStorage と同じようにファイル名に
+内容のハッシュを付け(staticfiles.json に対応表を書く)、さらに CSS・JSなどの圧縮版(.gz / .br)も書き出す。
+.br は brotli パッケージがインストールされている時だけ作る。
+
+static_file_view は STATIC_ROOT のファイルを、ブラウザが対応していれば圧縮版で返す。
+ハッシュ付きの名前のファイルは中身が変わらないので、immutable で長くキャッシュさせる。
+"""
+import gzip
+import os
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage, staticfiles_storage
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.views.static import serve
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# 圧縮版を作るファイルの拡張子
+COMPRESS_EXTENSIONS = ('.css', '.js', '.map', '.svg', '.json', '.txt', '.html')
+# これより小さいファイルは、圧縮してもほとんど変わらないので作らない（バイト）
+COMPRESS_MIN_SIZE = 256
+
+# ハッシュ付きのファイルのキャッシュ期間と、それ以外のファイルのキャッシュ期間（秒）
+CACHE_SECONDS = getattr(settings, 'STATIC_CACHE_SECONDS', 60 * 60 * 24 * 365)
+UNHASHED_CACHE_SECONDS = 60
+
+
+def compress_gzip(data):
+    # mtime=0 にして、同じ内容なら毎回同じファイルになるようにする
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+
+def compress_brotli(data):
+    return brotli.compress(data, quality=11)
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """ハッシュ付きの名前に加えて、圧縮版(.gz / .br)も書き出すストレージ"""
+
+    def get_compressors(self):
+        """(拡張子, 圧縮する関数) のリスト"""
+        compressors = [('.gz', compress_gzip)]
+        if brotli is not None:
+            compressors.append(('.br', compress_brotli))
+        return compressors
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+
+        # ハッシュを付け終わったファイルだけを圧縮する（テンプレートから参照されるのはこちら）
+        for name in sorted(set(self.hashed_files.values())):
+            for compressed_name in self.compress(name):
+                yield name, compressed_name, True
+
+    def compress(self, name):
+        """name の圧縮版を書き出し、書き出したファイル名のリストを返す"""
+        if not name.endswith(COMPRESS_EXTENSIONS):
+            return []
+
+        with self.open(name) as f:
+            data = f.read()
+        if len(data) < COMPRESS_MIN_SIZE:
+            return []
+
+        written = []
+        for extension, compress in self.get_compressors():
+            compressed = compress(data)
+            # 小さくならなければ、元のファイルを返せばよい
+            if len(compressed) >= len(data):
+                continue
+            compressed_name = name + extension
+            if self.exists(compressed_name):
+                self.delete(compressed_name)
+            self.save(compressed_name, ContentFile(compressed))
+            written.append(compressed_name)
+        return written
+
+
+@lru_cache(maxsize=None)
+def get_hashed_names():
+    """staticfiles.json にある、ハッシュ付きのファイル名の集合（デプロイ時にプロセスごと入れ替わる前提）"""
+    hashed_files = getattr(staticfiles_storage, 'hashed_files', None)
+    return frozenset(hashed_files.values()) if hashed_files else frozenset()
+
+
+def accepted_encodings(request):
+    """Accept-Encoding で受け付けると言っている圧縮形式の集合（q=0 のものは除く）"""
+    encodings = set()
+    for item in request.META.get('HTTP_ACCEPT_ENCODING', '').split(','):
+        encoding, _, params = item.partition(';')
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        if quality > 0:
+            encodings.add(encoding.strip().lower())
+    return encodings
+
+
+def static_file_view(request, path):
+    """STATIC_ROOT のファイルを、あれば圧縮版で返す
+
+    圧縮版は .br → .gz の順に探す。Content-Type は元のファイルのもの、Content-Encoding は
+    圧縮形式になる（django.views.static.serve が拡張子から付ける）。
+    """
+    document_root = settings.STATIC_ROOT
+    accepted = accepted_encodings(request)
+    served_path = path
+    for encoding, extension in (('br', '.br'), ('gzip', '.gz')):
+        if encoding in accepted and os.path.isfile(os.path.join(document_root, path + extension)):
+            served_path = path + extension
+            break
+
+    response = serve(request, served_path, document_root=document_root)
+    patch_vary_headers(response, ('Accept-Encoding',))
+    if path in get_hashed_names():
+        patch_cache_control(response, public=True, max_age=CACHE_SECONDS, immutable=True)
+    else:
+        patch_cache_control(response, public=True, max_age=UNHASHED_CACHE_SECONDS)
+    return response
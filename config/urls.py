@@ -2,7 +2,9 @@ from django.conf.urls.static import static
 from django.contrib import admin
 from django.conf import settings
 from django.urls import path, include
-from accounts.views import SignUpView, UserLoginView
+from accounts.avatars import VARIANT_DIR
+from accounts.views import SignUpView, UserLoginView, avatar_file_view
+from config.staticfiles import static_file_view
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -11,9 +13,16 @@ urlpatterns = [
     path('accounts/', include('django.contrib.auth.urls')),
     path('accounts/signup', SignUpView.as_view(), name="signup"),
     path('accounts/login', UserLoginView.as_view(), name="login"),
+    # プロフィール画像の縮小版は、長いキャッシュ期間を付けて返す（MEDIA_URLの下の他のファイルより先に置く）
+    path(f'{settings.MEDIA_URL.lstrip("/")}{VARIANT_DIR}/<path:path>', avatar_file_view, name='avatar-file'),
 ]
 
 if settings.DEBUG:
     import debug_toolbar
     urlpatterns += [path('__debug__/', include(debug_toolbar.urls))]
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
\ No newline at end of file
+    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+else:
+    # collectstatic で書き出したハッシュ付き・圧縮済みの静的ファイルを返す（config/staticfiles.py）
+    urlpatterns += [
+        path(f'{settings.STATIC_URL.lstrip("/")}<path:path>', static_file_view, name='static-file'),
+    ]
@@ -0,0 +1,46 @@
+// --------------------------------------------
+// 完了済みタスクの続きを読み込む（無限スクロール）
+// --------------------------------------------
+const more = document.querySelector('.more-tasks')
+const tbody = document.querySelector('.done-tasks')
+
+if (more) {
+  let loading = false
+
+  const loadMore = () => {
+    if (loading || !more.dataset.cursor) return
+    loading = true
+
+    fetch(`${more.dataset.url}?cursor=${encodeURIComponent(more.dataset.cursor)}`)
+      .then(res => res.json())
+      .then(data => {
+        for (const task of data.tasks) {
+          const tr = document.createElement('tr')
+          for (const value of [task.title, task.done_at]) {
+            const td = document.createElement('td')
+            td.textContent = value
+            tr.appendChild(td)
+          }
+          tbody.appendChild(tr)
+        }
+
+        if (data.next_cursor) {
+          more.dataset.cursor = data.next_cursor
+          more.firstElementChild.href = `?cursor=${data.next_cursor}`
+        } else {
+          more.dataset.cursor = ''
+          observer.disconnect()
+          more.remove()
+        }
+        loading = false
+      }).catch(err => {
+        loading = false
+        console.log(err)
+      })
+  }
+
+  const observer = new IntersectionObserver(entries => {
+    if (entries[0].isIntersecting) loadMore()
+  })
+  observer.observe(more)
+}
@@ -0,0 +1,260 @@
+// csrf tokenを取得するために使う
+const getCookie = name => {
+  if (document.cookie && document.cookie !== '') {
+    for (const cookie of document.cookie.split(';')) {
+      const [key, value] = cookie.trim().split('=');
+      if (key === name) {
+        return decodeURIComponent(value);
+      }
+    }
+  }
+};
+const csrftoken = getCookie('csrftoken');
+
+// --------------------------------------------
+// サーバーから返ってきた状態で、カレンダーと連続記録を書き換える
+// --------------------------------------------
+const updateDay = day => {
+  const cell = document.querySelector(`.task-calendar [data-date="${day.date}"]`)
+  if (!cell) return
+
+  cell.classList.toggle('has-task', day.has_task)
+
+  let check = cell.querySelector('.bi-check-circle-fill')
+  if (day.all_done && !check) {
+    check = document.createElement('i')
+    check.className = 'bi bi-check-circle-fill'
+    cell.prepend(check)
+  } else if (!day.all_done && check) {
+    check.remove()
+  }
+}
+
+const updateConsecutive = consecutive => {
+  const badges = [
+    [document.querySelector('.consecutive-best'), consecutive.most_consecutive_day],
+    [document.querySelector('.consecutive-current'), consecutive.current_consecutive_day],
+  ]
+  for (const [badge, days] of badges) {
+    badge.querySelector('.days').textContent = days
+    badge.classList.toggle('d-none', !days)
+  }
+}
+
+const updateState = data => {
+  updateDay(data.day)
+  updateConsecutive(data.consecutive)
+}
+
+// --------------------------------------------
+// その日の部分(.day-panel)のボタンなどにイベントを付ける。前日・翌日に移動して書き換えた後にも呼ぶ
+// --------------------------------------------
+const initDayPanel = () => {
+  // --------------------------------------------
+  // タスク削除処理
+  // --------------------------------------------
+  const btns = document.querySelectorAll('.delete')
+
+  for (let i = 0; i < btns.length; i++) {
+
+    btns[i].addEventListener('click', (e) => {
+      e.preventDefault()
+
+      const task_id = btns[i].dataset.taskId
+      const task_div = document.querySelector(`.task-${task_id}`)
+
+      fetch(btns[i].href, {
+        method: 'DELETE',
+        headers: {
+          'Content-Type': 'application/x-www-form-urlencoded; charset=utf-8',
+          'Accept': 'application/json',
+          'X-CSRFToken': csrftoken,
+        }
+      }).then(res => res.json()).then(data => {
+        task_div.innerHTML = `タスクは削除されました`
+        updateState(data)
+      }).catch(err => {
+        console.log(err)
+      })
+    })
+  }
+
+  // --------------------------------------------
+  // タスク完了処理
+  // --------------------------------------------
+  // 完了したタスクは削除ボタンを隠す（アーカイブした日には削除ボタンが無い）
+  const showDeleteBtn = checkbox => {
+    const btn = checkbox.closest('li').querySelector('.delete')
+    if (btn) btn.style = checkbox.checked ? 'display:none' : 'display:inline-block'
+  }
+
+  const checkboxes = document.querySelectorAll("input[type='checkbox']")
+  for (let i = 0; i < checkboxes.length; i++) {
+    showDeleteBtn(checkboxes[i])
+  }
+  for (let i = 0; i < checkboxes.length; i++) {
+
+    checkboxes[i].addEventListener('click', function () {
+
+      let task_id = checkboxes[i].getAttribute('id')
+      task_id = task_id.split('-')[2]
+      const task_title = checkboxes[i].nextElementSibling
+
+      let url = `/done/${task_id}/`
+
+      // チェック済みかどうか
+      if (checkboxes[i].checked) {
+        url += 'true/'
+        task_title.classList.add('done')
+      } else {
+        url += 'false/'
+        task_title.classList.remove('done')
+      }
+      showDeleteBtn(checkboxes[i])
+
+      fetch(url, {
+        method: 'POST',
+        headers: {
+          'Content-Type': 'application/x-www-form-urlencoded; charset=utf-8',
+          'Accept': 'application/json',
+          'X-CSRFToken': csrftoken,
+        }
+      }).then(res => res.json()).then(updateState).catch(err => {
+        console.log(err)
+      })
+    })
+  }
+
+  // --------------------------------------------
+  // この日のタスクをまとめて完了
+  // --------------------------------------------
+  const completeAll = document.querySelector('.complete-all')
+  if (completeAll) {
+    completeAll.addEventListener('click', () => {
+      const targets = [...checkboxes].filter(el => !el.checked && !el.disabled)
+      if (!targets.length) return
+
+      fetch(completeAll.dataset.url, {
+        method: 'POST',
+        headers: {
+          'Content-Type': 'application/json',
+          'Accept': 'application/json',
+          'X-CSRFToken': csrftoken,
+        },
+        body: JSON.stringify({action: 'done', ids: targets.map(el => el.id.split('-')[2])}),
+      }).then(res => res.json()).then(data => {
+        for (const el of targets) {
+          el.checked = true
+          el.nextElementSibling.classList.add('done')
+          showDeleteBtn(el)
+        }
+        data.days.forEach(updateDay)
+        updateConsecutive(data.consecutive)
+      }).catch(err => {
+        console.log(err)
+      })
+    })
+  }
+
+  // --------------------------------------------
+  // 「N日ごと」を選んだ時だけ、日数の入力欄を表示する
+  // --------------------------------------------
+  const repeat = document.querySelector("select[name='repeat']")
+  if (repeat) {
+    repeat.addEventListener('change', () => {
+      document.querySelector('.repeat-interval').classList.toggle('d-none', repeat.value !== 'interval')
+    })
+  }
+
+  // --------------------------------------------
+  // コメント編集表示切り替え
+  // --------------------------------------------
+  const editBtn = document.getElementById('edit-comment')
+  const cancelBtn = document.getElementById('cancel-comment')
+  let commentNormal = document.querySelector('.comment-normal')
+  let commentEdit = document.querySelector('.comment-edit')
+
+  let changeDisplay = (el) => {
+    if (el.style.display === 'none') {
+      el.style.display = 'block'
+    } else {
+      el.style.display = 'none'
+    }
+  }
+
+  const commentBtns = [editBtn, cancelBtn]
+
+  // ボタンが取得できる時（コメントが存在する時）だけイベント
+  if (editBtn) {
+    for (let i = 0; i < commentBtns.length; i++) {
+      commentBtns[i].addEventListener('click', function () {
+        changeDisplay(commentNormal)
+        changeDisplay(commentEdit)
+      })
+    }
+  }
+}
+initDayPanel()
+
+// --------------------------------------------
+// 同じ月の中の前日・翌日への移動は、その日の部分だけを読み込んで書き換える
+// （月が変わる時はカレンダーも変わるので、普通にページを移動する）
+// --------------------------------------------
+const dayPanel = document.querySelector('.day-panel')
+const calendar = document.querySelector('.task-calendar')
+
+const highlightDay = date => {
+  const current = calendar.querySelector('td.the_day')
+  if (current) current.classList.remove('the_day')
+
+  const span = calendar.querySelector(`[data-date="${date}"]`)
+  const cell = span && span.closest('td')
+  if (cell && !cell.classList.contains('today') && !cell.classList.contains('not_current_month')) {
+    cell.classList.add('the_day')
+  }
+}
+
+const showDay = (panelUrl, fallbackUrl, push) => {
+  fetch(panelUrl, {headers: {'Accept': 'application/json'}}).then(res => {
+    if (!res.ok || res.redirected) throw new Error(res.status)
+    return res.json()
+  }).then(data => {
+    dayPanel.innerHTML = data.html
+    initDayPanel()
+    highlightDay(data.date)
+    document.title = data.title
+
+    // 前月・翌月のリンクも、表示している日に合わせる
+    const day = Number(data.date.split('-')[2])
+    for (const link of document.querySelectorAll('.month-nav')) {
+      link.href = link.href.replace(/\d+\/$/, `${day}/`)
+    }
+
+    if (push) history.pushState({panelUrl}, '', data.url)
+  }).catch(err => {
+    console.log(err)
+    location.href = fallbackUrl
+  })
+}
+
+if (dayPanel && calendar) {
+  // 最初に表示した日にも戻れるようにする
+  history.replaceState({panelUrl: dayPanel.dataset.panelUrl}, '')
+
+  dayPanel.addEventListener('click', e => {
+    const link = e.target.closest('.day-nav')
+    if (!link || e.ctrlKey || e.metaKey || e.shiftKey) return
+    if (link.dataset.date.slice(0, 7) !== calendar.dataset.month) return
+
+    e.preventDefault()
+    showDay(link.dataset.panelUrl, link.href, true)
+  })
+
+  addEventListener('popstate', e => {
+    if (e.state && e.state.panelUrl) {
+      showDay(e.state.panelUrl, location.href, false)
+    } else {
+      location.reload()
+    }
+  })
+}
@@ -1,6 +1,8 @@
 from django.contrib import admin
-from .models import Task, Comment
+from .models import Task, Comment, RecurringTask, TaskArchive
 
 
 admin.site.register(Task)
 admin.site.register(Comment)
+admin.site.register(RecurringTask)
+admin.site.register(TaskArchive)
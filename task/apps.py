@@ -1,6 +1,14 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
 
 
 class TaskConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'task'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        from .middleware import install_query_counter
+
+        # リクエストごとのクエリ数を数えるため、DBに接続するたびに execute_wrapper を付ける
+        connection_created.connect(install_query_counter)
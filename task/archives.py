@@ -0,0 +1,290 @@
+"""古い月のタスク・メモのアーカイブ
+
+archive_tasks コマンドが、TASK_ARCHIVE_MONTHS か月より前の月のタスク・メモを、ユーザー・月ごとに
+1行(TaskArchive)にまとめて task / comment の表から消す。アーカイブにはその月の日ごとの集計も入れておく。
+
+- 日ごとの集計(DailySummary)はアーカイブしても消さないので、カレンダー・ヒートマップ・連続記録・統計は
+  今までどおり集計だけを読む。集計を作り直す時(summaries.count_days())はアーカイブの集計を足す。
+- 完了済みタスク一覧とエクスポートは、アーカイブしたタスクも合わせて読む。
+- アーカイブした月の日を表示する時は、get_archived_day() でアーカイブから読むだけにする（表示は読み取り専用）。
+- アーカイブした月に書き込む時（タスク・メモの追加・変更、インポート）は、restore_month() で先にタスク・メモを戻す。
+  戻したタスク・メモは元のIDのままなので、集計は変わらない。戻した月は次の archive_tasks でまたアーカイブされる。
+- 検索用のトークンはアーカイブすると消えるので、アーカイブした月は検索の対象にならない。
+- 同期(sync.py)では、アーカイブは削除ではないので削除の記録を残さない。アーカイブには中のタスク・メモの版の
+  最大値を付け、戻す時はすべてのタスク・メモをその版にする。
+"""
+import calendar
+import datetime
+import json
+import zlib
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max
+
+from . import caches, search, summaries, sync
+from .models import Comment, RecurringTask, Task, TaskArchive
+
+# 今月を含めて、この月数より前の月をアーカイブする
+ARCHIVE_MONTHS = getattr(settings, 'TASK_ARCHIVE_MONTHS', 12)
+
+
+def month_range(day):
+    """dayを含む月の (1日, 月末) を返す"""
+    first = day.replace(day=1)
+    return first, first.replace(day=calendar.monthrange(first.year, first.month)[1])
+
+
+def get_cutoff(today=None, months=ARCHIVE_MONTHS):
+    """アーカイブする月の境目（この日より前の月をアーカイブする）"""
+    month = (today or datetime.date.today()).replace(day=1)
+    for _ in range(months):
+        month = (month - datetime.timedelta(days=1)).replace(day=1)
+    return month
+
+
+def pack(tasks, comments):
+    """タスク・メモを TaskArchive.data の形（JSONをzlibで圧縮したもの）にする
+
+    Args:
+        tasks: [(ID, 作成日, タイトル, 完了日, 繰り返しのID), ...]
+        comments: [(ID, 作成日, 本文), ...]
+    """
+    days = {}
+    for _, created_at, _, done_at, _ in tasks:
+        total, done, has_comment = days.get(created_at, (0, 0, False))
+        days[created_at] = (total + 1, done + (done_at is not None), has_comment)
+    for _, created_at, _ in comments:
+        total, done, _ = days.get(created_at, (0, 0, False))
+        days[created_at] = (total, done, True)
+
+    # 日付は月の何日かだけを持つ
+    data = {
+        'tasks': [
+            [task_id, created_at.day, title, done_at.isoformat() if done_at else None, recurrence_id]
+            for task_id, created_at, title, done_at, recurrence_id in tasks
+        ],
+        'comments': [[comment_id, created_at.day, body] for comment_id, created_at, body in comments],
+        'days': [[day.day, *counts] for day, counts in sorted(days.items())],
+    }
+    return zlib.compress(json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode(), 9)
+
+
+def unpack(archive):
+    """TaskArchive.data を読んで、pack() に渡したのと同じ形のタスク・メモと、日ごとの集計を返す
+
+    Returns:
+        dict: {'tasks': [...], 'comments': [...], 'days': {日付: (タスク数, 完了数, メモの有無)}}
+    """
+    data = json.loads(zlib.decompress(archive.data))
+    month = archive.month
+    return {
+        'tasks': [
+            (
+                task_id, month.replace(day=day), title,
+                datetime.date.fromisoformat(done_at) if done_at else None, recurrence_id,
+            )
+            for task_id, day, title, done_at, recurrence_id in data['tasks']
+        ],
+        'comments': [(comment_id, month.replace(day=day), body) for comment_id, day, body in data['comments']],
+        'days': {
+            month.replace(day=day): (total, done, has_comment) for day, total, done, has_comment in data['days']
+        },
+    }
+
+
+def filter_archives(user, start=None, end=None):
+    """start〜endの日を含むアーカイブのクエリセット"""
+    archives = TaskArchive.objects.filter(user=user)
+    if start:
+        archives = archives.filter(month__gte=start.replace(day=1))
+    if end:
+        archives = archives.filter(month__lte=end)
+    return archives
+
+
+def get_archived_months(user, start, end):
+    """start〜endの日を含む、アーカイブした月(1日)の集合"""
+    return set(filter_archives(user, start, end).values_list('month', flat=True))
+
+
+def iter_archived(user, start=None, end=None):
+    """start〜endの日を含むアーカイブを、月の古い順に unpack() して1つずつ返す"""
+    for archive in filter_archives(user, start, end).order_by('month').iterator():
+        yield unpack(archive)
+
+
+def get_archived_days(user, start=None, end=None):
+    """アーカイブにある日ごとの集計を {日付: (タスク数, 完了数, メモの有無)} で返す"""
+    days = {}
+    for data in iter_archived(user, start, end):
+        days.update(
+            (day, counts) for day, counts in data['days'].items()
+            if (not start or day >= start) and (not end or day <= end)
+        )
+    return days
+
+
+def to_task(user, task_id, created_at, title, done_at, recurrence_id, version=0):
+    return Task(
+        id=task_id, title=title, created_at=created_at, done_at=done_at, created_by=user,
+        recurrence_id=recurrence_id, version=version,
+    )
+
+
+def get_archived_day(user, day):
+    """アーカイブした月の日のタスク・メモを、保存していない Task / Comment で返す
+
+    Returns:
+        tuple: (タスクのリスト, メモかNone)。その月のアーカイブが無ければNone
+    """
+    archive = filter_archives(user, day, day).first()
+    if archive is None:
+        return None
+    data = unpack(archive)
+    tasks = [to_task(user, *row, archive.version) for row in data['tasks'] if row[1] == day]
+    comment = next(
+        (
+            Comment(id=comment_id, created_at=created_at, body=body, created_by=user, version=archive.version)
+            for comment_id, created_at, body in data['comments'] if created_at == day
+        ),
+        None,
+    )
+    return tasks, comment
+
+
+def get_done_tasks(user, cursor=None, limit=50):
+    """アーカイブした完了済みタスクを、(完了日, ID) の新しい順に最大limit件、保存していないTaskで返す
+
+    cursor に (完了日, タスクID) を渡すと、それより前のものだけを返す。
+    アーカイブは最後の完了日の新しい順に読み、それ以上新しいタスクが無いとわかったところでやめる。
+    """
+    archives = TaskArchive.objects.filter(user=user, done_count__gt=0)
+    if cursor:
+        archives = archives.filter(first_done_at__lte=cursor[0])
+
+    tasks = []
+    for archive in archives.order_by('-last_done_at', '-month').iterator():
+        if len(tasks) >= limit and archive.last_done_at < tasks[-1].done_at:
+            break
+        for task_id, created_at, title, done_at, recurrence_id in unpack(archive)['tasks']:
+            if done_at is None or (cursor and (done_at, task_id) >= cursor):
+                continue
+            tasks.append(to_task(user, task_id, created_at, title, done_at, recurrence_id))
+        tasks.sort(key=lambda task: (task.done_at, task.id), reverse=True)
+        del tasks[limit:]
+    return tasks
+
+
+def set_contents(archive, tasks, comments):
+    """アーカイブの中身と、件数・完了日の範囲を設定する"""
+    done_dates = [done_at for _, _, _, done_at, _ in tasks if done_at is not None]
+    archive.data = pack(tasks, comments)
+    archive.task_count = len(tasks)
+    archive.done_count = len(done_dates)
+    archive.comment_count = len(comments)
+    archive.first_done_at = min(done_dates, default=None)
+    archive.last_done_at = max(done_dates, default=None)
+
+
+def archive_month(user, month):
+    """その月のタスク・メモをアーカイブにまとめて、task / comment の表から消す。アーカイブを返す
+
+    すでにアーカイブがある月にタスク・メモが残っていれば、アーカイブに足す。
+    """
+    start, end = month_range(month)
+    with transaction.atomic():
+        archive = TaskArchive.objects.select_for_update().filter(user=user, month=start).first()
+        tasks = Task.objects.filter(created_by=user, created_at__range=(start, end))
+        comments = Comment.objects.filter(created_by=user, created_at__range=(start, end))
+        task_rows = list(tasks.values_list('id', 'created_at', 'title', 'done_at', 'recurrence_id'))
+        comment_rows = list(comments.values_list('id', 'created_at', 'body'))
+        if not task_rows and not comment_rows:
+            return archive
+
+        versions = [
+            queryset.aggregate(version=Max('version'))['version'] or 0 for queryset in (tasks, comments)
+        ]
+        if archive is None:
+            archive = TaskArchive(user=user, month=start, version=max(versions))
+        else:
+            archive.version = max(archive.version, *versions)
+            data = unpack(archive)
+            task_rows += data['tasks']
+            # メモは1日1つまでなので、同じ日のメモは表に残っていた方を使う
+            written = {created_at for _, created_at, _ in comment_rows}
+            comment_rows += [row for row in data['comments'] if row[1] not in written]
+
+        task_rows.sort(key=lambda row: (row[1], row[0]))
+        comment_rows.sort(key=lambda row: row[1])
+        set_contents(archive, task_rows, comment_rows)
+        archive.save()
+
+        # 日ごとの集計はアーカイブの前後で変わらないので、数え直さない。検索用トークンはカスケードで消える
+        with summaries.skip_refresh(), sync.skip_tombstones():
+            tasks.delete()
+            comments.delete()
+
+    caches.invalidate_task_range(user.pk, start, end)
+    return archive
+
+
+def restore_month(user, day):
+    """dayを含む月のアーカイブを、元のIDのタスク・メモに戻す。戻した時はTrueを返す"""
+    start, end = month_range(day)
+    with transaction.atomic():
+        archive = TaskArchive.objects.select_for_update().filter(user=user, month=start).first()
+        if archive is None:
+            return False
+        data = unpack(archive)
+
+        # アーカイブした後に削除された繰り返しとは、つながないでおく
+        recurrence_ids = {row[4] for row in data['tasks'] if row[4] is not None}
+        if recurrence_ids:
+            recurrence_ids = set(
+                RecurringTask.objects.filter(created_by=user, pk__in=recurrence_ids).values_list('pk', flat=True)
+            )
+
+        Task.objects.bulk_create(
+            [
+                to_task(user, task_id, created_at, title, done_at,
+                        recurrence_id if recurrence_id in recurrence_ids else None, archive.version)
+                for task_id, created_at, title, done_at, recurrence_id in data['tasks']
+            ],
+            batch_size=1000,
+        )
+        Comment.objects.bulk_create(
+            [
+                Comment(id=comment_id, created_at=created_at, body=body, created_by=user, version=archive.version)
+                for comment_id, created_at, body in data['comments']
+            ],
+            batch_size=1000,
+        )
+        archive.delete()
+        # bulk_create ではシグナルが送られない。集計は変わらないので、検索用トークンだけ作り直す
+        search.rebuild_search_index(user, start, end)
+
+    caches.invalidate_task_range(user.pk, start, end)
+    return True
+
+
+def restore_days(user, days):
+    """days のうち、アーカイブした月の日があれば、その月を戻す（まとめて書き込む前に呼ぶ）"""
+    if not days:
+        return
+    months = {day.replace(day=1) for day in days}
+    for month in sorted(months & get_archived_months(user, min(days), max(days))):
+        restore_month(user, month)
+
+
+def get_archivable_months(user, cutoff):
+    """cutoffより前で、まだタスク・メモが表に残っている月(1日)のリスト"""
+    months = set(Task.objects.filter(created_by=user, created_at__lt=cutoff).dates('created_at', 'month'))
+    months |= set(Comment.objects.filter(created_by=user, created_at__lt=cutoff).dates('created_at', 'month'))
+    return sorted(months)
+
+
+def archive_user(user, cutoff=None):
+    """cutoff（省略時は get_cutoff()）より前の月を、1か月ずつアーカイブする。アーカイブのリストを返す"""
+    cutoff = cutoff or get_cutoff()
+    return [archive_month(user, month) for month in get_archivable_months(user, cutoff)]
@@ -0,0 +1,104 @@
+"""ASGIで動かす時の、日ごとの表示とタスクの完了切り替え
+
+settings.ASYNC_VIEWS が True の時に、urls.py から views.TopView / views.task_done の代わりに使う。
+Django 3.2 には非同期のORMが無いので、互いに関係しないクエリをそれぞれ sync_to_async で別のスレッド
+（別のDB接続）に渡し、asyncio.gather() で同時に待つ。書き込みは同期版と同じ関数を1つのスレッドで実行する。
+スレッドはプールで使い回すので、接続も CONN_MAX_AGE（product.py）の間はスレッドごとに使い回される。
+"""
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+from django.shortcuts import redirect, render
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+
+from . import daystatus
+from .models import Task, Comment
+from .views import (
+    TopView, get_consecutive_summary, get_page_validators, get_tasks_of_the_day, task_state_response, toggle_task,
+    wants_json,
+)
+
+
+def _run_query(func, *args):
+    try:
+        return func(*args)
+    finally:
+        # 使い終わったスレッドの接続は、CONN_MAX_AGE に従って閉じる
+        close_old_connections()
+
+
+async def run_query(func, *args):
+    """読み込みだけの処理を、他のクエリと同時に実行できるように別のスレッドで実行する"""
+    return await sync_to_async(_run_query, thread_sensitive=False)(func, *args)
+
+
+async def is_authenticated(request):
+    """request.user を（DBから読み込むので）スレッドで確定させてから、ログインしているかを返す"""
+    return await sync_to_async(lambda: request.user.is_authenticated)()
+
+
+async def day_view(request, **kwargs):
+    """TopViewの非同期版。カレンダー・連続記録・タスク・コメントを同時に読み込む
+
+    タスク・コメントの追加(POST)は、同期版の TopView にそのまま任せる。
+    """
+    if request.method != 'GET':
+        return await sync_to_async(TopView.as_view())(request, **kwargs)
+
+    if not await is_authenticated(request):
+        return await sync_to_async(render)(request, 'task/top_guest.html')
+
+    # 同期版の TopView と同じように、変わっていなければ304を返す
+    etag, last_modified = await sync_to_async(get_page_validators)(request)
+    if etag is not None:
+        etag, last_modified = quote_etag(etag), int(last_modified.timestamp())
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is not None:
+            patch_cache_control(response, private=True, no_cache=True)
+            return response
+
+    view = TopView()
+    view.setup(request, **kwargs)
+    the_day = view.get_the_day(view.kwargs)
+    view.setup_user(request.user)
+
+    calendar_context, consecutive, tasks, comment = await asyncio.gather(
+        run_query(view.get_month_calendar),
+        run_query(view.get_best_consecutive),
+        run_query(lambda: list(Task.objects.filter(created_by=request.user, created_at=the_day))),
+        run_query(lambda: Comment.objects.filter(created_by=request.user, created_at=the_day).first()),
+    )
+
+    archived = the_day.replace(day=1) in calendar_context.get('archived_months', ())
+    unmaterialized = the_day in calendar_context.get('recurring_days', ())
+    if archived or unmaterialized:
+        # アーカイブした月の日はアーカイブから読み、まだ作っていない繰り返しのタスクは作ってから読み直す
+        tasks, comment, archived = await sync_to_async(get_tasks_of_the_day)(
+            request.user, the_day, maybe_archived=archived, maybe_recurring=unmaterialized
+        )
+
+    context = view.get_day_context(the_day, tasks, comment, consecutive, calendar_context, archived=archived)
+    # テンプレートの描画は、ハンドラーがスレッドで行う
+    response = view.render_to_response(context)
+    if etag is not None:
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+async def task_done(request, task_id, status):
+    """views.task_done の非同期版。切り替えた後のその日の状態と連続記録を同時に読み込む"""
+    task, error = await sync_to_async(toggle_task)(request, task_id, status)
+    if error is not None:
+        return error
+    if not wants_json(request):
+        return redirect('task:top')
+
+    status_of_day, consecutive = await asyncio.gather(
+        run_query(daystatus.get_status_of_day, request.user, task.created_at),
+        run_query(get_consecutive_summary, request.user),
+    )
+    return task_state_response(request, task, status=status_of_day, consecutive=consecutive)
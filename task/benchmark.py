@@ -0,0 +1,265 @@
+"""DoneListの主なビューの負荷試験
+
+seed_loadコマンドで作ったユーザーでログインしたテストクライアントを複数のスレッドから同時に動かし、
+シナリオごとにレイテンシ(p50/p95/p99)・1秒あたりのリクエスト数・1リクエストあたりのクエリ数を測る。
+テストクライアントはWSGIハンドラーとミドルウェアをそのまま通るので、本番と同じ経路で処理される。
+ASGIモードでは AsyncClient を1つのイベントループから同時に動かし、ASGIハンドラーと非同期版のビュー
+（settings.ASYNC_VIEWS）を通す。クエリ数はどちらのモードも Server-Timing ヘッダーから読む。
+"""
+import asyncio
+import datetime
+import random
+import re
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connection
+from django.test import AsyncClient, Client
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from .models import Task
+
+
+class Scenario:
+    """負荷試験のシナリオ。make_request() で (メソッド, パス, ヘッダー) を返す"""
+    name = ''
+
+    def __init__(self, user, rng):
+        self.user = user
+        self.rng = rng
+
+    @classmethod
+    def can_run(cls, user):
+        """そのユーザーでこのシナリオを実行できるか（必要なデータがあるか）"""
+        return True
+
+    def make_request(self):
+        raise NotImplementedError
+
+
+class DayViewScenario(Scenario):
+    """過去1年のランダムな日を表示する"""
+    name = 'day_view'
+
+    def make_request(self):
+        day = datetime.date.today() - datetime.timedelta(days=self.rng.randrange(365))
+        return 'get', reverse('task:day', args=(day.year, day.month, day.day)), {}
+
+
+class MonthNavigationScenario(Scenario):
+    """前日・翌日のリンクで、同じ月の中を順番に移動する"""
+    name = 'month_navigation'
+
+    def __init__(self, user, rng):
+        super().__init__(user, rng)
+        self.day = datetime.date.today().replace(day=1)
+
+    def make_request(self):
+        self.day += datetime.timedelta(days=1)
+        if self.day > datetime.date.today():
+            self.day = datetime.date.today().replace(day=1)
+        return 'get', reverse('task:day', args=(self.day.year, self.day.month, self.day.day)), {}
+
+
+class PanelNavigationScenario(MonthNavigationScenario):
+    """前日・翌日のリンクで同じ月の中を移動する時の、その日の部分だけの読み込み（top.js と同じ）"""
+    name = 'panel_navigation'
+
+    def make_request(self):
+        # 移動する日は MonthNavigationScenario と同じように進める
+        super().make_request()
+        return 'get', reverse('task:day_panel', args=(self.day.year, self.day.month, self.day.day)), {
+            'HTTP_ACCEPT': 'application/json',
+        }
+
+
+class ToggleScenario(Scenario):
+    """最近のタスクの完了・未完了を切り替える"""
+    name = 'toggle'
+
+    def __init__(self, user, rng):
+        super().__init__(user, rng)
+        self.task_ids = list(self.get_tasks(user).values_list('id', flat=True))
+
+    @staticmethod
+    def get_tasks(user):
+        """切り替えるタスク（過去30日のもの）"""
+        since = datetime.date.today() - datetime.timedelta(days=30)
+        return Task.objects.filter(created_by=user, created_at__gte=since, created_at__lte=datetime.date.today())
+
+    @classmethod
+    def can_run(cls, user):
+        return cls.get_tasks(user).exists()
+
+    def make_request(self):
+        task_id = self.rng.choice(self.task_ids)
+        status = self.rng.choice(['true', 'false'])
+        return 'post', reverse('task:done', args=(task_id, status)), {'HTTP_ACCEPT': 'application/json'}
+
+
+class CompletedListScenario(Scenario):
+    """完了済みタスク一覧の最初のページを表示する"""
+    name = 'completed'
+
+    def make_request(self):
+        return 'get', reverse('task:completed'), {}
+
+
+SCENARIOS = {scenario.name: scenario for scenario in (
+    DayViewScenario, MonthNavigationScenario, PanelNavigationScenario, ToggleScenario, CompletedListScenario,
+)}
+
+
+def percentile(sorted_values, percent):
+    """ソート済みのリストから、最近傍順位法でパーセンタイルを返す"""
+    if not sorted_values:
+        return None
+    index = max(0, int(round(percent / 100 * len(sorted_values) + 0.5)) - 1)
+    return sorted_values[min(index, len(sorted_values) - 1)]
+
+
+def summarize(latencies, queries, errors, seconds):
+    """1シナリオ分の測定結果をまとめる。時間はミリ秒"""
+    latencies = sorted(latencies)
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'seconds': round(seconds, 3),
+        'requests_per_second': round(len(latencies) / seconds, 2) if seconds else None,
+        'latency_ms': {
+            'mean': round(statistics.mean(latencies), 2) if latencies else None,
+            'p50': round(percentile(latencies, 50), 2) if latencies else None,
+            'p95': round(percentile(latencies, 95), 2) if latencies else None,
+            'p99': round(percentile(latencies, 99), 2) if latencies else None,
+            'max': round(latencies[-1], 2) if latencies else None,
+        },
+        'queries_per_request': round(statistics.mean(queries), 2) if queries else None,
+    }
+
+
+def get_host():
+    """テストクライアントから送るHostヘッダー。ALLOWED_HOSTSで弾かれないものを選ぶ"""
+    for host in settings.ALLOWED_HOSTS:
+        if host not in ('*', '') and not host.startswith('.'):
+            return host
+    return 'testserver'
+
+
+def get_query_count(response):
+    """RequestMetricsMiddleware が付けた Server-Timing ヘッダーから、クエリ数を読む"""
+    match = re.search(r'"(\d+) queries"', response.get('Server-Timing', ''))
+    return int(match.group(1)) if match else 0
+
+
+def to_asgi_headers(headers):
+    """{'HTTP_ACCEPT': ...} の形のヘッダーを、AsyncClient に渡す {'accept': ...} の形にする"""
+    return {key[len('HTTP_'):].lower().replace('_', '-'): value for key, value in headers.items()}
+
+
+def run_scenario(scenario_class, users, concurrency, requests, seed):
+    """1つのシナリオを、concurrency個のスレッドから合計requests回実行する"""
+    lock = threading.Lock()
+    latencies, queries = [], []
+    errors = 0
+    counter = iter(range(requests))
+    host = get_host()
+
+    def worker(worker_index):
+        nonlocal errors
+        # スレッドごとにログイン済みのクライアントとシナリオを用意する
+        user = users[worker_index % len(users)]
+        client = Client(HTTP_HOST=host)
+        client.force_login(user)
+        scenario = scenario_class(user, random.Random(f'{seed}-{worker_index}'))
+
+        try:
+            while True:
+                with lock:
+                    if next(counter, None) is None:
+                        return
+                method, path, headers = scenario.make_request()
+
+                started = time.perf_counter()
+                response = getattr(client, method)(path, **headers)
+                elapsed = (time.perf_counter() - started) * 1000
+
+                with lock:
+                    if response.status_code >= 400:
+                        errors += 1
+                    else:
+                        latencies.append(elapsed)
+                        queries.append(get_query_count(response))
+        finally:
+            connection.close()
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(worker, range(concurrency)))
+    seconds = time.perf_counter() - started
+
+    return summarize(latencies, queries, errors, seconds)
+
+
+def run_scenario_asgi(scenario_class, users, concurrency, requests, seed):
+    """1つのシナリオを、1つのイベントループ上のconcurrency個のAsyncClientから合計requests回実行する"""
+    latencies, queries = [], []
+    errors = 0
+    remaining = requests
+
+    # ログインとシナリオの準備はDBを使うので、イベントループの外で済ませておく
+    workers = []
+    for worker_index in range(concurrency):
+        user = users[worker_index % len(users)]
+        client = AsyncClient()
+        client.force_login(user)
+        workers.append((client, scenario_class(user, random.Random(f'{seed}-{worker_index}'))))
+
+    async def worker(client, scenario):
+        nonlocal errors, remaining
+        while remaining > 0:
+            remaining -= 1
+            method, path, headers = scenario.make_request()
+
+            started = time.perf_counter()
+            response = await getattr(client, method)(path, **to_asgi_headers(headers))
+            elapsed = (time.perf_counter() - started) * 1000
+
+            if response.status_code >= 400:
+                errors += 1
+            else:
+                latencies.append(elapsed)
+                queries.append(get_query_count(response))
+
+    async def main():
+        await asyncio.gather(*(worker(client, scenario) for client, scenario in workers))
+
+    # AsyncClient は Host ヘッダーを testserver にするので、計測中だけ許可する
+    with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+        started = time.perf_counter()
+        asyncio.run(main())
+        seconds = time.perf_counter() - started
+
+    return summarize(latencies, queries, errors, seconds)
+
+
+def run_benchmark(users, scenario_names, concurrency, requests, seed, mode='wsgi'):
+    """指定したシナリオを順番に実行して、シナリオ名ごとの結果を返す"""
+    run = run_scenario_asgi if mode == 'asgi' else run_scenario
+    return {
+        name: run(SCENARIOS[name], users, concurrency, requests, seed)
+        for name in scenario_names
+    }
+
+
+def compare_reports(base, current):
+    """2つの結果(JSON)を比べて、シナリオごとの (名前, 基準, 今回) のリストを返す"""
+    rows = []
+    for name, result in current['scenarios'].items():
+        before = base['scenarios'].get(name)
+        if before is not None:
+            rows.append((name, before, result))
+    return rows
@@ -0,0 +1,247 @@
+"""タスク関連のキャッシュ
+
+月間カレンダーの情報を、ユーザー・年月・週の始まり(first_weekday)ごとにキャッシュする。
+年間ヒートマップはユーザー・年ごとに、統計はユーザーごとにキャッシュする。
+タスクやコメントが変更された時は、その日を含むものだけを signals.py から invalidate_task_days() で無効化する。
+書き込みがトランザクションの中なら、コミット後にもう一度削除する（コミット前の内容で作り直されたキャッシュを残さない）。
+また、ユーザーのデータが最後に変わった時刻(watermark)を持ち、ページのETag・Last-Modifiedに使う。
+繰り返しのタスクを変えた時は、ユーザーの月間カレンダーをすべて作り直させるため、繰り返しの版を更新する。
+Djangoのキャッシュフレームワークを使うので、ローカルメモリ・ファイルベースどちらのバックエンドでも動く。
+"""
+import calendar
+import datetime
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+CALENDAR_TIMEOUT = getattr(settings, 'TASK_CALENDAR_CACHE_TIMEOUT', 60 * 60 * 24)
+
+CALENDAR_HITS_KEY = 'task:calendar:hits'
+CALENDAR_MISSES_KEY = 'task:calendar:misses'
+
+
+def to_date(value):
+    """DateFieldの値をdateにそろえる
+
+    created_at のデフォルトは timezone.now なので、保存直後のインスタンスでは datetime のままになっている
+    """
+    if isinstance(value, datetime.datetime):
+        if timezone.is_aware(value):
+            value = timezone.localtime(value)
+        return value.date()
+    return value
+
+
+def calendar_key(user_id, year, month, first_weekday):
+    return f'task:calendar:{user_id}:{year}-{month}:{first_weekday}'
+
+
+def heatmap_key(user_id, year):
+    return f'task:heatmap:{user_id}:{year}'
+
+
+def stats_key(user_id):
+    return f'task:stats:{user_id}'
+
+
+def watermark_key(user_id):
+    return f'task:watermark:{user_id}'
+
+
+def recurring_version_key(user_id):
+    return f'task:recurring:{user_id}'
+
+
+def _get_version(key, value=None):
+    """キャッシュにある版(time.time()の値)を返す。消えていた場合は今の時刻にする
+
+    value に cache.get() 済みの値を渡すと、それを使う。
+    """
+    if value is None:
+        value = cache.get(key)
+    if value is None:
+        value = time.time()
+        if not cache.add(key, value, None):
+            # 同時に他のリクエストが作っていたら、そちらに合わせる
+            value = cache.get(key, value)
+    return value
+
+
+def get_watermark(user_id):
+    """ユーザーのタスク・メモ・プロフィールが最後に変わった時刻(time.time()の値)を返す
+
+    キャッシュから消えていた場合は今の時刻にする（ページのETagが変わるだけなので問題ない）。
+    """
+    return _get_version(watermark_key(user_id))
+
+
+def touch_watermark(user_id):
+    """ユーザーのタスク・メモ・プロフィールが変わったことを記録する
+
+    トランザクションの途中で読まれた古い内容に新しいETagが付かないように、コミット後にもう一度更新する。
+    """
+    key = watermark_key(user_id)
+    cache.set(key, time.time(), None)
+    transaction.on_commit(lambda: cache.set(key, time.time(), None))
+
+
+def touch_recurring(user_id):
+    """繰り返しのタスクを追加・停止したことを記録する。キャッシュした月間カレンダーはすべて作り直される"""
+    cache.set(recurring_version_key(user_id), time.time(), None)
+    touch_watermark(user_id)
+
+
+def _count(key):
+    """ヒット・ミスのカウンターを1増やす"""
+    try:
+        cache.incr(key)
+    except ValueError:
+        # まだカウンターが無い（または追い出された）場合
+        cache.add(key, 1, None)
+
+
+def get_month_calendar(user_id, month, first_weekday, build):
+    """キャッシュ済みの月間カレンダー情報を返す。無ければ build() で作ってキャッシュする
+
+    繰り返しのタスクはどの月にも表示されうるので、繰り返しの版が変わっていたら作り直す。
+    """
+    key = calendar_key(user_id, month.year, month.month, first_weekday)
+    version_key = recurring_version_key(user_id)
+    values = cache.get_many([key, version_key])
+    version = _get_version(version_key, values.get(version_key))
+
+    calendar_data = values.get(key)
+    if calendar_data is None or calendar_data.get('recurring_version') != version:
+        _count(CALENDAR_MISSES_KEY)
+        calendar_data = build()
+        calendar_data['recurring_version'] = version
+        cache.set(key, calendar_data, CALENDAR_TIMEOUT)
+    else:
+        _count(CALENDAR_HITS_KEY)
+    return calendar_data
+
+
+def get_year_heatmap(user_id, year, build):
+    """キャッシュ済みの年間ヒートマップの集計を返す。無ければ build() で作ってキャッシュする"""
+    key = heatmap_key(user_id, year)
+    heatmap_data = cache.get(key)
+    if heatmap_data is None:
+        heatmap_data = build()
+        cache.set(key, heatmap_data, CALENDAR_TIMEOUT)
+    return heatmap_data
+
+
+def get_stats(user_id, build):
+    """キャッシュ済みの統計を返す。無いか、作った日が今日でなければ build() で作ってキャッシュする
+
+    統計は「直近〇週間」のように今日を基準にするので、日付が変わったら作り直す。
+    """
+    key = stats_key(user_id)
+    stats = cache.get(key)
+    if stats is None or stats['today'] != datetime.date.today():
+        stats = build()
+        cache.set(key, stats, CALENDAR_TIMEOUT)
+    return stats
+
+
+def get_calendar_cache_stats():
+    """月間カレンダーキャッシュのヒット数・ミス数・ヒット率を返す"""
+    hits = cache.get(CALENDAR_HITS_KEY, 0)
+    misses = cache.get(CALENDAR_MISSES_KEY, 0)
+    total = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': hits / total if total else None,
+    }
+
+
+def reset_calendar_cache_stats():
+    cache.delete_many([CALENDAR_HITS_KEY, CALENDAR_MISSES_KEY])
+
+
+def get_calendar_months(day):
+    """dayがカレンダー上に表示される (年月, first_weekday) のリストを返す
+
+    カレンダーは前後の月の日も表示するので、月初・月末の日は前月・翌月のカレンダーにも含まれる。
+    """
+    this_month = day.replace(day=1)
+    previous_month = (this_month - datetime.timedelta(days=1)).replace(day=1)
+    next_month = (this_month + datetime.timedelta(days=31)).replace(day=1)
+
+    result = []
+    for first_weekday in range(7):
+        month_calendar = calendar.Calendar(first_weekday)
+        for month in (previous_month, this_month, next_month):
+            month_days = month_calendar.monthdatescalendar(month.year, month.month)
+            if month_days[0][0] <= day <= month_days[-1][-1]:
+                result.append((month, first_weekday))
+    return result
+
+
+def _delete_keys(keys):
+    """キャッシュを削除する。トランザクションの中なら、コミット後にもう一度削除する
+
+    コミットまでの間に他のリクエストが（まだ古い）データベースから作り直したキャッシュを、
+    タイムアウト(CALENDAR_TIMEOUT)まで残さないため。
+    """
+    keys = list(keys)
+    cache.delete_many(keys)
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def month_calendar_keys(user_id, *days):
+    """daysを含む月間カレンダーのキーを返す"""
+    return {
+        calendar_key(user_id, month.year, month.month, first_weekday)
+        for day in days
+        for month, first_weekday in get_calendar_months(to_date(day))
+    }
+
+
+def invalidate_month_calendar(user_id, *days):
+    """daysを含む月間カレンダーのキャッシュを削除する"""
+    _delete_keys(month_calendar_keys(user_id, *days))
+
+
+def invalidate_task_days(user_id, *days):
+    """daysのタスク・メモが変わった時に、その日を含む月間カレンダー・ヒートマップと、統計のキャッシュを削除する
+
+    ユーザーの watermark も更新する。
+    """
+    keys = month_calendar_keys(user_id, *days)
+    keys |= {heatmap_key(user_id, to_date(day).year) for day in days}
+    keys.add(stats_key(user_id))
+    _delete_keys(keys)
+    touch_watermark(user_id)
+
+
+def month_calendars_keys(user_id, start, end):
+    """start〜endの日を含む、すべての月間カレンダーのキーを返す"""
+    # 前後の月のカレンダーにも start / end の日が表示されるので、1か月ずつ広げる
+    month = (to_date(start).replace(day=1) - datetime.timedelta(days=1)).replace(day=1)
+    last_month = (to_date(end).replace(day=1) + datetime.timedelta(days=31)).replace(day=1)
+
+    keys = []
+    while month <= last_month:
+        keys += [calendar_key(user_id, month.year, month.month, first_weekday) for first_weekday in range(7)]
+        month = (month + datetime.timedelta(days=31)).replace(day=1)
+    return keys
+
+
+def invalidate_month_calendars(user_id, start, end):
+    """start〜endの日を含む、すべての月間カレンダーのキャッシュを削除する"""
+    _delete_keys(month_calendars_keys(user_id, start, end))
+
+
+def invalidate_task_range(user_id, start, end):
+    """start〜endのタスク・メモをまとめて変えた時に、関係するキャッシュをすべて削除し、watermark も更新する（一括インポートなど用）"""
+    keys = month_calendars_keys(user_id, start, end)
+    keys += [heatmap_key(user_id, year) for year in range(to_date(start).year, to_date(end).year + 1)]
+    keys.append(stats_key(user_id))
+    _delete_keys(keys)
+    touch_watermark(user_id)
@@ -0,0 +1,195 @@
+"""タスクの連続完了記録(ConsecutiveRecord)の計算と更新
+
+「連続完了日」は、タスクが1つ以上あって、その日のタスクがすべて完了している日が
+途切れずに続いている期間のこと。
+
+ページを表示するたびに全履歴を集計しなくていいように、ある日が「すべて完了した日」になった・
+ではなくなった時に（summaries.py から呼ばれる）、変更があった日の周辺だけを調べて
+ConsecutiveRecord を差分更新する。
+差分で追えない変更（最高記録の期間が途切れた場合など）の時だけ全履歴から作り直す。
+
+どの日がすべて完了しているかは、タスクを数えずに日ごとの集計(DailySummary)から読む。
+"""
+import datetime
+
+from django.db.models import F
+
+from .models import ConsecutiveRecord, DailySummary
+
+ONE_DAY = datetime.timedelta(days=1)
+
+# 連続期間の端を探す時に、一度のクエリで調べる日数
+SCAN_DAYS = 31
+
+
+def done_dates_queryset(user, **lookup):
+    """すべてのタスクが完了している日付だけを返すクエリセット"""
+    return (
+        DailySummary.objects.filter(user=user, total__gt=0, done=F('total'), **lookup)
+            .values_list('date', flat=True)
+    )
+
+
+def get_done_dates(user, start, end):
+    """start〜endの間で、すべてのタスクが完了している日のsetを返す"""
+    return set(done_dates_queryset(user, date__range=(start, end)))
+
+
+def compute_consecutive_days(user):
+    """全履歴から連続したタスク完了期間を計算する
+
+    日ごとの集計からタスクが連続して完了している日を算出する。
+    差分更新ができない時と、rebuild_consecutive_recordsコマンドから使う。
+
+    Returns:
+        list[dict]
+    """
+
+    # すべてのタスクが完了している日だけを、日付順に取得
+    sorted_dates = list(done_dates_queryset(user).order_by('date'))
+
+    result = []
+    cur_dic = None
+    for i, cur_date in enumerate(sorted_dates):
+        if i == 0:
+            cur_dic = dict(
+                start_date=cur_date,
+                end_date=cur_date,
+                continuous_days=1
+            )
+            continue
+        if cur_date - ONE_DAY == sorted_dates[i - 1]:
+            # 連続
+            cur_dic['end_date'] = cur_date
+            cur_dic['continuous_days'] += 1
+        else:
+            # 途切れた
+            result.append(cur_dic)
+            cur_dic = dict(
+                start_date=cur_date,
+                end_date=cur_date,
+                continuous_days=1
+            )
+    # 最後のcur_dicを追加
+    result.append(cur_dic)
+
+    return result
+
+
+def rebuild_consecutive_record(user):
+    """全履歴から連続記録を作り直して保存する"""
+    record, _ = ConsecutiveRecord.objects.get_or_create(user=user)
+    record.latest_start = record.latest_end = None
+    record.best_start = record.best_end = None
+    record.best_days = 0
+
+    consecutive_days = compute_consecutive_days(user)
+
+    # タスクがない場合は空の記録にする
+    if consecutive_days != [None]:
+        latest = consecutive_days[-1]
+        record.latest_start, record.latest_end = latest['start_date'], latest['end_date']
+
+        best = max(consecutive_days, key=lambda day: day['continuous_days'])
+        record.best_start, record.best_end = best['start_date'], best['end_date']
+        record.best_days = best['continuous_days']
+
+    record.save()
+    return record
+
+
+def get_consecutive_record(user):
+    """ユーザーの連続記録を返す。まだ無ければ全履歴から作る"""
+    try:
+        return ConsecutiveRecord.objects.get(user=user)
+    except ConsecutiveRecord.DoesNotExist:
+        return rebuild_consecutive_record(user)
+
+
+def summarize_consecutive_record(record):
+    """連続記録から、最高継続記録と現在継続中の記録を返す
+
+    Returns:
+        dict: タスクを完了した日が無い場合はNone
+    """
+    today = datetime.date.today()
+
+    # タスクがない場合は処理から抜ける
+    if not record.best_days:
+        return
+
+    # 最新の連続記録が、昨日・今日まで続いてたら現在継続中にする
+    cur_con_last = record.latest_end
+    if cur_con_last == today - ONE_DAY or cur_con_last == today:
+        current_consecutive_day = record.latest_days
+    else:
+        current_consecutive_day = 0
+
+    return {
+        'current_consecutive_day': current_consecutive_day,
+        'most_consecutive_day': record.best_days
+    }
+
+
+def _scan(user, day, step):
+    """dayから step(±1日) の方向に、完了日が途切れる直前の日を返す"""
+    last = day
+    while True:
+        if step < ONE_DAY:
+            chunk = (last - SCAN_DAYS * ONE_DAY, last - ONE_DAY)
+        else:
+            chunk = (last + ONE_DAY, last + SCAN_DAYS * ONE_DAY)
+        done_dates = get_done_dates(user, *chunk)
+
+        for _ in range(SCAN_DAYS):
+            if last + step not in done_dates:
+                return last
+            last += step
+
+
+def get_consecutive_range(user, day):
+    """dayを含む連続完了期間の (開始日, 最終日) を返す"""
+    return _scan(user, day, -ONE_DAY), _scan(user, day, ONE_DAY)
+
+
+def update_consecutive_record(user, day):
+    """dayが「すべて完了した日」になった・ではなくなった後に、連続記録を差分更新する
+
+    変更があった日の周辺だけを調べるので、履歴の長さに関係なく数クエリで終わる。
+    """
+    try:
+        record = ConsecutiveRecord.objects.get(user=user)
+    except ConsecutiveRecord.DoesNotExist:
+        return rebuild_consecutive_record(user)
+
+    if day in get_done_dates(user, day, day):
+        # dayが完了日になった場合は、dayを含む連続期間が伸びる（前後の期間がつながることもある）
+        start, end = get_consecutive_range(user, day)
+        days = (end - start).days + 1
+
+        if record.latest_end is None or end >= record.latest_end:
+            record.latest_start, record.latest_end = start, end
+        if days > record.best_days:
+            record.best_start, record.best_end, record.best_days = start, end, days
+
+    else:
+        # 最高記録が途切れた場合は、他の期間が最高記録になるかもしれないので作り直す
+        if record.in_best(day):
+            return rebuild_consecutive_record(user)
+
+        if record.in_latest(day):
+            if day < record.latest_end:
+                # dayより後ろが最新の連続期間として残る
+                record.latest_start = day + ONE_DAY
+            elif day > record.latest_start:
+                record.latest_end = day - ONE_DAY
+            else:
+                # 最新の連続期間が無くなったので、ひとつ前の連続期間を探す
+                last_done = done_dates_queryset(user, date__lt=day).order_by('-date').first()
+                if last_done is None:
+                    record.latest_start = record.latest_end = None
+                else:
+                    record.latest_start, record.latest_end = get_consecutive_range(user, last_done)
+
+    record.save()
+    return record
@@ -0,0 +1,60 @@
+"""カレンダーに表示する、1日分の状態
+
+その日のタスクの有無・すべて完了しているか・メモの有無を、ビットフラグの整数1つで表す。
+テンプレートでは task_tags の has_task / all_done / has_comment フィルタで判定する。
+"""
+from .models import DailySummary
+
+HAS_TASK = 1     # タスクがある
+ALL_DONE = 2     # タスクがあり、すべて完了している
+HAS_COMMENT = 4  # メモがある
+
+# 年間ヒートマップに表示する、その日の完了度
+LEVEL_NONE = 0      # タスクが無い
+LEVEL_NOT_DONE = 1  # 1つも完了していない
+LEVEL_SOME = 2      # 半分未満が完了
+LEVEL_MOST = 3      # 半分以上が完了
+LEVEL_ALL = 4       # すべて完了
+LEVEL_LABELS = ['タスクなし', '未完了', '一部完了', '半分以上完了', 'すべて完了']
+
+
+def get_day_status(total, done, has_comment):
+    """その日のタスク数・完了数・メモの有無から状態を返す"""
+    status = 0
+    if total:
+        status |= HAS_TASK
+        if done == total:
+            status |= ALL_DONE
+    if has_comment:
+        status |= HAS_COMMENT
+    return status
+
+
+def get_completion_level(total, done):
+    """その日のタスク数・完了数から、ヒートマップの完了度(LEVEL_*)を返す"""
+    if not total:
+        return LEVEL_NONE
+    if done == total:
+        return LEVEL_ALL
+    if not done:
+        return LEVEL_NOT_DONE
+    return LEVEL_MOST if done * 2 >= total else LEVEL_SOME
+
+
+def get_status_of_day(user, day):
+    """日ごとの集計からその日の状態を返す（カレンダーの1マスだけ更新したい時用）"""
+    summary = DailySummary.objects.filter(user=user, date=day).first()
+    if summary is None:
+        return 0
+    return get_day_status(summary.total, summary.done, summary.has_comment)
+
+
+def status_to_dict(day, status):
+    """JSONで返すための辞書にする"""
+    return {
+        'date': day.isoformat(),
+        'status': status,
+        'has_task': bool(status & HAS_TASK),
+        'all_done': bool(status & ALL_DONE),
+        'has_comment': bool(status & HAS_COMMENT),
+    }
@@ -0,0 +1,122 @@
+"""タスク・メモの履歴のエクスポート
+
+StreamingHttpResponse に渡すジェネレーターを作る。クエリは QuerySet.iterator(chunk_size=...) で
+少しずつ読み出すので、履歴がどれだけ長くてもサーバーのメモリ使用量は一定になる。
+アーカイブした月(archives.py)のタスク・メモも、1か月分ずつ展開して日付順に混ぜる。
+
+1行が1つのタスクかメモで、列は次のとおり（インポートも同じ形式を読む）
+
+    type     'task' か 'comment'
+    date     作成日 (YYYY-MM-DD)
+    text     タスクのタイトル / メモの本文
+    done_at  タスクの完了日（未完了・メモの場合は空）
+"""
+import csv
+import heapq
+import json
+import zlib
+
+from . import archives
+from .models import Task, Comment
+
+FIELDS = ('type', 'date', 'text', 'done_at')
+
+# iterator() で一度にDBから読み出す件数
+CHUNK_SIZE = 2000
+
+# gzipで圧縮する時に、これだけ溜まったら送り出す
+GZIP_FLUSH_SIZE = 64 * 1024
+
+
+def iter_records(user, start=None, end=None):
+    """ユーザーのタスク・メモを、FIELDSの順のタプルで1件ずつ返す"""
+    lookup = {'created_by': user}
+    if start:
+        lookup['created_at__gte'] = start
+    if end:
+        lookup['created_at__lte'] = end
+
+    def in_range(day):
+        return (not start or day >= start) and (not end or day <= end)
+
+    tasks = (
+        Task.objects.filter(**lookup)
+            .order_by('created_at', 'id')
+            .values_list('created_at', 'id', 'title', 'done_at')
+    )
+    archived_tasks = (
+        (created_at, task_id, title, done_at)
+        for data in archives.iter_archived(user, start, end)
+        for task_id, created_at, title, done_at, _ in data['tasks']
+        if in_range(created_at)
+    )
+    for created_at, _, title, done_at in heapq.merge(tasks.iterator(chunk_size=CHUNK_SIZE), archived_tasks):
+        yield 'task', created_at.isoformat(), title, done_at.isoformat() if done_at else ''
+
+    comments = (
+        Comment.objects.filter(**lookup)
+            .order_by('created_at')
+            .values_list('created_at', 'body')
+    )
+    archived_comments = (
+        (created_at, body)
+        for data in archives.iter_archived(user, start, end)
+        for _, created_at, body in data['comments']
+        if in_range(created_at)
+    )
+    for created_at, body in heapq.merge(comments.iterator(chunk_size=CHUNK_SIZE), archived_comments):
+        yield 'comment', created_at.isoformat(), body, ''
+
+
+class Echo:
+    """csv.writerの書き込み先。書き込まれた文字列をそのまま返す"""
+
+    def write(self, value):
+        return value
+
+
+def iter_csv(records):
+    writer = csv.writer(Echo())
+    yield writer.writerow(FIELDS)
+    for record in records:
+        yield writer.writerow(record)
+
+
+def iter_jsonl(records):
+    for record in records:
+        yield json.dumps(dict(zip(FIELDS, record)), ensure_ascii=False) + '\n'
+
+
+def iter_gzip(lines):
+    """文字列のイテレーターを、gzip形式のバイト列に圧縮しながら返す"""
+    compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS)
+    buffer = []
+    size = 0
+    for line in lines:
+        data = compressor.compress(line.encode())
+        if data:
+            buffer.append(data)
+            size += len(data)
+        if size >= GZIP_FLUSH_SIZE:
+            yield b''.join(buffer)
+            buffer = []
+            size = 0
+    buffer.append(compressor.flush())
+    yield b''.join(buffer)
+
+
+def export_stream(user, export_format, start=None, end=None, gzip=False):
+    """エクスポートするデータのイテレーターを返す
+
+    Args:
+        export_format: 'csv' か 'jsonl'
+    """
+    records = iter_records(user, start, end)
+    if export_format == 'csv':
+        lines = iter_csv(records)
+    else:
+        lines = iter_jsonl(records)
+
+    if gzip:
+        return iter_gzip(lines)
+    return (line.encode() for line in lines)
@@ -1,16 +1,61 @@
 from django import forms
-from .models import Task, Comment
+from .imports import guess_format
+from .models import Task, Comment, RecurringTask
 
 
 class AddTaskForm(forms.ModelForm):
+    # 繰り返す場合は、タスクの代わりに繰り返し(RecurringTask)を追加する
+    repeat = forms.ChoiceField(
+        label='繰り返し', choices=[('', '繰り返さない')] + RecurringTask.RULE_CHOICES, required=False
+    )
+    interval = forms.IntegerField(label='間隔（日）', min_value=2, max_value=365, required=False)
 
     class Meta:
         model = Task
         fields = ('title',)
 
+    def clean(self):
+        cleaned_data = super().clean()
+        if cleaned_data.get('repeat') == RecurringTask.INTERVAL and not cleaned_data.get('interval'):
+            self.add_error('interval', '何日ごとに繰り返すかを入力してください')
+        return cleaned_data
+
 
 class AddCommentForm(forms.ModelForm):
 
     class Meta:
         model = Comment
-        fields = ('body',)
\ No newline at end of file
+        fields = ('body',)
+
+
+class ExportForm(forms.Form):
+    format = forms.ChoiceField(label='形式', choices=(('csv', 'CSV'), ('jsonl', 'JSON Lines')), initial='csv')
+    start = forms.DateField(label='開始日', required=False, widget=forms.DateInput(attrs={'type': 'date'}))
+    end = forms.DateField(label='終了日', required=False, widget=forms.DateInput(attrs={'type': 'date'}))
+    gzip = forms.BooleanField(label='gzipで圧縮する', required=False)
+
+    def clean(self):
+        cleaned_data = super().clean()
+        start, end = cleaned_data.get('start'), cleaned_data.get('end')
+        if start and end and start > end:
+            raise forms.ValidationError('開始日は終了日より前にしてください')
+        return cleaned_data
+
+
+
+class ImportForm(forms.Form):
+    file = forms.FileField(label='ファイル', help_text='エクスポートしたものと同じ形式のCSV / JSON Lines（gzip圧縮も可）')
+    format = forms.ChoiceField(
+        label='形式',
+        choices=(('', 'ファイル名から判断する'), ('csv', 'CSV'), ('jsonl', 'JSON Lines')),
+        required=False,
+    )
+
+    def clean(self):
+        cleaned_data = super().clean()
+        uploaded = cleaned_data.get('file')
+        if uploaded and not cleaned_data.get('format'):
+            cleaned_data['format'] = guess_format(uploaded.name)
+            if cleaned_data['format'] is None:
+                raise forms.ValidationError('ファイルの形式を選んでください')
+        return cleaned_data
@@ -0,0 +1,217 @@
+"""タスク・メモの一括インポート
+
+exports.py と同じ形式（type, date, text, done_at の列を持つCSV / JSON Lines）を読み込む。
+ファイルは1行ずつ読みながら検証し、BATCH_SIZE件ごとに bulk_create してトランザクションを区切るので、
+何年分の履歴でもメモリを使い切らずに取り込める。
+
+bulk_create ではシグナルが送られないので、連続記録・カレンダーのキャッシュは最後にまとめて作り直す。
+"""
+import csv
+import datetime
+import gzip
+import io
+import json
+import time
+import zlib
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+
+from . import archives, caches, sync
+from .consecutive import rebuild_consecutive_record
+from .exports import FIELDS
+from .models import Task, Comment
+from .search import rebuild_search_index
+from .summaries import rebuild_daily_summaries
+
+BATCH_SIZE = 1000
+
+# 結果として保持するエラーの最大件数
+MAX_ERRORS = 100
+
+GZIP_MAGIC = b'\x1f\x8b'
+
+
+def guess_format(filename):
+    """ファイル名から 'csv' か 'jsonl' を返す。わからなければNone"""
+    name = filename.lower()
+    if name.endswith('.gz'):
+        name = name[:-3]
+    if name.endswith('.csv'):
+        return 'csv'
+    if name.endswith(('.jsonl', '.ndjson', '.json')):
+        return 'jsonl'
+    return None
+
+
+def open_text(fileobj):
+    """バイナリのファイルオブジェクトをテキストとして開く。gzipなら展開しながら読む"""
+    if fileobj.read(2) == GZIP_MAGIC:
+        fileobj.seek(0)
+        fileobj = gzip.GzipFile(fileobj=fileobj)
+    else:
+        fileobj.seek(0)
+    # Excelで保存したCSVのBOMを読み飛ばすため utf-8-sig にする
+    return io.TextIOWrapper(fileobj, encoding='utf-8-sig', newline='')
+
+
+def iter_rows(text, import_format):
+    """(行番号, 行の辞書, エラー) を1行ずつ返す。読み込めない行は、行の辞書をNoneにしてエラーを返す"""
+    if import_format == 'csv':
+        reader = csv.DictReader(text)
+        for row in reader:
+            yield reader.line_num, row, None
+    else:
+        for line_num, line in enumerate(text, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                yield line_num, None, ValidationError('JSONとして読み込めません')
+                continue
+            if not isinstance(row, dict):
+                yield line_num, None, ValidationError('JSONのオブジェクトではありません')
+                continue
+            yield line_num, row, None
+
+
+def parse_date(value):
+    if not value:
+        return None
+    try:
+        return datetime.date.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise ValidationError(f'日付の形式が正しくありません: {value}')
+
+
+def build_object(user, row):
+    """1行分の辞書から、保存前のTaskかCommentを作って検証する"""
+    missing = [field for field in FIELDS[:3] if field not in row]
+    if missing:
+        raise ValidationError(f"列がありません: {', '.join(missing)}")
+
+    created_at = parse_date(row['date'])
+    if created_at is None:
+        raise ValidationError('date が空です')
+
+    if row['type'] == 'task':
+        obj = Task(
+            title=row['text'],
+            created_at=created_at,
+            done_at=parse_date(row.get('done_at')),
+            created_by=user,
+        )
+    elif row['type'] == 'comment':
+        obj = Comment(body=row['text'], created_at=created_at, created_by=user)
+    else:
+        raise ValidationError(f"type は task か comment にしてください: {row['type']}")
+
+    # モデルのフィールドの制約（最大文字数・必須など）で検証する
+    obj.clean_fields(exclude=['created_by'])
+    return obj
+
+
+def _save_batch(user, tasks, comments):
+    """タスクと (行番号, メモ) のリストを保存する。メモがすでにある日のメモの行番号のリストを返す"""
+    with transaction.atomic():
+        # アーカイブした月に取り込む時は、先に戻しておく（すでにある日のメモを取り込まないように）
+        archives.restore_days(user, [obj.created_at for obj in (*tasks, *(obj for _, obj in comments))])
+
+        # メモは1日1つまでなので、すでにある日（とファイルの中で2つ目以降）のメモは取り込まない
+        written = set(
+            Comment.objects.filter(created_by=user, created_at__in={obj.created_at for _, obj in comments})
+                .values_list('created_at', flat=True)
+        )
+        new_comments, duplicates = [], []
+        for line_num, obj in comments:
+            if obj.created_at in written:
+                duplicates.append(line_num)
+            else:
+                written.add(obj.created_at)
+                new_comments.append(obj)
+
+        sync.assign_versions([*tasks, *new_comments])
+        Task.objects.bulk_create(tasks)
+        # 同時に書き込まれたメモとぶつかった場合も、エラーにはしない
+        Comment.objects.bulk_create(new_comments, ignore_conflicts=True)
+    return duplicates
+
+
+def import_records(user, fileobj, import_format, batch_size=BATCH_SIZE):
+    """ファイルからタスク・メモを取り込む
+
+    Args:
+        fileobj: バイナリモードで開いたファイルオブジェクト（gzip圧縮されていてもよい）
+        import_format: 'csv' か 'jsonl'
+
+    Returns:
+        dict: 取り込んだ件数・エラー・処理時間
+    """
+    started = time.monotonic()
+    result = {'tasks': 0, 'comments': 0, 'skipped': 0, 'errors': []}
+    tasks, comments = [], []
+    # 書き込んだバッチの日付の範囲（派生データを作り直す範囲）
+    first_date = last_date = None
+
+    def add_error(line_num, error):
+        result['skipped'] += 1
+        if len(result['errors']) < MAX_ERRORS:
+            result['errors'].append(f"{line_num}行目: {'; '.join(error.messages)}")
+
+    def save_batch():
+        nonlocal first_date, last_date
+        duplicates = _save_batch(user, tasks, comments)
+        dates = [obj.created_at for obj in tasks] + [obj.created_at for _, obj in comments]
+        first_date = min(dates) if first_date is None else min(first_date, *dates)
+        last_date = max(dates) if last_date is None else max(last_date, *dates)
+        result['tasks'] += len(tasks)
+        result['comments'] += len(comments) - len(duplicates)
+        for line_num in duplicates:
+            add_error(line_num, ValidationError('その日のメモはすでにあります'))
+
+    try:
+        rows = iter_rows(open_text(fileobj), import_format)
+        while True:
+            try:
+                line_num, row, error = next(rows)
+            except StopIteration:
+                break
+            except (csv.Error, UnicodeDecodeError, OSError, EOFError, zlib.error) as e:
+                # ファイル自体が読めない場合（壊れた・途中で切れたgzipも）はそこで終わる
+                add_error('-', ValidationError(str(e)))
+                break
+
+            if error is not None:
+                add_error(line_num, error)
+                continue
+            try:
+                obj = build_object(user, row)
+            except ValidationError as e:
+                add_error(line_num, e)
+                continue
+
+            if isinstance(obj, Task):
+                tasks.append(obj)
+            else:
+                comments.append((line_num, obj))
+
+            if len(tasks) + len(comments) >= batch_size:
+                save_batch()
+                tasks, comments = [], []
+
+        if tasks or comments:
+            save_batch()
+    finally:
+        # 行ごとには更新していない派生データを、最後に1回だけ作り直す。
+        # 途中で失敗しても、それまでのバッチはコミットされているので作り直す
+        if first_date is not None:
+            rebuild_daily_summaries(user, first_date, last_date)
+            rebuild_search_index(user, first_date, last_date)
+            rebuild_consecutive_record(user)
+            caches.invalidate_task_range(user.pk, first_date, last_date)
+
+    result['seconds'] = time.monotonic() - started
+    rows_count = result['tasks'] + result['comments']
+    result['rows_per_second'] = rows_count / result['seconds'] if result['seconds'] else 0
+    return result
@@ -0,0 +1,56 @@
+import datetime
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from task.archives import ARCHIVE_MONTHS, archive_user, get_cutoff, restore_month
+
+
+class Command(BaseCommand):
+    help = '古い月のタスク・メモを、ユーザー・月ごとのアーカイブ(TaskArchive)にまとめます。--restore で1か月分を戻します'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='対象ユーザーのメールアドレス（省略すると全ユーザー）')
+        parser.add_argument(
+            '--months', type=int, default=ARCHIVE_MONTHS,
+            help=f'今月を含めて、この月数より前の月をアーカイブする（省略すると {ARCHIVE_MONTHS}）',
+        )
+        parser.add_argument('--restore', metavar='YYYY-MM', help='アーカイブせずに、この月のアーカイブを戻す（--user が必要）')
+
+    def handle(self, *args, **options):
+        users = get_user_model().objects.order_by('pk')
+        if options['user']:
+            users = users.filter(email=options['user'])
+            if not users.exists():
+                raise CommandError(f"ユーザーが見つかりません: {options['user']}")
+
+        if options['restore']:
+            if not options['user']:
+                raise CommandError('--restore には --user を指定してください')
+            try:
+                month = datetime.date.fromisoformat(options['restore'] + '-01')
+            except ValueError:
+                raise CommandError(f"月は YYYY-MM の形式で指定してください: {options['restore']}")
+            if restore_month(users.get(), month):
+                self.stdout.write(self.style.SUCCESS(f'{month:%Y-%m} のアーカイブを戻しました'))
+            else:
+                self.stdout.write(f'{month:%Y-%m} のアーカイブはありません')
+            return
+
+        if options['months'] < 1:
+            raise CommandError('--months は1以上にしてください')
+        cutoff = get_cutoff(months=options['months'])
+
+        months = tasks = comments = 0
+        for user in users.iterator():
+            archived = archive_user(user, cutoff)
+            if not archived:
+                continue
+            months += len(archived)
+            tasks += sum(archive.task_count for archive in archived)
+            comments += sum(archive.comment_count for archive in archived)
+            self.stdout.write(f'{user}: {len(archived)}か月分')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{cutoff:%Y-%m} より前の {months}か月分（タスク{tasks}件・メモ{comments}件）をアーカイブしました'
+        ))
@@ -0,0 +1,100 @@
+import datetime
+import json
+
+import django
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from task.benchmark import SCENARIOS, compare_reports, run_benchmark
+
+
+class Command(BaseCommand):
+    help = (
+        'seed_loadコマンドで作ったユーザーで主なビューに同時にリクエストを送り、'
+        'レイテンシ(p50/p95/p99)・リクエスト数/秒・クエリ数/リクエストを測ります。'
+        'WSGIとASGIを比べる時は、ASYNC_VIEWS=False で --output したものを、'
+        'ASYNC_VIEWS=True --mode asgi --compare に渡してください'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--prefix', default='load', help='seed_loadで指定したメールアドレスの接頭辞')
+        parser.add_argument('--concurrency', type=int, default=4, help='同時に動かすクライアント数')
+        parser.add_argument('--requests', type=int, default=200, help='シナリオごとのリクエスト数')
+        parser.add_argument(
+            '--scenario', action='append', choices=sorted(SCENARIOS),
+            help='実行するシナリオ（複数指定可。省略するとすべて）',
+        )
+        parser.add_argument('--seed', type=int, default=0, help='乱数のシード')
+        parser.add_argument('--output', help='結果のJSONを書き出すファイル（リリース間の比較用）')
+        parser.add_argument(
+            '--mode', choices=('wsgi', 'asgi'), default='wsgi',
+            help='WSGIハンドラーとテストクライアント、またはASGIハンドラーとAsyncClientのどちらで測るか',
+        )
+        parser.add_argument('--compare', help='比べる結果のJSON（--outputで書き出したもの）')
+
+    def handle(self, *args, **options):
+        users = list(
+            get_user_model().objects.filter(email__startswith=f"{options['prefix']}-", email__endswith='@example.com')
+                .order_by('email')
+        )
+        if not users:
+            raise CommandError('ユーザーがいません。先に seed_load コマンドを実行してください')
+
+        # 非同期版のビューはURLの読み込み時に決まるので、モードと設定が合っているか確かめる
+        if (options['mode'] == 'asgi') != settings.ASYNC_VIEWS:
+            raise CommandError(
+                f"--mode {options['mode']} は ASYNC_VIEWS={options['mode'] == 'asgi'} で実行してください"
+            )
+
+        scenario_names = options['scenario'] or list(SCENARIOS)
+        for name in scenario_names:
+            missing = [str(user) for user in users if not SCENARIOS[name].can_run(user)]
+            if missing:
+                raise CommandError(
+                    f"{', '.join(missing)} には {name} シナリオに必要なタスクがありません。"
+                    'seed_load コマンドで作り直すか、--scenario で他のシナリオを指定してください'
+                )
+        results = run_benchmark(
+            users, scenario_names, options['concurrency'], options['requests'], options['seed'], options['mode']
+        )
+
+        for name, result in results.items():
+            latency = result['latency_ms']
+            self.stdout.write(
+                f"{name:18} {result['requests_per_second']:>8} req/s  "
+                f"p50 {latency['p50']}ms  p95 {latency['p95']}ms  p99 {latency['p99']}ms  "
+                f"{result['queries_per_request']} queries/req  errors {result['errors']}"
+            )
+
+        report = {
+            'meta': {
+                'created_at': datetime.datetime.now().isoformat(timespec='seconds'),
+                'django': django.get_version(),
+                'database': connection.vendor,
+                'mode': options['mode'],
+                'users': len(users),
+                'concurrency': options['concurrency'],
+                'requests': options['requests'],
+                'seed': options['seed'],
+            },
+            'scenarios': results,
+        }
+
+        if options['compare']:
+            with open(options['compare']) as f:
+                base = json.load(f)
+            base_mode = base['meta'].get('mode', 'wsgi')
+            self.stdout.write(f"\n{options['compare']} ({base_mode}) との比較")
+            for name, before, after in compare_reports(base, report):
+                self.stdout.write(
+                    f"{name:18} {before['requests_per_second']} → {after['requests_per_second']} req/s  "
+                    f"p95 {before['latency_ms']['p95']} → {after['latency_ms']['p95']}ms  "
+                    f"p99 {before['latency_ms']['p99']} → {after['latency_ms']['p99']}ms"
+                )
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"結果を {options['output']} に書き出しました"))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from task.caches import get_calendar_cache_stats, reset_calendar_cache_stats
+
+
+class Command(BaseCommand):
+    help = (
+        '月間カレンダーキャッシュのヒット数・ミス数を表示します。'
+        '（ローカルメモリキャッシュではプロセスごとに数えるので、ファイルベースなど共有キャッシュで使ってください）'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help='表示した後にカウンターをリセットする')
+
+    def handle(self, *args, **options):
+        stats = get_calendar_cache_stats()
+        hit_rate = '-' if stats['hit_rate'] is None else f"{stats['hit_rate']:.1%}"
+        self.stdout.write(f"ヒット: {stats['hits']}  ミス: {stats['misses']}  ヒット率: {hit_rate}")
+
+        if options['reset']:
+            reset_calendar_cache_stats()
+            self.stdout.write('カウンターをリセットしました')
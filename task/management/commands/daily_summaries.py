@@ -0,0 +1,49 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from task.consecutive import rebuild_consecutive_record
+from task.summaries import rebuild_daily_summaries, verify_daily_summaries
+
+
+class Command(BaseCommand):
+    help = '日ごとの集計(DailySummary)をタスク・メモから作り直します。--verify で食い違いの確認だけ行います'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='対象ユーザーのメールアドレス（省略すると全ユーザー）')
+        parser.add_argument('--verify', action='store_true', help='作り直さずに、食い違っている日を表示する')
+        parser.add_argument('--fix', action='store_true', help='--verify で食い違いがあったユーザーだけ作り直す')
+
+    def handle(self, *args, **options):
+        users = get_user_model().objects.order_by('pk')
+        if options['user']:
+            users = users.filter(email=options['user'])
+            if not users.exists():
+                raise CommandError(f"ユーザーが見つかりません: {options['user']}")
+
+        if not options['verify']:
+            count = 0
+            for user in users.iterator():
+                days = rebuild_daily_summaries(user)
+                rebuild_consecutive_record(user)
+                count += 1
+                self.stdout.write(f'{user}: {days}日分')
+            self.stdout.write(self.style.SUCCESS(f'{count}人の集計を作り直しました'))
+            return
+
+        broken = 0
+        for user in users.iterator():
+            mismatches = verify_daily_summaries(user)
+            if not mismatches:
+                continue
+            broken += 1
+            self.stdout.write(self.style.WARNING(f'{user}: {len(mismatches)}日分が食い違っています'))
+            for day, stored, expected in mismatches[:10]:
+                self.stdout.write(f'  {day}: 保存済み {stored} / 正しい値 {expected}')
+            if options['fix']:
+                rebuild_daily_summaries(user)
+                rebuild_consecutive_record(user)
+                self.stdout.write(f'  {user}: 作り直しました')
+
+        if broken and not options['fix']:
+            raise CommandError(f'{broken}人の集計が食い違っています（--fix で作り直せます）')
+        self.stdout.write(self.style.SUCCESS('集計はタスク・メモと一致しています' if not broken else f'{broken}人の集計を作り直しました'))
@@ -0,0 +1,95 @@
+import datetime
+import re
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from task.consecutive import done_dates_queryset
+from task.search import find_candidates
+from task.models import Task, DailySummary
+
+
+class Command(BaseCommand):
+    help = (
+        'カレンダー・連続記録・完了済み一覧のクエリをEXPLAINして、インデックスが使われているか確認します。'
+        '（SQLite / MariaDB 対応。データが少ないとMariaDBはフルスキャンを選ぶことがあるので、本番相当のデータで実行してください）'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='クエリに使うユーザーのメールアドレス（省略すると最初のユーザー）')
+
+    def get_queries(self, user):
+        """(名前, クエリセット, インデックスだけで完結すべきか) のリストを返す
+
+        各クエリセットは mixins.py / consecutive.py / views.py で実際に組み立てているものと同じ形にしておくこと。
+        """
+        today = datetime.date.today()
+        month_range = (today - datetime.timedelta(days=6), today + datetime.timedelta(days=36))
+
+        return [
+            ('カレンダー: 月の集計',
+             DailySummary.objects.filter(user=user, date__range=month_range)
+                 .values_list('date', 'total', 'done', 'has_comment'),
+             False),
+            ('連続記録: 期間内の完了日',
+             done_dates_queryset(user, date__range=month_range),
+             False),
+            ('集計: その日のタスク数',
+             Task.objects.filter(created_by=user, created_at=today).values_list('done_at'),
+             True),
+            ('その日のタスク',
+             Task.objects.filter(created_by=user, created_at=today),
+             False),
+            ('検索: 候補のタスク・メモ',
+             find_candidates(user, ['タスク']),
+             True),
+            ('完了済みタスク一覧',
+             Task.objects.filter(done_at__isnull=False, created_by=user),
+             False),
+        ]
+
+    def analyze(self, plan):
+        """EXPLAINの結果から (インデックスを使っているか, インデックスだけで完結しているか) を返す"""
+        if connection.vendor == 'sqlite':
+            index_only = 'USING COVERING INDEX' in plan
+            uses_index = index_only or 'USING INDEX' in plan
+        elif connection.vendor == 'mysql':
+            # "Using index condition" はインデックスだけで完結していないので除外する
+            index_only = re.search(r'Using index(?! condition)', plan) is not None
+            uses_index = index_only or re.search(r'task_user_|comment_user_|daily_summary_|search_token_', plan) is not None
+        else:
+            raise CommandError(f'{connection.vendor} には対応していません')
+        return uses_index, index_only
+
+    def handle(self, *args, **options):
+        users = get_user_model().objects.order_by('pk')
+        if options['user']:
+            users = users.filter(email=options['user'])
+        user = users.first()
+        if user is None:
+            raise CommandError('ユーザーが見つかりません')
+
+        failures = []
+        for name, queryset, require_index_only in self.get_queries(user):
+            plan = queryset.explain()
+            uses_index, index_only = self.analyze(plan)
+
+            if index_only:
+                verdict = self.style.SUCCESS('インデックスのみ')
+            elif uses_index:
+                verdict = self.style.WARNING('インデックス使用')
+            else:
+                verdict = self.style.ERROR('フルスキャン')
+
+            if not uses_index or (require_index_only and not index_only):
+                failures.append(name)
+
+            self.stdout.write(f'■ {name}: {verdict}')
+            self.stdout.write(f'  {queryset.query}')
+            for line in plan.splitlines():
+                self.stdout.write(f'    {line}')
+
+        if failures:
+            raise CommandError('想定したインデックスが使われていません: ' + ', '.join(failures))
+        self.stdout.write(self.style.SUCCESS('すべてのクエリが想定どおりインデックスを使っています'))
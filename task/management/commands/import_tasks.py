@@ -0,0 +1,37 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from task.imports import BATCH_SIZE, guess_format, import_records
+
+
+class Command(BaseCommand):
+    help = 'CSV / JSON Lines（gzip圧縮も可）からタスク・メモを一括で取り込みます'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='取り込むファイルのパス')
+        parser.add_argument('--user', required=True, help='取り込み先ユーザーのメールアドレス')
+        parser.add_argument('--format', choices=('csv', 'jsonl'), help='ファイルの形式（省略するとファイル名から判断）')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='1トランザクションで保存する件数')
+
+    def handle(self, *args, **options):
+        try:
+            user = get_user_model().objects.get(email=options['user'])
+        except get_user_model().DoesNotExist:
+            raise CommandError(f"ユーザーが見つかりません: {options['user']}")
+
+        import_format = options['format'] or guess_format(options['path'])
+        if import_format is None:
+            raise CommandError('--format で形式を指定してください')
+
+        with open(options['path'], 'rb') as f:
+            result = import_records(user, f, import_format, batch_size=options['batch_size'])
+
+        for error in result['errors']:
+            self.stderr.write(error)
+        if result['skipped'] > len(result['errors']):
+            self.stderr.write(f"...ほか{result['skipped'] - len(result['errors'])}件のエラー")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"タスク{result['tasks']}件・メモ{result['comments']}件を取り込みました"
+            f"（スキップ{result['skipped']}件 / {result['seconds']:.2f}秒 / {result['rows_per_second']:.0f}件/秒）"
+        ))
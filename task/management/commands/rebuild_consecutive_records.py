@@ -0,0 +1,26 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from task.consecutive import rebuild_consecutive_record
+
+
+class Command(BaseCommand):
+    help = '全履歴からタスクの連続完了記録(ConsecutiveRecord)を作り直します'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='対象ユーザーのメールアドレス（省略すると全ユーザー）')
+
+    def handle(self, *args, **options):
+        users = get_user_model().objects.order_by('pk')
+        if options['user']:
+            users = users.filter(email=options['user'])
+            if not users.exists():
+                raise CommandError(f"ユーザーが見つかりません: {options['user']}")
+
+        count = 0
+        for user in users.iterator():
+            record = rebuild_consecutive_record(user)
+            count += 1
+            self.stdout.write(f'{user}: 最高 {record.best_days}日 / 最新 {record.latest_days}日')
+
+        self.stdout.write(self.style.SUCCESS(f'{count}人の連続記録を作り直しました'))
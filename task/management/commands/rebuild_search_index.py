@@ -0,0 +1,26 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from task.search import rebuild_search_index
+
+
+class Command(BaseCommand):
+    help = 'タスク名・メモの検索用インデックス(SearchToken)を作り直します'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='対象ユーザーのメールアドレス（省略すると全ユーザー）')
+
+    def handle(self, *args, **options):
+        users = get_user_model().objects.order_by('pk')
+        if options['user']:
+            users = users.filter(email=options['user'])
+            if not users.exists():
+                raise CommandError(f"ユーザーが見つかりません: {options['user']}")
+
+        count = 0
+        for user in users.iterator():
+            tokens = rebuild_search_index(user)
+            count += 1
+            self.stdout.write(f'{user}: トークン{tokens}件')
+
+        self.stdout.write(self.style.SUCCESS(f'{count}人の検索インデックスを作り直しました'))
@@ -0,0 +1,72 @@
+import datetime
+import random
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from task.consecutive import rebuild_consecutive_record
+from task.models import Task, Comment
+from task.search import rebuild_search_index
+from task.summaries import deferred_refresh, rebuild_daily_summaries
+from task.sync import deferred_tombstones
+from task.sampledata import generate_history, bulk_create_history
+
+# 今日より先の予定として作る日数
+FUTURE_DAYS = 14
+
+
+class Command(BaseCommand):
+    help = '負荷試験用に、何年分ものタスク・メモを持つユーザーを作ります（benchmark_viewsコマンドで使います）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10, help='作るユーザー数')
+        parser.add_argument('--years', type=float, default=3, help='何年分のタスクを作るか')
+        parser.add_argument('--seed', type=int, default=0, help='乱数のシード。同じ値なら同じデータになる')
+        parser.add_argument('--prefix', default='load', help='ユーザーのメールアドレスの接頭辞 (例: load-0001@example.com)')
+        parser.add_argument('--password', default='load-password', help='作るユーザーのパスワード')
+        parser.add_argument('--reset', action='store_true', help='すでにいるユーザーのタスク・メモを消して作り直す')
+
+    def handle(self, *args, **options):
+        User = get_user_model()
+        today = datetime.date.today()
+        start = today - datetime.timedelta(days=int(options['years'] * 365))
+        end = today + datetime.timedelta(days=FUTURE_DAYS)
+
+        started = time.monotonic()
+        total_tasks = total_comments = 0
+
+        for i in range(1, options['users'] + 1):
+            email = f"{options['prefix']}-{i:04d}@example.com"
+            user, created = User.objects.get_or_create(email=email, defaults={'username': f"{options['prefix']}{i}"})
+
+            if not created:
+                if not options['reset']:
+                    self.stdout.write(f'{email}: すでにいるのでスキップします（--reset で作り直し）')
+                    continue
+                # 集計の更新は日ごとに1回に、削除の記録は最後にまとめる（集計はどうせ後で作り直す）
+                with transaction.atomic(), deferred_refresh(), deferred_tombstones():
+                    Task.objects.filter(created_by=user).delete()
+                    Comment.objects.filter(created_by=user).delete()
+
+            user.set_password(options['password'])
+            user.save(update_fields=['password'])
+
+            # ユーザーごとに別の乱数列にして、ユーザー数を変えても同じユーザーは同じデータになるようにする
+            rng = random.Random(f"{options['seed']}-{i}")
+            with transaction.atomic():
+                tasks, comments = bulk_create_history(generate_history(user, start, end, rng, today=today))
+                # bulk_createではシグナルが送られないので、日ごとの集計・検索インデックスと連続記録を作り直す
+                rebuild_daily_summaries(user)
+                rebuild_search_index(user)
+            rebuild_consecutive_record(user)
+
+            total_tasks += tasks
+            total_comments += comments
+            self.stdout.write(f'{email}: タスク{tasks}件・メモ{comments}件')
+
+        seconds = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'タスク{total_tasks}件・メモ{total_comments}件を作りました（{seconds:.1f}秒）'
+        ))
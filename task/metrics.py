@@ -0,0 +1,112 @@
+"""リクエストごとの処理時間・クエリ数の集計
+
+middleware.RequestMetricsMiddleware から記録し、スタッフ用の metrics ビューで読む。
+URL名(task:top など)ごとに、処理時間のヒストグラムとクエリ数・DB時間の合計をプロセスのメモリに持つ。
+集計は REQUEST_METRICS_WINDOW 秒ごとに切り替え、直近2つの期間分だけを保持する。
+"""
+import threading
+import time
+
+from django.conf import settings
+
+WINDOW = getattr(settings, 'REQUEST_METRICS_WINDOW', 300)
+
+# ヒストグラムの区切り（ミリ秒）。最後の区切りを超えたものは最後のバケットに入る
+BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+class RouteStats:
+    """1つのURL名の集計"""
+    __slots__ = ('count', 'wall_ms', 'db_ms', 'queries', 'histogram')
+
+    def __init__(self):
+        self.count = 0
+        self.wall_ms = 0.0
+        self.db_ms = 0.0
+        self.queries = 0
+        self.histogram = [0] * (len(BUCKETS) + 1)
+
+    def add(self, wall_ms, db_ms, queries):
+        self.count += 1
+        self.wall_ms += wall_ms
+        self.db_ms += db_ms
+        self.queries += queries
+        for i, bound in enumerate(BUCKETS):
+            if wall_ms <= bound:
+                self.histogram[i] += 1
+                break
+        else:
+            self.histogram[-1] += 1
+
+    def merge(self, other):
+        self.count += other.count
+        self.wall_ms += other.wall_ms
+        self.db_ms += other.db_ms
+        self.queries += other.queries
+        self.histogram = [a + b for a, b in zip(self.histogram, other.histogram)]
+
+    def percentile(self, percent):
+        """ヒストグラムから、パーセンタイルが入るバケットの上限(ミリ秒)を返す"""
+        target = self.count * percent / 100
+        seen = 0
+        for i, count in enumerate(self.histogram):
+            seen += count
+            if count and seen >= target:
+                return BUCKETS[i] if i < len(BUCKETS) else None
+        return None
+
+    def to_dict(self):
+        count = self.count or 1
+        return {
+            'count': self.count,
+            'wall_ms_mean': round(self.wall_ms / count, 2),
+            'db_ms_mean': round(self.db_ms / count, 2),
+            'queries_mean': round(self.queries / count, 2),
+            # 上限を超えたものは None（BUCKETS の最後より遅い）
+            'p50_ms_le': self.percentile(50),
+            'p95_ms_le': self.percentile(95),
+            'p99_ms_le': self.percentile(99),
+            'histogram': dict(zip([str(bound) for bound in BUCKETS] + ['inf'], self.histogram)),
+        }
+
+
+class MetricsStore:
+    """URL名ごとの RouteStats を、期間を区切って持つ"""
+
+    def __init__(self, window=WINDOW):
+        self.window = window
+        self.lock = threading.Lock()
+        self.started = time.monotonic()
+        self.current = {}
+        self.previous = {}
+
+    def _rotate(self, now):
+        if now - self.started >= self.window:
+            # 2期間以上空いた場合は、前の期間も古すぎるので捨てる
+            self.previous = self.current if now - self.started < self.window * 2 else {}
+            self.current = {}
+            self.started = now
+
+    def record(self, name, wall_ms, db_ms, queries):
+        with self.lock:
+            self._rotate(time.monotonic())
+            stats = self.current.get(name)
+            if stats is None:
+                stats = self.current[name] = RouteStats()
+            stats.add(wall_ms, db_ms, queries)
+
+    def snapshot(self):
+        """直近2期間分を合わせた、URL名ごとの集計を返す"""
+        with self.lock:
+            self._rotate(time.monotonic())
+            merged = {}
+            for period in (self.previous, self.current):
+                for name, stats in period.items():
+                    merged.setdefault(name, RouteStats()).merge(stats)
+            return {
+                'window_seconds': self.window,
+                'routes': {name: stats.to_dict() for name, stats in sorted(merged.items())},
+            }
+
+
+store = MetricsStore()
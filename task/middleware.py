@@ -0,0 +1,100 @@
+import asyncio
+import contextvars
+import threading
+import time
+
+from .metrics import store
+
+# 処理中のリクエストの QueryCounter。sync_to_async で別スレッドに渡したクエリも数えられるように、
+# スレッドローカルではなく contextvars で持つ（asgiref はスレッドにコンテキストを引き継ぐ）
+current_counter = contextvars.ContextVar('current_counter', default=None)
+
+
+class QueryCounter:
+    """リクエスト1回分のクエリ数とDB時間を数える"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            with self.lock:
+                self.seconds += elapsed
+                self.count += 1
+
+
+def count_queries(execute, sql, params, many, context):
+    """すべての接続に付ける execute_wrapper。リクエストの処理中だけ、そのリクエストの QueryCounter で数える"""
+    counter = current_counter.get()
+    if counter is None:
+        return execute(sql, params, many, context)
+    return counter(execute, sql, params, many, context)
+
+
+def install_query_counter(sender, connection, **kwargs):
+    """connection_created シグナルで、新しい接続に count_queries を付ける（apps.pyで接続する）
+
+    connection.execute_wrapper() は最後に追加したものを取り除くので、一番先頭に入れておく。
+    """
+    if count_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, count_queries)
+
+
+class RequestMetricsMiddleware:
+    """リクエストごとの処理時間・クエリ数・DB時間を記録する
+
+    本番でも動かしっぱなしにできるように、DEBUGに頼らず execute_wrapper で数え、
+    結果は Server-Timing ヘッダーとメモリ上の集計(metrics.store)にだけ書く。
+    すべてのミドルウェアを含めて測るため、MIDDLEWARE の先頭に置く。
+    WSGI・ASGIのどちらでも動く。
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(self.get_response):
+            # ASGIでは非同期のミドルウェアとして呼ばれるようにする（MiddlewareMixin と同じ方法）
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+
+        counter = QueryCounter()
+        token = current_counter.set(counter)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            current_counter.reset(token)
+        return self.record(request, response, counter, started)
+
+    async def __acall__(self, request):
+        counter = QueryCounter()
+        token = current_counter.set(counter)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_counter.reset(token)
+        return self.record(request, response, counter, started)
+
+    def record(self, request, response, counter, started):
+        wall_ms = (time.perf_counter() - started) * 1000
+        db_ms = counter.seconds * 1000
+
+        match = getattr(request, 'resolver_match', None)
+        name = match.view_name if match else 'unresolved'
+        store.record(name, wall_ms, db_ms, counter.count)
+
+        response['Server-Timing'] = (
+            f'app;dur={wall_ms:.1f}, db;dur={db_ms:.1f};desc="{counter.count} queries"'
+        )
+        return response
@@ -0,0 +1,43 @@
+# Generated by Django 3.2.25 on 2026-10-18 15:18
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Task',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('title', models.CharField(max_length=128, verbose_name='タスクの名前')),
+                ('done_at', models.DateField(blank=True, null=True, verbose_name='タスク完了日')),
+                ('created_at', models.DateField(default=django.utils.timezone.now, verbose_name='タスク作成日')),
+                ('created_by', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL, verbose_name='このタスクを作った人')),
+            ],
+            options={
+                'db_table': 'task',
+            },
+        ),
+        migrations.CreateModel(
+            name='Comment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('body', models.TextField(verbose_name='コメント')),
+                ('created_at', models.DateField(default=django.utils.timezone.now, verbose_name='コメント作成日')),
+                ('created_by', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'comment',
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 3.2.25 on 2026-10-18 15:18
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('task', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConsecutiveRecord',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('latest_start', models.DateField(blank=True, null=True, verbose_name='最新の連続期間の開始日')),
+                ('latest_end', models.DateField(blank=True, null=True, verbose_name='最新の連続期間の最終日')),
+                ('best_start', models.DateField(blank=True, null=True, verbose_name='最高記録の開始日')),
+                ('best_end', models.DateField(blank=True, null=True, verbose_name='最高記録の最終日')),
+                ('best_days', models.PositiveIntegerField(default=0, verbose_name='最高継続日数')),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='consecutive_record', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'consecutive_record',
+            },
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 3.2.25 on 2026-10-18 15:18
+
+from django.db import migrations, models
+
+
+def merge_duplicate_comments(apps, schema_editor):
+    """1日に複数あるメモを、一番古いメモにまとめる（一意制約を付ける前の準備）"""
+    Comment = apps.get_model('task', 'Comment')
+    duplicates = (
+        Comment.objects.values('created_by', 'created_at')
+            .annotate(count=models.Count('id'))
+            .filter(count__gt=1)
+    )
+    for dup in duplicates:
+        comments = list(
+            Comment.objects.filter(created_by=dup['created_by'], created_at=dup['created_at']).order_by('id')
+        )
+        first = comments[0]
+        first.body = '\n\n'.join(comment.body for comment in comments)
+        first.save(update_fields=['body'])
+        Comment.objects.filter(pk__in=[comment.pk for comment in comments[1:]]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('task', '0002_consecutiverecord'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_comments, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['created_by', 'created_at', 'done_at'], name='task_user_day_done_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['created_by', 'done_at'], name='task_user_done_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='comment',
+            constraint=models.UniqueConstraint(fields=('created_by', 'created_at'), name='comment_user_day_unique'),
+        ),
+    ]
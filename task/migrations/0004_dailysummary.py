@@ -0,0 +1,61 @@
+# Generated by Django 3.2.25 on 2026-10-18 15:28
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def backfill_daily_summaries(apps, schema_editor):
+    """既存のタスク・メモから、日ごとの集計を作る"""
+    Task = apps.get_model('task', 'Task')
+    Comment = apps.get_model('task', 'Comment')
+    DailySummary = apps.get_model('task', 'DailySummary')
+
+    days = {}
+    task_counts = (
+        Task.objects.values('created_by', 'created_at')
+            .annotate(total=models.Count('id'), done=models.Count('done_at'))
+            .order_by()
+    )
+    for row in task_counts.iterator():
+        days[row['created_by'], row['created_at']] = [row['total'], row['done'], False]
+    for key in Comment.objects.values_list('created_by', 'created_at').iterator():
+        days.setdefault(key, [0, 0, False])[2] = True
+
+    DailySummary.objects.bulk_create(
+        [
+            DailySummary(user_id=user_id, date=day, total=total, done=done, has_comment=has_comment)
+            for (user_id, day), (total, done, has_comment) in days.items()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('task', '0003_task_comment_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailySummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='日付')),
+                ('total', models.PositiveIntegerField(default=0, verbose_name='タスク数')),
+                ('done', models.PositiveIntegerField(default=0, verbose_name='完了したタスク数')),
+                ('has_comment', models.BooleanField(default=False, verbose_name='メモの有無')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_summaries', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'daily_summary',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='dailysummary',
+            constraint=models.UniqueConstraint(fields=('user', 'date'), name='daily_summary_user_date_unique'),
+        ),
+        migrations.RunPython(backfill_daily_summaries, migrations.RunPython.noop),
+    ]
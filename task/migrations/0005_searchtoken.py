@@ -0,0 +1,65 @@
+# Generated by Django 3.2.25 on 2026-10-18 15:33
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import unicodedata
+
+
+def tokenize(text):
+    """このマイグレーションを作った時点の task.search.tokenize()（後で変わっても、ここは変えないこと）"""
+    tokens = set()
+    for word in unicodedata.normalize('NFKC', text).lower().split():
+        # 1文字とbigram
+        tokens.update(word)
+        tokens.update(word[i:i + 2] for i in range(len(word) - 1))
+    return tokens
+
+
+def backfill_search_tokens(apps, schema_editor):
+    """既存のタスク・メモの検索用トークンを作る"""
+    Task = apps.get_model('task', 'Task')
+    Comment = apps.get_model('task', 'Comment')
+    SearchToken = apps.get_model('task', 'SearchToken')
+
+    for model, field, owner in ((Task, 'title', 'task_id'), (Comment, 'body', 'comment_id')):
+        batch = []
+        for pk, user_id, day, text in model.objects.values_list('pk', 'created_by', 'created_at', field).iterator():
+            batch += [
+                SearchToken(user_id=user_id, token=token, date=day, **{owner: pk})
+                for token in tokenize(text)
+            ]
+            if len(batch) >= 1000:
+                SearchToken.objects.bulk_create(batch)
+                batch = []
+        SearchToken.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('task', '0004_dailysummary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token', models.CharField(max_length=2, verbose_name='トークン')),
+                ('date', models.DateField(verbose_name='日付')),
+                ('comment', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='search_tokens', to='task.comment')),
+                ('task', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='search_tokens', to='task.task')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_tokens', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'search_token',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='searchtoken',
+            index=models.Index(fields=['user', 'token', 'date', 'task', 'comment'], name='search_token_user_token_idx'),
+        ),
+        migrations.RunPython(backfill_search_tokens, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 3.2.25 on 2026-10-18 15:50
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('task', '0005_searchtoken'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecurringSkip',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='日付')),
+            ],
+            options={
+                'db_table': 'recurring_skip',
+            },
+        ),
+        migrations.CreateModel(
+            name='RecurringTask',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('title', models.CharField(max_length=128, verbose_name='タスクの名前')),
+                ('rule', models.CharField(choices=[('daily', '毎日'), ('weekdays', '平日'), ('interval', 'N日ごと'), ('monthly', '毎月')], max_length=16, verbose_name='繰り返し')),
+                ('interval', models.PositiveSmallIntegerField(default=1, verbose_name='間隔（日）')),
+                ('start_date', models.DateField(verbose_name='開始日')),
+                ('end_date', models.DateField(blank=True, null=True, verbose_name='終了日')),
+            ],
+            options={
+                'db_table': 'recurring_task',
+            },
+        ),
+        migrations.AddField(
+            model_name='recurringtask',
+            name='created_by',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recurring_tasks', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='recurringskip',
+            name='recurrence',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='skips', to='task.recurringtask'),
+        ),
+        migrations.AddField(
+            model_name='task',
+            name='recurrence',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='tasks', to='task.recurringtask', verbose_name='繰り返し'),
+        ),
+        migrations.AddConstraint(
+            model_name='task',
+            constraint=models.UniqueConstraint(fields=('recurrence', 'created_at'), name='task_recurrence_day_unique'),
+        ),
+        migrations.AddConstraint(
+            model_name='recurringskip',
+            constraint=models.UniqueConstraint(fields=('recurrence', 'date'), name='recurring_skip_unique'),
+        ),
+    ]
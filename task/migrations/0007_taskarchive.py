@@ -0,0 +1,38 @@
+# Generated by Django 3.2.25 on 2026-10-18 15:55
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('task', '0006_recurringtask'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TaskArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(verbose_name='月')),
+                ('data', models.BinaryField(verbose_name='データ')),
+                ('task_count', models.PositiveIntegerField(default=0, verbose_name='タスク数')),
+                ('done_count', models.PositiveIntegerField(default=0, verbose_name='完了したタスク数')),
+                ('comment_count', models.PositiveIntegerField(default=0, verbose_name='メモ数')),
+                ('first_done_at', models.DateField(blank=True, null=True, verbose_name='最初の完了日')),
+                ('last_done_at', models.DateField(blank=True, null=True, verbose_name='最後の完了日')),
+                ('archived_at', models.DateTimeField(auto_now=True, verbose_name='アーカイブした日時')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='task_archives', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'task_archive',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='taskarchive',
+            constraint=models.UniqueConstraint(fields=('user', 'month'), name='task_archive_user_month_unique'),
+        ),
+    ]
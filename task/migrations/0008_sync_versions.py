@@ -0,0 +1,87 @@
+# Generated by Django 3.2.25 on 2026-10-18 16:00
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def backfill_versions(apps, schema_editor):
+    """既存のタスク・メモ・アーカイブに版を付ける
+
+    最初の同期がひとまとまりにならないように、IDをそのまま版にする。
+    ユーザーごとのカウンターは、最初に使う時にこの最大値から始まる。
+    """
+    for model_name in ('Task', 'Comment', 'TaskArchive'):
+        apps.get_model('task', model_name).objects.update(version=models.F('id'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('task', '0007_taskarchive'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('value', models.BigIntegerField(default=0, verbose_name='最後に付けた版')),
+            ],
+            options={
+                'db_table': 'change_counter',
+            },
+        ),
+        migrations.CreateModel(
+            name='Tombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('task', 'タスク'), ('comment', 'メモ')], max_length=8, verbose_name='種類')),
+                ('object_id', models.BigIntegerField(verbose_name='ID')),
+                ('version', models.BigIntegerField(verbose_name='変更の版')),
+                ('deleted_at', models.DateTimeField(auto_now_add=True, verbose_name='削除した日時')),
+            ],
+            options={
+                'db_table': 'tombstone',
+            },
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='version',
+            field=models.BigIntegerField(default=0, verbose_name='変更の版'),
+        ),
+        migrations.AddField(
+            model_name='task',
+            name='version',
+            field=models.BigIntegerField(default=0, verbose_name='変更の版'),
+        ),
+        migrations.AddField(
+            model_name='taskarchive',
+            name='version',
+            field=models.BigIntegerField(default=0, verbose_name='変更の版'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['created_by', 'version'], name='comment_user_version_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['created_by', 'version'], name='task_user_version_idx'),
+        ),
+        migrations.AddField(
+            model_name='tombstone',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tombstones', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='changecounter',
+            name='user',
+            field=models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='change_counter', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='tombstone',
+            index=models.Index(fields=['user', 'version'], name='tombstone_user_version_idx'),
+        ),
+        migrations.RunPython(backfill_versions, migrations.RunPython.noop),
+    ]
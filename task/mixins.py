@@ -3,7 +3,8 @@ import datetime
 import itertools
 from collections import deque
 
-from .models import Task, Comment
+from . import archives, caches, consecutive, daystatus, recurring
+from .models import DailySummary
 
 
 class BaseCalendarMixin:
@@ -77,37 +78,29 @@ class MonthCalendarMixin(BaseCalendarMixin):
 class MonthWithTaskMixin(MonthCalendarMixin):
     """タスク付きの、月間カレンダーを提供するMixin"""
 
-    def get_month_tasks(self, start, end, days):
-        """それぞれの日とタスクを返す"""
+    def get_month_tasks(self, start, end, days, pending=None):
+        """それぞれの日と、その日の状態(daystatus)を返す
 
-        lookup = {
-            # '例えば、done_at__range: (1日, 31日)'を動的に作る
-            f'{self.date_field}__range': (start, end),
-            'created_by': self.request.user,
-        }
-        # 例えば、Task.objects.filter(created_at__range=(1日, 31日), created_by=request.user) になる
-        queryset = self.model.objects.filter(**lookup)
-        comment_qs = Comment.objects.filter(**lookup)
+        pending にまだ作っていない繰り返しのタスク（recurring.get_pending_occurrences()）を渡すと、
+        未完了のタスクとして数える。
+        """
 
-        # {1日のdatetime: ['Done', 'Yet', 'Yet', 'Comment'], 2日のdatetime: ['Done', 'Comment']...}のような辞書を作る
-        # 'Done', 'Yet' は各タスクが完了したかどうかを表す。 'Comment' はコメントの有無を表す
         # カレンダー上に表示するだけなので、その日のタスク・コメントの有無、完了確認だけ取得できれば良い
-        day_tasks = {day: [] for week in days for day in week}
-
-        for task in queryset:
-            task_date = getattr(task, self.date_field)
-
-            if task.done_at:
-                task_status = 'Done'
-            else:
-                task_status = 'Yet'
-
-            day_tasks[task_date].append(task_status)
-
-        for comment in comment_qs:
-            day_tasks[comment.created_at].append('Comment')
-
-        # day_tasks辞書を、週毎に分割する。[{1日: ['Done', 'Yet', 'Comment']}... {8日: ['Done', 'Comment']...}, ...]
+        # タスクは数えずに、日ごとの集計(DailySummary)を読む
+        summaries = DailySummary.objects.filter(
+            user=self.request.user, date__range=(start, end)
+        ).values_list('date', 'total', 'done', 'has_comment')
+        counts = {day: (total, done, has_comment) for day, total, done, has_comment in summaries}
+        pending = pending or {}
+
+        # {1日のdate: 3, 2日のdate: 4...}のような辞書を作る。値はdaystatusのビットフラグ
+        day_tasks = {}
+        for week in days:
+            for day in week:
+                total, done, has_comment = counts.get(day, (0, 0, False))
+                day_tasks[day] = daystatus.get_day_status(total + len(pending.get(day, ())), done, has_comment)
+
+        # day_tasks辞書を、週毎に分割する。[{1日: 3, 2日: 0...}, {8日: 7...}, ...]
         # 7個ずつ取り出して分割しています。
         size = len(day_tasks)
         return [{key: day_tasks[key] for key in itertools.islice(day_tasks, i, i + 7)} for i in range(0, size, 7)]
@@ -116,98 +109,137 @@ class MonthWithTaskMixin(MonthCalendarMixin):
         """連続したタスク完了日を返す
 
         作成日と完了日からタスクが連続して完了している日を算出する。
+        全履歴を集計するので、表示には get_best_consecutive() を使うこと。
 
         Returns:
             list[dict]
         """
-
-        # 完了したタスクのある日だけ取得（Values_list(flat=True）で取得したリストをset化）
-        done_dates = set(
-            Task.objects.filter(done_at__isnull=False, created_by=self.request.user)
-                .values_list('created_at', flat=True)
-        )
-        # 未完了タスクのある日だけ取得
-        not_done_dates = set(
-            Task.objects.filter(done_at__isnull=True, created_by=self.request.user)
-                .values_list('created_at', flat=True)
-        )
-
-        # ２つのセットの差集合からすべて終わっている日付setを作る
-        all_done_dates = done_dates - not_done_dates
-        # list化してsort
-        sorted_dates = sorted(list(all_done_dates))
-
-        result = []
-        cur_dic = None
-        for i, cur_date in enumerate(sorted_dates):
-            if i == 0:
-                cur_dic = dict(
-                    start_date=cur_date,
-                    end_date=cur_date,
-                    continuous_days=1
-                )
-                continue
-            if cur_date - datetime.timedelta(days=1) == sorted_dates[i - 1]:
-                # 連続
-                cur_dic['end_date'] = cur_date
-                cur_dic['continuous_days'] += 1
-            else:
-                # 途切れた
-                result.append(cur_dic)
-                cur_dic = dict(
-                    start_date=cur_date,
-                    end_date=cur_date,
-                    continuous_days=1
-                )
-        # 最後のcur_dicを追加
-        result.append(cur_dic)
-
-        return result
+        return consecutive.compute_consecutive_days(self.request.user)
 
     def get_best_consecutive(self):
-        """get_consecutive_days()から取得したデータをもとに、
+        """保存済みの連続記録(ConsecutiveRecord)をもとに、
         最高継続記録と現在継続中の記録を返す
 
         Returns:
             dict
         """
-        today = datetime.date.today()
-
-        consecutive_days = self.get_consecutive_days()
-        # print(consecutive_days)
+        record = consecutive.get_consecutive_record(self.request.user)
+        return consecutive.summarize_consecutive_record(record)
 
-        # タスクがない場合は処理から抜ける
-        if consecutive_days == [None]:
-            return
-
-        # 最新の連続記録最終日を取得
-        cur_con_last = consecutive_days[-1]['end_date']
-
-        # 最新の連続記録が、昨日・今日まで続いてたら現在継続中にする
-        if cur_con_last == today - datetime.timedelta(days=1) or cur_con_last == today:
-            current_consecutive_day = consecutive_days[-1]['continuous_days']
-        else:
-            current_consecutive_day = 0
-
-        # 全期間で最大の継続日数を取得
-        most_consecutive_days = []
-        for day in consecutive_days:
-            most_consecutive_days.append(day['continuous_days'])
-
-        return {
-            'current_consecutive_day': current_consecutive_day,
-            'most_consecutive_day': max(most_consecutive_days)
-        }
-
-    def get_month_calendar(self):
+    def build_month_calendar(self):
+        """タスク付きの月間カレンダー情報を作る"""
         calendar_context = super().get_month_calendar()
         month_days = calendar_context['month_days']
         month_first = month_days[0][0]
         month_last = month_days[-1][-1]
+        # アーカイブした月（日ごとの表示では戻さずに、アーカイブから読み取り専用で表示する）
+        archived_months = archives.get_archived_months(self.request.user, month_first, month_last)
+        # 繰り返しのタスクは、カレンダーに表示する範囲の分だけ展開する（アーカイブした月は閉じているので除く）
+        pending = {
+            day: recurrences
+            for day, recurrences in recurring.get_pending_occurrences(self.request.user, month_first, month_last).items()
+            if day.replace(day=1) not in archived_months
+        }
         calendar_context['month_day_tasks'] = self.get_month_tasks(
             month_first,
             month_last,
-            month_days
+            month_days,
+            pending,
         )
+        # まだタスクを作っていない繰り返しの日。日ごとの表示でその日のタスクを作る
+        calendar_context['recurring_days'] = frozenset(pending)
+        calendar_context['archived_months'] = frozenset(archived_months)
         return calendar_context
 
+    def get_month_calendar(self):
+        """タスク付きの月間カレンダー情報を、ユーザー・年月・週の始まりごとのキャッシュから返す"""
+        calendar_context = caches.get_month_calendar(
+            self.request.user.pk,
+            self.get_current_month(),
+            self.first_weekday,
+            self.build_month_calendar,
+        )
+        # 'now' はキャッシュした時点の日付になっているので更新しておく
+        calendar_context['now'] = datetime.date.today()
+        return calendar_context
+
+
+
+class YearWithTaskMixin(BaseCalendarMixin):
+    """タスク付きの、年間ヒートマップを提供するMixin
+
+    1年分の完了度は、1月1日からの日数を添字にしたバイト列で持ち、ユーザー・年ごとにキャッシュする。
+    週の始まり(first_weekday)に合わせた並べ方は、表示のたびにバイト列から計算する。
+    """
+
+    def get_current_year(self):
+        """現在の年を返す"""
+        year = self.kwargs.get('year')
+        return int(year) if year is not None else datetime.date.today().year
+
+    def build_year_heatmap(self, year):
+        """その年の日ごとの完了度(daystatus.LEVEL_*)と、1年分の合計を作る"""
+        start = datetime.date(year, 1, 1)
+        end = datetime.date(year, 12, 31)
+        levels = bytearray((end - start).days + 1)
+        total_tasks = done_tasks = all_done_days = 0
+
+        summaries = DailySummary.objects.filter(
+            user=self.request.user, date__range=(start, end), total__gt=0
+        ).values_list('date', 'total', 'done')
+
+        for day, total, done in summaries:
+            level = daystatus.get_completion_level(total, done)
+            levels[(day - start).days] = level
+            total_tasks += total
+            done_tasks += done
+            if level == daystatus.LEVEL_ALL:
+                all_done_days += 1
+
+        return {
+            'levels': bytes(levels),
+            'total_tasks': total_tasks,
+            'done_tasks': done_tasks,
+            'all_done_days': all_done_days,
+        }
+
+    def get_heatmap_weeks(self, year, levels):
+        """バイト列の完了度を、週ごとの列に並べる
+
+        Returns:
+            list[list]: 週ごとの [(日付, 完了度), ...]。その年ではない日(最初と最後の週の前後)は None
+        """
+        start = datetime.date(year, 1, 1)
+        # 1月1日が週の何番目に来るか
+        offset = (start.weekday() - self.first_weekday) % 7
+        cells = [None] * offset + [
+            (start + datetime.timedelta(days=i), level) for i, level in enumerate(levels)
+        ]
+        cells += [None] * (-len(cells) % 7)
+        return [cells[i:i + 7] for i in range(0, len(cells), 7)]
+
+    def get_year_heatmap(self):
+        """年間ヒートマップ情報の入った辞書を返す"""
+        year = self.get_current_year()
+        heatmap_data = caches.get_year_heatmap(
+            self.request.user.pk, year, lambda: self.build_year_heatmap(year)
+        )
+        weeks = self.get_heatmap_weeks(year, heatmap_data['levels'])
+
+        # 月の1日を含む週の列に、月の見出しを付ける。[(1, [1週目の日...]), (None, [2週目の日...]), ...]
+        heatmap_weeks = []
+        for week in weeks:
+            firsts = [cell[0].month for cell in week if cell is not None and cell[0].day == 1]
+            heatmap_weeks.append((firsts[0] if firsts else None, week))
+
+        return {
+            'now': datetime.date.today(),
+            'year_current': year,
+            'year_previous': year - 1,
+            'year_next': year + 1,
+            'heatmap_weeks': heatmap_weeks,
+            'heatmap_total_tasks': heatmap_data['total_tasks'],
+            'heatmap_done_tasks': heatmap_data['done_tasks'],
+            'heatmap_all_done_days': heatmap_data['all_done_days'],
+            'week_names': self.get_week_names(),
+        }
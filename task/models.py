@@ -3,15 +3,91 @@ from django.conf import settings
 from django.utils import timezone
 
 
+class RecurringTask(models.Model):
+    """繰り返しのタスク（毎日・平日・N日ごと・毎月）
+
+    繰り返しの日のタスク(Task)は前もって作らず、その日を表示した時に task/recurring.py が作る。
+    まだ作っていない日も、月間カレンダーにはタスクがある日として表示する。
+    """
+    DAILY = 'daily'
+    WEEKDAYS = 'weekdays'
+    INTERVAL = 'interval'
+    MONTHLY = 'monthly'
+    RULE_CHOICES = [
+        (DAILY, '毎日'),
+        (WEEKDAYS, '平日'),
+        (INTERVAL, 'N日ごと'),
+        (MONTHLY, '毎月'),
+    ]
+
+    title = models.CharField('タスクの名前', max_length=128)
+    rule = models.CharField('繰り返し', max_length=16, choices=RULE_CHOICES)
+    # rule が INTERVAL の時の間隔（日）
+    interval = models.PositiveSmallIntegerField('間隔（日）', default=1)
+    # 最初の日。毎月の場合は、この日と同じ日（無い月は月末）に繰り返す
+    start_date = models.DateField('開始日')
+    end_date = models.DateField('終了日', null=True, blank=True)
+    created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='recurring_tasks')
+
+    class Meta:
+        db_table = 'recurring_task'
+
+    def __str__(self):
+        return self.title
+
+    @property
+    def rule_label(self):
+        """繰り返し方の説明（「3日ごと」「毎月15日」など）"""
+        if self.rule == self.INTERVAL:
+            return f'{self.interval}日ごと'
+        if self.rule == self.MONTHLY:
+            return f'毎月{self.start_date.day}日'
+        return self.get_rule_display()
+
+
+class RecurringSkip(models.Model):
+    """繰り返しのタスクを削除した日。この日のタスクはもう作らない"""
+    recurrence = models.ForeignKey(RecurringTask, on_delete=models.CASCADE, related_name='skips')
+    date = models.DateField('日付')
+
+    class Meta:
+        db_table = 'recurring_skip'
+        constraints = [
+            models.UniqueConstraint(fields=['recurrence', 'date'], name='recurring_skip_unique'),
+        ]
+
+    def __str__(self):
+        return f'{self.recurrence} {self.date}'
+
+
 class Task(models.Model):
 
     title = models.CharField('タスクの名前', max_length=128)
     done_at = models.DateField('タスク完了日', null=True, blank=True)
     created_at = models.DateField('タスク作成日', default=timezone.now)
     created_by = models.ForeignKey(settings.AUTH_USER_MODEL, verbose_name='このタスクを作った人', on_delete=models.CASCADE)
+    # 繰り返しのタスクから作ったタスクの場合は、その繰り返し（インデックスは下の一意制約のものを使う）
+    recurrence = models.ForeignKey(
+        RecurringTask, verbose_name='繰り返し', on_delete=models.SET_NULL, null=True, blank=True,
+        related_name='tasks', db_index=False,
+    )
+    # 同期用の変更の版。保存するたびに task/sync.py がユーザーごとのカウンターから付ける
+    version = models.BigIntegerField('変更の版', default=0)
 
     class Meta:
         db_table = 'task'
+        indexes = [
+            # 日ごとのタスク・カレンダー・連続記録の集計用。集計はこのインデックスだけで完結する
+            models.Index(fields=['created_by', 'created_at', 'done_at'], name='task_user_day_done_idx'),
+            # 完了済みタスク一覧用
+            models.Index(fields=['created_by', 'done_at'], name='task_user_done_idx'),
+            # 同期用。版がカーソルより大きいものを読む
+            models.Index(fields=['created_by', 'version'], name='task_user_version_idx'),
+        ]
+        constraints = [
+            # 繰り返しのタスクは1日に1つだけ作る（同時に表示しても重複しない）
+            models.UniqueConstraint(fields=['recurrence', 'created_at'], name='task_recurrence_day_unique'),
+        ]
 
     def __str__(self):
         return self.title
@@ -21,10 +97,181 @@ class Comment(models.Model):
     body = models.TextField('コメント')
     created_at = models.DateField('コメント作成日', default=timezone.now)
     created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    # 同期用の変更の版（Task.version と同じ）
+    version = models.BigIntegerField('変更の版', default=0)
 
     class Meta:
         db_table = 'comment'
+        indexes = [
+            models.Index(fields=['created_by', 'version'], name='comment_user_version_idx'),
+        ]
+        constraints = [
+            # メモは1日1つまで
+            models.UniqueConstraint(fields=['created_by', 'created_at'], name='comment_user_day_unique'),
+        ]
 
     def __str__(self):
         return self.body
 
+
+
+class ConsecutiveRecord(models.Model):
+    """タスクの連続完了記録
+
+    毎回全履歴から連続日数を計算しなくて済むように、ユーザーごとに
+    最新の連続期間と最高記録の期間を保持しておく。更新は task/consecutive.py から行う。
+    """
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='consecutive_record'
+    )
+    latest_start = models.DateField('最新の連続期間の開始日', null=True, blank=True)
+    latest_end = models.DateField('最新の連続期間の最終日', null=True, blank=True)
+    best_start = models.DateField('最高記録の開始日', null=True, blank=True)
+    best_end = models.DateField('最高記録の最終日', null=True, blank=True)
+    best_days = models.PositiveIntegerField('最高継続日数', default=0)
+
+    class Meta:
+        db_table = 'consecutive_record'
+
+    def __str__(self):
+        return str(self.user)
+
+    @property
+    def latest_days(self):
+        """最新の連続期間の日数"""
+        if self.latest_end is None:
+            return 0
+        return (self.latest_end - self.latest_start).days + 1
+
+    def in_latest(self, day):
+        return self.latest_end is not None and self.latest_start <= day <= self.latest_end
+
+    def in_best(self, day):
+        return self.best_end is not None and self.best_start <= day <= self.best_end
+
+
+class DailySummary(models.Model):
+    """ユーザーの1日分のタスク・メモの集計
+
+    カレンダー・連続記録・統計はタスクを直接数えずに、この表を読む。
+    タスク・メモの変更時に task/summaries.py から同じトランザクションの中で更新する。
+    タスクもメモも無い日の行は作らない。
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='daily_summaries')
+    date = models.DateField('日付')
+    total = models.PositiveIntegerField('タスク数', default=0)
+    done = models.PositiveIntegerField('完了したタスク数', default=0)
+    has_comment = models.BooleanField('メモの有無', default=False)
+
+    class Meta:
+        db_table = 'daily_summary'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'date'], name='daily_summary_user_date_unique'),
+        ]
+
+    def __str__(self):
+        return f'{self.user} {self.date}'
+
+    @property
+    def all_done(self):
+        """タスクがあり、すべて完了しているか"""
+        return bool(self.total) and self.done == self.total
+
+
+class SearchToken(models.Model):
+    """タスク名・メモの検索用インデックス
+
+    本文を正規化して、1文字と2文字(bigram)ずつに区切ったものを1行ずつ持つ。
+    分かち書きしない日本語でも、部分一致をインデックスで引けるようにするためのもの。
+    更新は task/search.py から行い、タスク・メモを削除すると一緒に削除される。
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='search_tokens')
+    token = models.CharField('トークン', max_length=2)
+    date = models.DateField('日付')
+    task = models.ForeignKey(Task, on_delete=models.CASCADE, null=True, blank=True, related_name='search_tokens')
+    comment = models.ForeignKey(Comment, on_delete=models.CASCADE, null=True, blank=True, related_name='search_tokens')
+
+    class Meta:
+        db_table = 'search_token'
+        indexes = [
+            # 検索用。ユーザーとトークンで絞り込み、新しい順に並べる。候補の検索はこのインデックスだけで完結する
+            models.Index(fields=['user', 'token', 'date', 'task', 'comment'], name='search_token_user_token_idx'),
+        ]
+
+    def __str__(self):
+        return self.token
+
+
+class TaskArchive(models.Model):
+    """古い月のタスク・メモをまとめたアーカイブ
+
+    task/archives.py が、ユーザーの1か月分のタスク・メモを圧縮した1行にまとめ、task / comment の表から消す。
+    日ごとの集計(DailySummary)はそのまま残すので、カレンダー・連続記録・統計はアーカイブを読まずに済む。
+    完了済みタスク一覧は、完了日の範囲(first_done_at〜last_done_at)で読むアーカイブを絞る。
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='task_archives')
+    # 月の1日
+    month = models.DateField('月')
+    # タスク・メモと日ごとの集計を、JSONにしてzlibで圧縮したもの（archives.pack() / unpack()）
+    data = models.BinaryField('データ')
+    task_count = models.PositiveIntegerField('タスク数', default=0)
+    done_count = models.PositiveIntegerField('完了したタスク数', default=0)
+    comment_count = models.PositiveIntegerField('メモ数', default=0)
+    first_done_at = models.DateField('最初の完了日', null=True, blank=True)
+    last_done_at = models.DateField('最後の完了日', null=True, blank=True)
+    archived_at = models.DateTimeField('アーカイブした日時', auto_now=True)
+    # 中のタスク・メモの版の最大値。同期ではアーカイブの中身をこの版の変更として返す
+    version = models.BigIntegerField('変更の版', default=0)
+
+    class Meta:
+        db_table = 'task_archive'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'month'], name='task_archive_user_month_unique'),
+        ]
+
+    def __str__(self):
+        return f'{self.user} {self.month:%Y-%m}'
+
+
+class ChangeCounter(models.Model):
+    """ユーザーごとの変更の版のカウンター
+
+    タスク・メモの保存・削除のたびに task/sync.py が1つ進め、その値を Task.version などに付ける。
+    進める時の行ロックはトランザクションの終わりまで続くので、版はコミットの順に並ぶ。
+    """
+    user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='change_counter')
+    value = models.BigIntegerField('最後に付けた版', default=0)
+
+    class Meta:
+        db_table = 'change_counter'
+
+    def __str__(self):
+        return f'{self.user} {self.value}'
+
+
+class Tombstone(models.Model):
+    """削除したタスク・メモの記録
+
+    同期するクライアントに削除を伝えるため、削除した時の版と一緒に残しておく。
+    """
+    TASK = 'task'
+    COMMENT = 'comment'
+    KIND_CHOICES = [
+        (TASK, 'タスク'),
+        (COMMENT, 'メモ'),
+    ]
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='tombstones')
+    kind = models.CharField('種類', max_length=8, choices=KIND_CHOICES)
+    object_id = models.BigIntegerField('ID')
+    version = models.BigIntegerField('変更の版')
+    deleted_at = models.DateTimeField('削除した日時', auto_now_add=True)
+
+    class Meta:
+        db_table = 'tombstone'
+        indexes = [
+            models.Index(fields=['user', 'version'], name='tombstone_user_version_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.kind} {self.object_id}'
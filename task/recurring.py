@@ -0,0 +1,148 @@
+"""繰り返しのタスク
+
+繰り返し(RecurringTask)の日のタスクは前もって作らず、表示する範囲の分だけをその場で展開する。
+
+- 月間カレンダーは get_pending_occurrences() で、まだタスクを作っていない繰り返しの日を求めて、
+  未完了のタスクとして数に足す。繰り返しがいくつあってもクエリは最大3回で済む。
+- 日ごとの表示では materialize() でその日のタスク(Task)を作る。作った後の完了の切り替え・削除は
+  普通のタスクと同じで、日ごとの集計や連続記録もシグナルから更新される。
+- 繰り返しのタスクを削除した日は RecurringSkip に記録し、もう作らない。
+
+繰り返しを追加・停止した時は caches.touch_recurring() で、キャッシュした月間カレンダーを作り直させる。
+"""
+import calendar
+import datetime
+
+from django.db import transaction
+
+from . import caches
+from .models import RecurringSkip, RecurringTask, Task
+from .summaries import deferred_refresh
+from .sync import deferred_tombstones
+
+
+def occurs_on(recurrence, day):
+    """その日が繰り返しの日か"""
+    if day < recurrence.start_date or (recurrence.end_date and day > recurrence.end_date):
+        return False
+
+    if recurrence.rule == RecurringTask.DAILY:
+        return True
+    if recurrence.rule == RecurringTask.WEEKDAYS:
+        return day.weekday() < 5
+    if recurrence.rule == RecurringTask.INTERVAL:
+        return (day - recurrence.start_date).days % max(recurrence.interval, 1) == 0
+    if recurrence.rule == RecurringTask.MONTHLY:
+        # 開始日と同じ日。その日が無い月（31日など）は月末にする
+        last_day = calendar.monthrange(day.year, day.month)[1]
+        return day.day == min(recurrence.start_date.day, last_day)
+    return False
+
+
+def get_occurrences(recurrence, start, end):
+    """start〜endのうち、繰り返しの日のリストを返す"""
+    day = max(start, recurrence.start_date)
+    last = min(end, recurrence.end_date) if recurrence.end_date else end
+
+    days = []
+    while day <= last:
+        if occurs_on(recurrence, day):
+            days.append(day)
+        day += datetime.timedelta(days=1)
+    return days
+
+
+def get_recurrences(user, start, end):
+    """start〜endに繰り返しの日がありうる、ユーザーの繰り返しを返す"""
+    return list(
+        RecurringTask.objects.filter(created_by=user, start_date__lte=end).exclude(end_date__lt=start)
+    )
+
+
+def get_pending_occurrences(user, start, end):
+    """start〜endの、まだタスクを作っていない繰り返しの日を {日付: [繰り返し, ...]} で返す
+
+    繰り返しの数によらず、クエリは繰り返し・作成済みのタスク・削除した日の最大3回。
+    """
+    recurrences = get_recurrences(user, start, end)
+    if not recurrences:
+        return {}
+
+    created = set(
+        Task.objects.filter(created_by=user, created_at__range=(start, end), recurrence__isnull=False)
+            .values_list('recurrence_id', 'created_at')
+    )
+    created |= set(
+        RecurringSkip.objects.filter(recurrence__in=recurrences, date__range=(start, end))
+            .values_list('recurrence_id', 'date')
+    )
+
+    pending = {}
+    for recurrence in recurrences:
+        for day in get_occurrences(recurrence, start, end):
+            if (recurrence.pk, day) not in created:
+                pending.setdefault(day, []).append(recurrence)
+    return pending
+
+
+def materialize(user, day):
+    """その日の、まだ作っていない繰り返しのタスクを作る。作ったタスクのリストを返す"""
+    pending = get_pending_occurrences(user, day, day).get(day)
+    if not pending:
+        return []
+
+    created = []
+    # 集計の更新は1回にまとめる
+    with transaction.atomic(), deferred_refresh():
+        for recurrence in pending:
+            # 同時に同じ日を表示しても、一意制約で1つしか作られない
+            task, was_created = Task.objects.get_or_create(
+                recurrence=recurrence,
+                created_at=day,
+                defaults={'title': recurrence.title, 'created_by': user},
+            )
+            if was_created:
+                created.append(task)
+    return created
+
+
+def create_recurring_task(user, title, rule, interval, start_date):
+    """繰り返しを追加する。start_date が繰り返しの日なら、その日のタスクも作る"""
+    with transaction.atomic():
+        recurrence = RecurringTask.objects.create(
+            created_by=user, title=title, rule=rule, interval=interval, start_date=start_date
+        )
+        caches.touch_recurring(user.pk)
+        materialize(user, start_date)
+    return recurrence
+
+
+def stop_recurring_task(recurrence, today=None):
+    """繰り返しを今日から止める。今日以降に作った、未完了のタスクは削除する"""
+    today = today or datetime.date.today()
+    with transaction.atomic(), deferred_refresh(), deferred_tombstones():
+        Task.objects.filter(recurrence=recurrence, created_at__gte=today, done_at__isnull=True).delete()
+        if recurrence.start_date >= today:
+            # まだ始まっていない繰り返しは、まるごと削除する
+            recurrence.delete()
+        else:
+            recurrence.end_date = today - datetime.timedelta(days=1)
+            recurrence.save(update_fields=['end_date'])
+        caches.touch_recurring(recurrence.created_by_id)
+
+
+def skip_occurrence(task):
+    """繰り返しのタスクを削除する時に、その日のタスクをもう作らないように記録する"""
+    if task.recurrence_id is not None:
+        RecurringSkip.objects.get_or_create(recurrence_id=task.recurrence_id, date=task.created_at)
+
+
+def skip_occurrences(tasks):
+    """skip_occurrence() のまとめて版。削除するタスクのクエリセットを受け取る"""
+    RecurringSkip.objects.bulk_create(
+        [
+            RecurringSkip(recurrence_id=recurrence_id, date=day)
+            for recurrence_id, day in tasks.filter(recurrence__isnull=False).values_list('recurrence_id', 'created_at')
+        ],
+        ignore_conflicts=True,
+    )
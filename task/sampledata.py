@@ -0,0 +1,85 @@
+"""それらしいタスク・メモの履歴を作る
+
+負荷試験用のデータ(seed_loadコマンド)などで使う。乱数はrandom.Randomを渡すので、
+同じシードなら同じデータになる。
+"""
+import datetime
+
+from . import sync
+from .models import Task, Comment
+
+TASK_TITLES = [
+    '読書30分', '英語の勉強', 'ジョギング', '筋トレ', '部屋の掃除', '洗濯', '買い物', '日記を書く',
+    'メールの返信', '企画書を作る', '会議の準備', 'プログラミングの勉強', 'ブログを書く', '料理',
+    'ストレッチ', '家計簿をつける', '資格の勉強', '散歩', 'ピアノの練習', '早起きする',
+]
+COMMENT_BODIES = [
+    '今日は思ったより読書できた 😃', '少し疲れたので早めに寝る', '明日はもっと頑張る',
+    '集中できた一日だった', '雨だったので家で過ごした', '久しぶりに運動した',
+]
+
+# 曜日(月〜日)ごとの、タスクのある日の割合
+ACTIVE_RATE = [0.85, 0.85, 0.85, 0.85, 0.8, 0.6, 0.55]
+# 1日のタスク数と、その重み
+TASKS_PER_DAY = [1, 2, 3, 4, 5, 6, 8, 12]
+TASKS_PER_DAY_WEIGHTS = [10, 20, 25, 20, 12, 7, 4, 2]
+# 過去のタスクが完了している割合
+DONE_RATE = 0.85
+# タスクのある日にメモがある割合
+COMMENT_RATE = 0.3
+
+
+def generate_history(user, start, end, rng, today=None):
+    """start〜endの日ごとに、未保存のTaskとCommentを作って返す
+
+    今日より後の日のタスクは未完了、今日のタスクは半分ほど完了にする。
+
+    Yields:
+        Task | Comment
+    """
+    today = today or datetime.date.today()
+    day = start
+    while day <= end:
+        if rng.random() < ACTIVE_RATE[day.weekday()]:
+            count = rng.choices(TASKS_PER_DAY, TASKS_PER_DAY_WEIGHTS)[0]
+            if day < today:
+                done_rate = DONE_RATE
+            elif day == today:
+                done_rate = 0.5
+            else:
+                done_rate = 0
+            for _ in range(count):
+                yield Task(
+                    title=rng.choice(TASK_TITLES),
+                    created_at=day,
+                    done_at=day if rng.random() < done_rate else None,
+                    created_by=user,
+                )
+            if day <= today and rng.random() < COMMENT_RATE:
+                yield Comment(body=rng.choice(COMMENT_BODIES), created_at=day, created_by=user)
+        day += datetime.timedelta(days=1)
+
+
+def bulk_create_history(objects, batch_size=5000):
+    """generate_history() の結果をまとめて保存する。保存した (タスク数, メモ数) を返す"""
+    tasks, comments = [], []
+    task_count = comment_count = 0
+    for obj in objects:
+        if isinstance(obj, Task):
+            tasks.append(obj)
+        else:
+            comments.append(obj)
+        if len(tasks) >= batch_size:
+            sync.assign_versions(tasks)
+            Task.objects.bulk_create(tasks)
+            task_count += len(tasks)
+            tasks = []
+        if len(comments) >= batch_size:
+            sync.assign_versions(comments)
+            Comment.objects.bulk_create(comments, ignore_conflicts=True)
+            comment_count += len(comments)
+            comments = []
+    sync.assign_versions([*tasks, *comments])
+    Task.objects.bulk_create(tasks)
+    Comment.objects.bulk_create(comments, ignore_conflicts=True)
+    return task_count + len(tasks), comment_count + len(comments)
@@ -0,0 +1,171 @@
+"""タスク名・メモの検索
+
+本文をNFKCで正規化・小文字化し、1文字と2文字(bigram)のトークンに区切って SearchToken に保存しておく。
+検索語も同じように区切り、すべてのトークンを含むタスク・メモをインデックスから探す。
+bigramだけでは「東京都」で「京都から東京」にも一致してしまうので、最後に本文に検索語が含まれるかを確かめる。
+
+タスク・メモの保存時は signals.py から update_search_index() を呼ぶ。削除時はカスケードで消える。
+bulk_create などシグナルが送られない処理の後は、rebuild_search_index() を呼ぶこと。
+"""
+import unicodedata
+
+from django.db import transaction
+from django.db.models import Count
+
+from . import caches
+from .models import Task, Comment, SearchToken
+
+# 1ページに表示する件数
+PAGE_SIZE = 20
+# 検索語の最大の長さ
+MAX_QUERY_LENGTH = 100
+
+
+def normalize(text):
+    """全角・半角、大文字・小文字の違いをなくす"""
+    return unicodedata.normalize('NFKC', text).lower()
+
+
+def term_tokens(term):
+    """正規化済みの1語を、検索用のトークンにする（1文字ならそのまま、2文字以上ならbigram）"""
+    if len(term) == 1:
+        return {term}
+    return {term[i:i + 2] for i in range(len(term) - 1)}
+
+
+def tokenize(text):
+    """本文から、保存するトークン（1文字とbigram）の集合を作る"""
+    tokens = set()
+    for word in normalize(text).split():
+        tokens.update(word)
+        tokens.update(term_tokens(word))
+    return tokens
+
+
+def get_text(obj):
+    return obj.title if isinstance(obj, Task) else obj.body
+
+
+def get_tokens_of(obj):
+    """そのタスク・メモの、保存済みのトークン"""
+    if isinstance(obj, Task):
+        return SearchToken.objects.filter(task=obj)
+    return SearchToken.objects.filter(comment=obj)
+
+
+def make_tokens(obj, tokens):
+    owner = {'task': obj} if isinstance(obj, Task) else {'comment': obj}
+    return [SearchToken(user_id=obj.created_by_id, token=token, date=obj.created_at, **owner) for token in tokens]
+
+
+def update_search_index(obj):
+    """タスク・メモのトークンを、本文に合わせて追加・削除する
+
+    完了・未完了の切り替えのように本文が変わらない保存では、読み込みの1クエリだけで終わる。
+    """
+    tokens = tokenize(get_text(obj))
+    stored = get_tokens_of(obj)
+    existing = dict(stored.values_list('token', 'date'))
+    day = caches.to_date(obj.created_at)
+
+    with transaction.atomic():
+        removed = existing.keys() - tokens
+        if removed:
+            stored.filter(token__in=removed).delete()
+        if any(date != day for token, date in existing.items() if token not in removed):
+            stored.update(date=day)
+        SearchToken.objects.bulk_create(make_tokens(obj, tokens - existing.keys()))
+
+
+def rebuild_search_index(user, start=None, end=None):
+    """start〜end（省略時は全期間）のタスク・メモのトークンを作り直す。作ったトークン数を返す"""
+    lookup = {'created_by': user}
+    if start:
+        lookup['created_at__gte'] = start
+    if end:
+        lookup['created_at__lte'] = end
+
+    stored = SearchToken.objects.filter(user=user)
+    if start:
+        stored = stored.filter(date__gte=start)
+    if end:
+        stored = stored.filter(date__lte=end)
+
+    count = 0
+    with transaction.atomic():
+        stored.delete()
+        for model in (Task, Comment):
+            batch = []
+            for obj in model.objects.filter(**lookup).iterator():
+                batch += make_tokens(obj, tokenize(get_text(obj)))
+                if len(batch) >= 1000:
+                    SearchToken.objects.bulk_create(batch)
+                    count += len(batch)
+                    batch = []
+            SearchToken.objects.bulk_create(batch)
+            count += len(batch)
+    return count
+
+
+def parse_query(query):
+    """検索語を正規化して、空白で区切った語のリストにする"""
+    return normalize(query[:MAX_QUERY_LENGTH]).split()
+
+
+def find_candidates(user, terms):
+    """すべての語のトークンを含むタスク・メモを、新しい順に (日付, タスクID, メモID, 一致したトークン数) で返すクエリセット"""
+    tokens = set()
+    for term in terms:
+        tokens |= term_tokens(term)
+
+    return (
+        SearchToken.objects.filter(user=user, token__in=tokens)
+            .values_list('date', 'task', 'comment')
+            .annotate(matched=Count('token', distinct=True))
+            .filter(matched=len(tokens))
+            .order_by('-date', 'task', 'comment')
+    )
+
+
+def search(user, query, offset=0):
+    """検索して、(結果のリスト, 次のページのoffset) を返す。次のページが無ければoffsetはNone
+
+    インデックスで見つけた候補を PAGE_SIZE 件ずつ読み、本文に検索語がすべて含まれるものだけを返す。
+    offset は結果の件数ではなく、候補を何件目まで読んだか。
+    """
+    terms = parse_query(query)
+    if not terms:
+        return [], None
+
+    candidates = find_candidates(user, terms)
+    results = []
+    while len(results) < PAGE_SIZE:
+        chunk = list(candidates[offset:offset + PAGE_SIZE])
+        last_chunk = len(chunk) < PAGE_SIZE
+        chunk_end = offset + len(chunk)
+
+        tasks = Task.objects.in_bulk([task_id for _, task_id, _, _ in chunk if task_id])
+        comments = Comment.objects.in_bulk([comment_id for _, _, comment_id, _ in chunk if comment_id])
+
+        for day, task_id, comment_id, _ in chunk:
+            offset += 1
+            obj = tasks.get(task_id) if task_id else comments.get(comment_id)
+            if obj is None:
+                continue
+            text = get_text(obj)
+            normalized = normalize(text)
+            if all(term in normalized for term in terms):
+                results.append({
+                    'kind': 'task' if task_id else 'comment',
+                    'date': day,
+                    'text': text,
+                    'done': task_id is not None and obj.done_at is not None,
+                })
+                if len(results) >= PAGE_SIZE:
+                    break
+
+        if last_chunk and offset == chunk_end:
+            # 候補をすべて読み終えた
+            return results, None
+
+    return results, offset
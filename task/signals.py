@@ -0,0 +1,54 @@
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete
+from django.dispatch import receiver
+
+from . import caches, search, summaries, sync
+from .models import Task, Comment
+
+
+@receiver(pre_save, sender=Task)
+@receiver(pre_delete, sender=Task)
+@receiver(pre_save, sender=Comment)
+@receiver(pre_delete, sender=Comment)
+def lock_daily_summary(sender, instance, **kwargs):
+    """書き込む日の集計の行を先にロックする（変更の版を付けるより前に呼ばれるように、先に登録する）"""
+    summaries.day_will_change(instance.created_by_id, instance.created_at)
+
+
+@receiver(post_save, sender=Task)
+@receiver(post_delete, sender=Task)
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def refresh_daily_summary(sender, instance, **kwargs):
+    """タスク・メモが変更された日の集計（と連続記録）を、同じトランザクションの中で更新する"""
+    summaries.day_changed(instance.created_by_id, instance.created_at)
+
+
+@receiver(post_save, sender=Task)
+@receiver(post_delete, sender=Task)
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def invalidate_task_caches(sender, instance, **kwargs):
+    """タスク・メモが変更された日を含む、月間カレンダー・ヒートマップと統計のキャッシュを削除する"""
+    caches.invalidate_task_days(instance.created_by_id, instance.created_at)
+
+
+@receiver(post_save, sender=Task)
+@receiver(post_save, sender=Comment)
+def update_search_index(sender, instance, **kwargs):
+    """タスク名・メモの検索用トークンを更新する（削除時はカスケードで消える）"""
+    search.update_search_index(instance)
+
+
+@receiver(pre_save, sender=Task)
+@receiver(pre_save, sender=Comment)
+def assign_change_version(sender, instance, **kwargs):
+    """同期用に、保存するタスク・メモに新しい変更の版を付ける"""
+    sync.touch(instance)
+
+
+@receiver(post_delete, sender=Task)
+@receiver(post_delete, sender=Comment)
+def record_tombstone(sender, instance, **kwargs):
+    """同期用に、削除したタスク・メモの記録を残す"""
+    sync.record_deletion(instance)
+
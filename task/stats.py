@@ -0,0 +1,122 @@
+"""完了率などの統計
+
+週ごと・月ごと・曜日ごとの集計は、日ごとの集計(DailySummary)をDB側で TruncWeek / TruncMonth などで
+まとめて求める。どれも期間を区切ったクエリなので、履歴が何年分あっても読む行数は変わらない。
+結果はユーザーごとにキャッシュし、タスク・メモの変更時に caches.invalidate_task_days() で削除する。
+"""
+import datetime
+
+from django.db.models import Count, Sum
+from django.db.models.functions import ExtractIsoWeekDay, TruncMonth, TruncWeek
+
+from . import caches
+from .models import DailySummary
+
+# 表示する週数・月数
+WEEKS = 12
+MONTHS = 12
+# 曜日ごとの集計に使う日数
+WEEKDAY_DAYS = 365
+
+WEEKDAY_NAMES = ['月', '火', '水', '木', '金', '土', '日']
+
+
+def get_rate(done, total):
+    """完了率(%)を返す。タスクが無ければNone"""
+    return round(done * 100 / total) if total else None
+
+
+def summarize_buckets(user, start, end, trunc):
+    """start〜endの集計を trunc(TruncWeek など)でまとめて、{期間の初日: 集計} を返す"""
+    rows = (
+        DailySummary.objects.filter(user=user, date__range=(start, end), total__gt=0)
+            .annotate(bucket=trunc('date'))
+            .values('bucket')
+            .annotate(total=Sum('total'), done=Sum('done'), days=Count('id'))
+            .order_by()
+    )
+    return {row['bucket']: row for row in rows}
+
+
+def make_bucket(start, row):
+    """1期間分の集計を、テンプレートやJSONで使う辞書にする"""
+    total = row['total'] if row else 0
+    done = row['done'] if row else 0
+    days = row['days'] if row else 0
+    return {
+        'start': start,
+        'total': total,
+        'done': done,
+        'rate': get_rate(done, total),
+        # タスクがあった日の、1日あたりのタスク数
+        'tasks_per_day': round(total / days, 1) if days else None,
+    }
+
+
+def get_weekly_stats(user, today):
+    """直近WEEKS週間の、週ごとの完了率を古い順に返す（週は月曜始まり）"""
+    this_week = today - datetime.timedelta(days=today.weekday())
+    weeks = [this_week - datetime.timedelta(weeks=i) for i in reversed(range(WEEKS))]
+    rows = summarize_buckets(user, weeks[0], today, TruncWeek)
+    return [make_bucket(week, rows.get(week)) for week in weeks]
+
+
+def get_monthly_stats(user, today):
+    """直近MONTHSか月の、月ごとの完了率と1日あたりのタスク数を古い順に返す"""
+    months = [today.replace(day=1)]
+    for _ in range(MONTHS - 1):
+        months.insert(0, (months[0] - datetime.timedelta(days=1)).replace(day=1))
+    rows = summarize_buckets(user, months[0], today, TruncMonth)
+    return [make_bucket(month, rows.get(month)) for month in months]
+
+
+def get_weekday_stats(user, today):
+    """直近WEEKDAY_DAYS日の、曜日ごとの完了率を月曜から順に返す"""
+    rows = (
+        DailySummary.objects.filter(
+            user=user, date__range=(today - datetime.timedelta(days=WEEKDAY_DAYS - 1), today), total__gt=0
+        )
+            .annotate(weekday=ExtractIsoWeekDay('date'))
+            .values('weekday')
+            .annotate(total=Sum('total'), done=Sum('done'), days=Count('id'))
+            .order_by()
+    )
+    by_weekday = {row['weekday']: row for row in rows}
+
+    result = []
+    for weekday, name in enumerate(WEEKDAY_NAMES, start=1):
+        bucket = make_bucket(None, by_weekday.get(weekday))
+        bucket['name'] = name
+        result.append(bucket)
+    return result
+
+
+def get_best_weekdays(weekday_stats):
+    """完了率が一番高い曜日の名前のリストを返す"""
+    rates = [stat['rate'] for stat in weekday_stats if stat['rate'] is not None]
+    if not rates:
+        return []
+    best = max(rates)
+    return [stat['name'] for stat in weekday_stats if stat['rate'] == best]
+
+
+def build_stats(user):
+    """統計をすべて作る"""
+    today = datetime.date.today()
+    weekday_stats = get_weekday_stats(user, today)
+    totals = DailySummary.objects.filter(user=user).aggregate(total=Sum('total'), done=Sum('done'))
+    return {
+        'today': today,
+        'total': totals['total'] or 0,
+        'done': totals['done'] or 0,
+        'rate': get_rate(totals['done'] or 0, totals['total'] or 0),
+        'weekly': get_weekly_stats(user, today),
+        'monthly': get_monthly_stats(user, today),
+        'weekdays': weekday_stats,
+        'best_weekdays': get_best_weekdays(weekday_stats),
+    }
+
+
+def get_stats(user):
+    """キャッシュ済みの統計を返す"""
+    return caches.get_stats(user.pk, lambda: build_stats(user))
@@ -0,0 +1,207 @@
+"""日ごとの集計(DailySummary)の更新
+
+タスク・メモが保存・削除されると、signals.py から day_changed() が呼ばれ、その日の集計を
+Task / Comment から数え直す。その日が「すべて完了した日」かどうかが変わった時だけ、連続記録も更新する。
+
+同じ日に同時に書き込まれても古い数で上書きしないように、書き込む前に day_will_change() で
+その日の集計の行をロックし（無ければ0件の行を作る）、数え直す時はロックする読み込みで数える。
+同じ日の書き込みは先にこのロックを待つので、数え直しが他のトランザクションの書き込みを待つことはない。
+タスク・メモの書き込みはトランザクションの中で行うこと。
+
+まとめて何件も変更する処理は deferred_refresh() の中で行うと、日ごとに1回だけ数え直す。
+bulk_create / QuerySet.update() などシグナルが送られない処理の後は、refresh_day() か
+rebuild_daily_summaries() を直接呼ぶこと。
+
+アーカイブした月(archives.py)の集計はそのまま残し、作り直す時はアーカイブにある集計を足す。
+"""
+import threading
+from contextlib import contextmanager
+
+from django.contrib.auth import get_user_model
+from django.db import IntegrityError, transaction
+from django.db.models import Count
+
+from . import archives, caches
+from .consecutive import update_consecutive_record
+from .models import Task, Comment, DailySummary
+
+_local = threading.local()
+
+# skip_refresh() の中であることを表す
+_SKIP = object()
+
+
+def count_day(user_id, day):
+    """Task / Comment からその日の (タスク数, 完了数, メモの有無) を数える
+
+    ロックする読み込みにして、トランザクションを始めた時点ではなく、最新のコミット済みの行を数える。
+    """
+    tasks = Task.objects.select_for_update().filter(created_by_id=user_id, created_at=day)
+    comments = Comment.objects.select_for_update().filter(created_by_id=user_id, created_at=day)
+    done_dates = list(tasks.values_list('done_at', flat=True))
+    has_comment = bool(comments.values_list('pk')[:1])
+    return len(done_dates), sum(done_at is not None for done_at in done_dates), has_comment
+
+
+def lock_day(user_id, day):
+    """その日の集計の行を（無ければ0件で作って）トランザクションの終わりまでロックし、返す"""
+    summaries = DailySummary.objects.select_for_update().filter(user_id=user_id, date=day)
+    summary = summaries.first()
+    if summary is None:
+        try:
+            with transaction.atomic():
+                summary = DailySummary.objects.create(user_id=user_id, date=day)
+        except IntegrityError:
+            # 同時に作られた時は、相手のコミットを待ってからロックする
+            summary = summaries.get()
+    return summary
+
+
+def refresh_day(user_id, day):
+    """その日の集計を数え直して保存し、必要なら連続記録も更新する"""
+    day = caches.to_date(day)
+
+    with transaction.atomic():
+        summary = lock_day(user_id, day)
+        was_all_done = summary.all_done
+        total, done, has_comment = count_day(user_id, day)
+
+        if not total and not has_comment:
+            summary.delete()
+            summary = None
+        elif (summary.total, summary.done, summary.has_comment) != (total, done, has_comment):
+            summary.total, summary.done, summary.has_comment = total, done, has_comment
+            summary.save(update_fields=['total', 'done', 'has_comment'])
+
+        # 「すべて完了した日」かどうかが変わった時だけ、連続記録を更新する
+        if was_all_done != (summary is not None and summary.all_done):
+            update_consecutive_record(get_user_model()(pk=user_id), day)
+
+    return summary
+
+
+def day_will_change(user_id, day):
+    """その日のタスク・メモを書き込む前に、集計の行をロックする（signals.pyから呼ぶ）"""
+    pending = getattr(_local, 'pending', None)
+    if pending is _SKIP:
+        return
+    key = (user_id, caches.to_date(day))
+    # まとめて変更している時は、1日に1回だけロックする
+    if pending is None or key not in pending:
+        lock_day(*key)
+        if pending is not None:
+            pending.add(key)
+
+
+def day_changed(user_id, day):
+    """その日のタスク・メモが変更されたことを知らせる（signals.pyから呼ぶ）"""
+    pending = getattr(_local, 'pending', None)
+    if pending is _SKIP:
+        return
+    if pending is None:
+        refresh_day(user_id, day)
+    else:
+        pending.add((user_id, caches.to_date(day)))
+
+
+@contextmanager
+def deferred_refresh():
+    """ブロックの中の変更による集計の更新を、ブロックの最後に日ごとに1回だけ行う"""
+    if getattr(_local, 'pending', None) is not None:
+        # すでに外側で遅らせている場合は、外側に任せる
+        yield
+        return
+
+    _local.pending = set()
+    try:
+        yield
+    finally:
+        pending, _local.pending = _local.pending, None
+        for user_id, day in sorted(pending):
+            refresh_day(user_id, day)
+
+
+@contextmanager
+def skip_refresh():
+    """ブロックの中の変更では集計を更新しない（アーカイブのように、集計が変わらないとわかっている処理用）"""
+    outer = getattr(_local, 'pending', None)
+    _local.pending = _SKIP
+    try:
+        yield
+    finally:
+        _local.pending = outer
+
+
+def count_days(user, start=None, end=None):
+    """Task / Comment を日ごとにまとめて数え、アーカイブの集計を足して {日付: (タスク数, 完了数, メモの有無)} を返す"""
+    lookup = {'created_by': user}
+    if start:
+        lookup['created_at__gte'] = start
+    if end:
+        lookup['created_at__lte'] = end
+
+    task_counts = (
+        Task.objects.filter(**lookup)
+            .values('created_at')
+            .annotate(total=Count('id'), done=Count('done_at'))
+            .order_by()
+    )
+    comment_dates = set(Comment.objects.filter(**lookup).values_list('created_at', flat=True))
+
+    days = {row['created_at']: (row['total'], row['done'], row['created_at'] in comment_dates) for row in task_counts}
+    for day in comment_dates - days.keys():
+        days[day] = (0, 0, True)
+
+    for day, (total, done, has_comment) in archives.get_archived_days(user, start, end).items():
+        hot_total, hot_done, hot_comment = days.get(day, (0, 0, False))
+        days[day] = (hot_total + total, hot_done + done, hot_comment or has_comment)
+    return days
+
+
+def stored_days(user, start=None, end=None):
+    """保存済みの集計を {日付: (タスク数, 完了数, メモの有無)} で返す"""
+    summaries = DailySummary.objects.filter(user=user)
+    if start:
+        summaries = summaries.filter(date__gte=start)
+    if end:
+        summaries = summaries.filter(date__lte=end)
+    return {
+        day: (total, done, has_comment)
+        for day, total, done, has_comment in summaries.values_list('date', 'total', 'done', 'has_comment')
+    }
+
+
+def rebuild_daily_summaries(user, start=None, end=None):
+    """start〜end（省略時は全期間）の集計を、Task / Comment から作り直す。作った行数を返す
+
+    連続記録は更新しないので、必要なら後で rebuild_consecutive_record() を呼ぶこと。
+    """
+    days = count_days(user, start, end)
+
+    summaries = DailySummary.objects.filter(user=user)
+    if start:
+        summaries = summaries.filter(date__gte=start)
+    if end:
+        summaries = summaries.filter(date__lte=end)
+
+    with transaction.atomic():
+        summaries.delete()
+        DailySummary.objects.bulk_create(
+            [
+                DailySummary(user=user, date=day, total=total, done=done, has_comment=has_comment)
+                for day, (total, done, has_comment) in days.items()
+            ],
+            batch_size=1000,
+        )
+    return len(days)
+
+
+def verify_daily_summaries(user, start=None, end=None):
+    """保存済みの集計とTask / Commentを比べて、食い違っている日の [(日付, 保存済み, 正しい値)] を返す"""
+    expected = count_days(user, start, end)
+    stored = stored_days(user, start, end)
+    return [
+        (day, stored.get(day), expected.get(day))
+        for day in sorted(expected.keys() | stored.keys())
+        if stored.get(day) != expected.get(day)
+    ]
@@ -0,0 +1,211 @@
+"""オフラインのクライアント向けの差分同期
+
+タスク・メモには保存するたびに、ユーザーごとのカウンター(ChangeCounter)から変更の版(version)を付け、
+削除した時は削除の記録(Tombstone)を版と一緒に残す。クライアントは前回の同期で受け取ったカーソル（版）を送り、
+それより新しい版の変更だけを受け取る。
+
+- 版はトランザクションの終わりまでカウンターの行をロックして付けるので、コミットの順に並ぶ。
+  タスク・メモの保存はトランザクションの中で行うこと（後から小さい版がコミットされて、読み飛ばされないように）。
+- 保存は signals.py から touch()、削除は record_deletion() を呼ぶ。bulk_create の前は assign_versions()、
+  QuerySet.update() では next_version() の値を version に入れる。
+- アーカイブ(archives.py)は版を変えずにタスク・メモを移すだけなので、削除の記録を残さない。
+  アーカイブの中身は、アーカイブの版の変更として返す。
+- ユーザーを削除する時にカスケードで消えるタスク・メモは、同期する相手がいないので削除の記録を残さない。
+"""
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Max
+
+from . import archives
+from .models import ChangeCounter, Comment, Task, TaskArchive, Tombstone
+
+# 1回の同期で返す変更の数の目安（同じ版の変更は途中で区切らないので、少し超えることがある）
+PAGE_SIZE = getattr(settings, 'SYNC_PAGE_SIZE', 500)
+
+_local = threading.local()
+
+# skip_tombstones() の中であることを表す
+_SKIP = object()
+
+
+def get_max_version(user_id):
+    """カウンターが無いユーザーの、今までに付いている版の最大値"""
+    versions = [
+        Task.objects.filter(created_by_id=user_id).aggregate(version=Max('version'))['version'],
+        Comment.objects.filter(created_by_id=user_id).aggregate(version=Max('version'))['version'],
+        TaskArchive.objects.filter(user_id=user_id).aggregate(version=Max('version'))['version'],
+        Tombstone.objects.filter(user_id=user_id).aggregate(version=Max('version'))['version'],
+    ]
+    return max((version for version in versions if version is not None), default=0)
+
+
+def next_version(user_id, count=1):
+    """ユーザーのカウンターを count 進めて、最後の版を返す（count 個の版 [戻り値 - count + 1, 戻り値] を使える）"""
+    counters = ChangeCounter.objects.filter(user_id=user_id)
+    # 呼び出し側のトランザクションの中で使うので、セーブポイントは作らない
+    with transaction.atomic(savepoint=False):
+        if not counters.update(value=F('value') + count):
+            ChangeCounter.objects.get_or_create(user_id=user_id, defaults={'value': get_max_version(user_id)})
+            counters.update(value=F('value') + count)
+        return counters.values_list('value', flat=True).get()
+
+
+def touch(obj):
+    """保存する前のタスク・メモに、新しい版を付ける"""
+    obj.version = next_version(obj.created_by_id)
+
+
+def assign_versions(objects, user_field='created_by_id'):
+    """bulk_create する前のタスク・メモ（や削除の記録）に、1つずつ別の版を付ける"""
+    by_user = {}
+    for obj in objects:
+        by_user.setdefault(getattr(obj, user_field), []).append(obj)
+    for user_id, user_objects in by_user.items():
+        last = next_version(user_id, len(user_objects))
+        for version, obj in enumerate(user_objects, start=last - len(user_objects) + 1):
+            obj.version = version
+
+
+def make_tombstone(obj):
+    kind = Tombstone.TASK if isinstance(obj, Task) else Tombstone.COMMENT
+    return Tombstone(user_id=obj.created_by_id, kind=kind, object_id=obj.pk)
+
+
+def record_deletion(obj):
+    """削除したタスク・メモの記録を残す（signals.pyから呼ぶ）"""
+    pending = getattr(_local, 'pending', None)
+    if pending is _SKIP or obj.created_by_id in getattr(_local, 'deleting_users', ()):
+        return
+    # QuerySet.delete() はシグナルを送った後に pk を None にするので、ここで記録を作っておく
+    tombstone = make_tombstone(obj)
+    if pending is None:
+        tombstone.version = next_version(tombstone.user_id)
+        tombstone.save()
+    else:
+        pending.append(tombstone)
+
+
+@contextmanager
+def deferred_tombstones():
+    """ブロックの中で削除したタスク・メモの記録を、最後にまとめて作る"""
+    if getattr(_local, 'pending', None) is not None:
+        # すでに外側でまとめている（か、記録しない）場合は、外側に任せる
+        yield
+        return
+
+    _local.pending = []
+    try:
+        yield
+        tombstones = _local.pending
+    finally:
+        _local.pending = None
+    assign_versions(tombstones, user_field='user_id')
+    Tombstone.objects.bulk_create(tombstones, batch_size=1000)
+
+
+@contextmanager
+def skip_tombstones():
+    """ブロックの中の削除では記録を残さない（アーカイブや、ゲストのデータを消す時など）"""
+    outer = getattr(_local, 'pending', None)
+    _local.pending = _SKIP
+    try:
+        yield
+    finally:
+        _local.pending = outer
+
+
+@contextmanager
+def deleting_user(user_id):
+    """ブロックの中でユーザーを削除する間は、カスケードで消えるタスク・メモの記録を残さない（User.delete()から使う）"""
+    outer = getattr(_local, 'deleting_users', frozenset())
+    _local.deleting_users = outer | {user_id}
+    try:
+        yield
+    finally:
+        _local.deleting_users = outer
+
+
+def task_to_dict(task_id, created_at, title, done_at, version):
+    return {
+        'id': task_id,
+        'title': title,
+        'date': created_at.isoformat(),
+        'done_at': done_at.isoformat() if done_at else None,
+        'version': version,
+    }
+
+
+def comment_to_dict(comment_id, created_at, body, version):
+    return {'id': comment_id, 'date': created_at.isoformat(), 'body': body, 'version': version}
+
+
+def get_changes(user, cursor=None, limit=PAGE_SIZE):
+    """版が cursor より新しい変更を、古い順に limit 件ほど返す。cursor が None なら最初から
+
+    Returns:
+        dict: 変わった・増えたタスクとメモ、削除したタスクとメモのID、次のカーソル、続きがあるか
+    """
+    sources = [
+        Task.objects.filter(created_by=user),
+        Comment.objects.filter(created_by=user),
+        Tombstone.objects.filter(user=user),
+        TaskArchive.objects.filter(user=user),
+    ]
+    if cursor is not None:
+        sources = [queryset.filter(version__gt=cursor) for queryset in sources]
+
+    # それぞれの表から古い順に limit + 1 件の版を読み、全体で limit 件目の版までを返す
+    # アーカイブは、中のタスク・メモの数だけの変更として数える
+    tasks, comments, tombstones, task_archives = sources
+    versions = [
+        version
+        for queryset in (tasks, comments, tombstones)
+        for version in queryset.order_by('version').values_list('version', flat=True)[:limit + 1]
+    ]
+    for version, task_count, comment_count in (
+        task_archives.order_by('version').values_list('version', 'task_count', 'comment_count')[:limit + 1]
+    ):
+        versions += [version] * max(task_count + comment_count, 1)
+    versions.sort()
+    if len(versions) > limit:
+        # 同じ版の変更は、次のページに分けない
+        last = versions[limit - 1]
+        # 読んだ版がすべて last なら、その先の変更があるかは読んでいない行で確かめる
+        has_more = versions[-1] > last or any(queryset.filter(version__gt=last).exists() for queryset in sources)
+        sources = [queryset.filter(version__lte=last) for queryset in sources]
+    else:
+        last = versions[-1] if versions else cursor
+        has_more = False
+    tasks, comments, tombstones, task_archives = sources
+
+    result = {
+        'tasks': [
+            task_to_dict(*row)
+            for row in tasks.order_by('version', 'id').values_list('id', 'created_at', 'title', 'done_at', 'version')
+        ],
+        'comments': [
+            comment_to_dict(*row)
+            for row in comments.order_by('version', 'id').values_list('id', 'created_at', 'body', 'version')
+        ],
+        'deleted': {'tasks': [], 'comments': []},
+        'cursor': last,
+        'has_more': has_more,
+    }
+    for kind, object_id in tombstones.order_by('version', 'id').values_list('kind', 'object_id'):
+        result['deleted']['tasks' if kind == Tombstone.TASK else 'comments'].append(object_id)
+
+    # アーカイブの中身は、アーカイブの版の変更として返す
+    for archive in task_archives.order_by('version'):
+        data = archives.unpack(archive)
+        result['tasks'] += [
+            task_to_dict(task_id, created_at, title, done_at, archive.version)
+            for task_id, created_at, title, done_at, _ in data['tasks']
+        ]
+        result['comments'] += [
+            comment_to_dict(comment_id, created_at, body, archive.version)
+            for comment_id, created_at, body in data['comments']
+        ]
+    return result
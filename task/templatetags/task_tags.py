@@ -0,0 +1,29 @@
+from django import template
+
+from task import daystatus
+
+register = template.Library()
+
+
+@register.filter
+def has_task(status):
+    """その日にタスクがあるか"""
+    return bool(status & daystatus.HAS_TASK)
+
+
+@register.filter
+def all_done(status):
+    """その日のタスクがすべて完了しているか"""
+    return bool(status & daystatus.ALL_DONE)
+
+
+@register.filter
+def has_comment(status):
+    """その日にメモがあるか"""
+    return bool(status & daystatus.HAS_COMMENT)
+
+
+@register.filter
+def level_label(level):
+    """ヒートマップの完了度の説明"""
+    return daystatus.LEVEL_LABELS[level]
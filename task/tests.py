@@ -1,3 +1,951 @@
-from django.test import TestCase
+import datetime
+import gzip
+import hashlib
+import importlib
+import io
+import json
+import tempfile
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import AsyncClient, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import clear_url_caches, resolve, reverse
+from django.utils import timezone
+from PIL import Image
+
+from config import urls as config_urls
+
+from . import (
+    archives, async_views, caches, consecutive, daystatus, exports, imports, recurring, search, stats, summaries, sync,
+    views, urls as task_urls,
+)
+from .models import (
+    ChangeCounter, Comment, ConsecutiveRecord, RecurringTask, SearchToken, Task, TaskArchive, Tombstone,
+)
+
+
+def create_user(email='user@example.com'):
+    return get_user_model().objects.create_user(email, 'password')
+
+
+class ConsecutiveRecordTests(TestCase):
+    def setUp(self):
+        self.user = create_user()
+        self.start = datetime.date(2024, 3, 1)
+        self.tasks = {}
+
+    def day(self, n):
+        return self.start + datetime.timedelta(days=n - 1)
+
+    def complete(self, *days):
+        for n in days:
+            self.tasks[n] = Task.objects.create(
+                created_by=self.user, title=f'task {n}', created_at=self.day(n), done_at=timezone.now()
+            )
+
+    def undo(self, n):
+        self.tasks[n].done_at = None
+        self.tasks[n].save()
+
+    def assertRecord(self, latest, best):
+        """最新の連続期間と最高記録を、(開始日, 最終日) の日の番号で確かめる"""
+        record = ConsecutiveRecord.objects.get(user=self.user)
+        self.assertEqual((record.latest_start, record.latest_end), (self.day(latest[0]), self.day(latest[1])))
+        self.assertEqual(
+            (record.best_start, record.best_end, record.best_days),
+            (self.day(best[0]), self.day(best[1]), best[1] - best[0] + 1),
+        )
+        # 差分更新の結果は、全履歴から計算した結果と同じになる
+        periods = consecutive.compute_consecutive_days(self.user)
+        self.assertEqual((periods[-1]['start_date'], periods[-1]['end_date']), (record.latest_start, record.latest_end))
+        self.assertEqual(max(period['continuous_days'] for period in periods), record.best_days)
+
+    def test_extend_break_and_merge(self):
+        self.complete(1, 2, 3)
+        self.assertRecord(latest=(1, 3), best=(1, 3))
+
+        # 1日空けると、新しい連続期間になる
+        self.complete(5)
+        self.assertRecord(latest=(5, 5), best=(1, 3))
+
+        # 間の日を完了すると、前後の期間がつながる
+        self.complete(4)
+        self.assertRecord(latest=(1, 5), best=(1, 5))
+
+    def test_new_best_record(self):
+        self.complete(1, 2)
+        self.complete(4, 5, 6)
+        self.assertRecord(latest=(4, 6), best=(4, 6))
+
+        # 過去の日を完了して、最新ではない期間が最高記録になる
+        self.complete(10)
+        self.assertRecord(latest=(10, 10), best=(4, 6))
+        self.complete(-2, -1, 0)
+        self.assertRecord(latest=(10, 10), best=(-2, 2))
+
+    def test_undo_completed_day(self):
+        self.complete(1, 2, 3, 4, 5)
+        self.complete(8, 9)
+
+        # 最新の連続期間の最終日を戻すと、期間が縮む
+        self.undo(9)
+        self.assertRecord(latest=(8, 8), best=(1, 5))
+        self.undo(8)
+        self.assertRecord(latest=(1, 5), best=(1, 5))
+
+        # 最高記録の途中を戻すと、全履歴から作り直す
+        self.undo(3)
+        self.assertRecord(latest=(4, 5), best=(1, 2))
+
+        # 未完了のタスクを追加した日も、完了日ではなくなる
+        Task.objects.create(created_by=self.user, title='not done', created_at=self.day(5))
+        self.assertRecord(latest=(4, 4), best=(1, 2))
+
+
+class CalendarCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = create_user()
+        self.client.force_login(self.user)
+        self.day = datetime.date(2024, 3, 5)
+        self.key = caches.calendar_key(self.user.pk, 2024, 3, 0)
+
+    def day_status(self):
+        response = self.client.get(reverse('task:day', args=(2024, 3, 5)))
+        return next(week[self.day] for week in response.context['month_day_tasks'] if self.day in week)
+
+    def test_calendar_is_invalidated_by_changes(self):
+        self.assertEqual(self.day_status(), 0)
+        self.assertIsNotNone(cache.get(self.key))
+
+        task = Task.objects.create(created_by=self.user, title='task', created_at=self.day)
+        self.assertIsNone(cache.get(self.key))
+        self.assertEqual(self.day_status(), daystatus.HAS_TASK)
+
+        task.done_at = timezone.now()
+        task.save()
+        self.assertEqual(self.day_status(), daystatus.HAS_TASK | daystatus.ALL_DONE)
+        self.assertEqual(caches.get_calendar_cache_stats()['hits'], 0)
+        self.assertEqual(self.day_status(), daystatus.HAS_TASK | daystatus.ALL_DONE)
+        self.assertEqual(caches.get_calendar_cache_stats()['hits'], 1)
+
+    def test_month_statuses(self):
+        def add(day, done):
+            Task.objects.create(
+                created_by=self.user, title='task', created_at=day, done_at=timezone.now() if done else None
+            )
+
+        add(datetime.date(2024, 3, 1), True)
+        add(datetime.date(2024, 3, 1), True)
+        add(datetime.date(2024, 3, 2), True)
+        add(datetime.date(2024, 3, 2), False)
+        add(datetime.date(2024, 2, 26), True)
+        Comment.objects.create(created_by=self.user, created_at=datetime.date(2024, 3, 3), body='memo')
+        RecurringTask.objects.create(
+            created_by=self.user, title='every day', rule=RecurringTask.DAILY, interval=1,
+            start_date=datetime.date(2024, 3, 20), end_date=datetime.date(2024, 3, 21),
+        )
+        # 20日のタスクは完了しているが、繰り返しのタスクをまだ作っていないので未完了になる
+        add(datetime.date(2024, 3, 20), True)
+
+        response = self.client.get(reverse('task:day', args=(2024, 3, 5)))
+        weeks = response.context['month_day_tasks']
+        self.assertEqual([len(week) for week in weeks], [7] * 5)
+        statuses = {day: status for week in weeks for day, status in week.items() if status}
+        self.assertEqual(statuses, {
+            # 前月の日もカレンダーに出ている分は集計する
+            datetime.date(2024, 2, 26): daystatus.HAS_TASK | daystatus.ALL_DONE,
+            datetime.date(2024, 3, 1): daystatus.HAS_TASK | daystatus.ALL_DONE,
+            datetime.date(2024, 3, 2): daystatus.HAS_TASK,
+            datetime.date(2024, 3, 3): daystatus.HAS_COMMENT,
+            datetime.date(2024, 3, 20): daystatus.HAS_TASK,
+            datetime.date(2024, 3, 21): daystatus.HAS_TASK,
+        })
+        self.assertEqual(response.context['recurring_days'], {datetime.date(2024, 3, 20), datetime.date(2024, 3, 21)})
+
+    def test_heatmap_year(self):
+        def add(day, total, done):
+            for i in range(total):
+                Task.objects.create(
+                    created_by=self.user, title='task', created_at=day, done_at=timezone.now() if i < done else None
+                )
+
+        add(datetime.date(2023, 12, 31), 1, 1)
+        add(datetime.date(2024, 1, 1), 2, 2)
+        add(datetime.date(2024, 6, 10), 3, 1)
+        add(datetime.date(2024, 6, 11), 2, 1)
+        add(datetime.date(2024, 12, 31), 1, 0)
+        add(datetime.date(2025, 1, 1), 1, 1)
+
+        response = self.client.get(reverse('task:heatmap_year', args=(2024,)))
+        self.assertEqual(
+            (response.context['heatmap_total_tasks'], response.context['heatmap_done_tasks']), (8, 4)
+        )
+        self.assertEqual(response.context['heatmap_all_done_days'], 1)
+        weeks = response.context['heatmap_weeks']
+        cells = [cell for _, week in weeks for cell in week]
+        # 2024年1月1日は月曜なので、月曜始まりでは最初の週の前に空きは無い
+        self.assertEqual(cells[0], (datetime.date(2024, 1, 1), daystatus.LEVEL_ALL))
+        self.assertEqual(len([cell for cell in cells if cell]), 366)
+        levels = {cell[0]: cell[1] for cell in cells if cell and cell[1]}
+        self.assertEqual(levels, {
+            datetime.date(2024, 1, 1): daystatus.LEVEL_ALL,
+            datetime.date(2024, 6, 10): daystatus.LEVEL_SOME,
+            datetime.date(2024, 6, 11): daystatus.LEVEL_MOST,
+            datetime.date(2024, 12, 31): daystatus.LEVEL_NOT_DONE,
+        })
+        self.assertEqual([month for month, _ in weeks if month], list(range(1, 13)))
+
+        self.user.week_status = True
+        self.user.save()
+        # キャッシュした完了度はそのままで、日曜始まりに並べ直す
+        response = self.client.get(reverse('task:heatmap_year', args=(2024,)))
+        self.assertEqual(response.context['heatmap_weeks'][0][1][:2], [None, (datetime.date(2024, 1, 1), daystatus.LEVEL_ALL)])
+
+        for year in (0, 1, 9999):
+            self.assertEqual(self.client.get(reverse('task:heatmap_year', args=(year,))).status_code, 404)
+
+    def test_stats_buckets(self):
+        def add(day, total, done):
+            for i in range(total):
+                Task.objects.create(
+                    created_by=self.user, title='task', created_at=day, done_at=timezone.now() if i < done else None
+                )
+
+        today = datetime.date(2024, 3, 6)
+        add(datetime.date(2024, 3, 4), 2, 1)
+        add(today, 2, 2)
+        add(datetime.date(2024, 2, 26), 1, 1)
+        # 直近12か月より前だが、曜日ごとの集計(365日)には入る
+        add(datetime.date(2023, 3, 31), 1, 0)
+
+        weekly = stats.get_weekly_stats(self.user, today)
+        self.assertEqual(len(weekly), stats.WEEKS)
+        self.assertEqual(weekly[-1], {
+            'start': datetime.date(2024, 3, 4), 'total': 4, 'done': 3, 'rate': 75, 'tasks_per_day': 2.0,
+        })
+        self.assertEqual((weekly[-2]['start'], weekly[-2]['rate']), (datetime.date(2024, 2, 26), 100))
+        self.assertEqual([week['rate'] for week in weekly[:-2]], [None] * (stats.WEEKS - 2))
+
+        monthly = stats.get_monthly_stats(self.user, today)
+        self.assertEqual([month['start'] for month in (monthly[0], monthly[-1])], [
+            datetime.date(2023, 4, 1), datetime.date(2024, 3, 1),
+        ])
+        self.assertEqual([(month['total'], month['done']) for month in monthly[-2:]], [(1, 1), (4, 3)])
+        self.assertEqual(sum(month['total'] for month in monthly), 5)
+
+        weekdays = stats.get_weekday_stats(self.user, today)
+        self.assertEqual({day['name']: day['rate'] for day in weekdays if day['total']}, {'月': 67, '水': 100, '金': 0})
+        self.assertEqual(stats.get_best_weekdays(weekdays), ['水'])
+
+        response = self.client.get(reverse('task:stats'))
+        self.assertEqual([response.context['stats'][key] for key in ('total', 'done', 'rate')], [6, 4, 67])
+        self.assertIsNotNone(cache.get(caches.stats_key(self.user.pk)))
+
+    def test_day_panel(self):
+        Task.objects.create(created_by=self.user, title='buy milk', created_at=self.day)
+        Task.objects.create(created_by=self.user, title='another day', created_at=datetime.date(2024, 3, 6))
+        Comment.objects.create(created_by=self.user, created_at=self.day, body='a memo')
+
+        response = self.client.get(reverse('task:day_panel', args=(2024, 3, 5)))
+        data = response.json()
+        self.assertEqual(data['date'], '2024-03-05')
+        self.assertEqual(data['url'], reverse('task:day', args=(2024, 3, 5)))
+        self.assertIn('DoneList', data['title'])
+        self.assertIn('buy milk', data['html'])
+        self.assertIn('a memo', data['html'])
+        self.assertNotIn('another day', data['html'])
+        self.assertIn(reverse('task:day_panel', args=(2024, 3, 6)), data['html'])
+        # カレンダーは作らない
+        self.assertIsNone(cache.get(self.key))
+
+        # アーカイブした月の日は、アーカイブから読み取り専用で返す
+        Task.objects.create(created_by=self.user, title='january task', created_at=datetime.date(2024, 1, 10))
+        archives.archive_month(self.user, datetime.date(2024, 1, 1))
+        html = self.client.get(reverse('task:day_panel', args=(2024, 1, 10))).json()['html']
+        self.assertIn('january task', html)
+        self.assertNotIn('class="delete"', html)
+
+        self.assertEqual(self.client.get(reverse('task:day_panel', args=(2024, 2, 30))).status_code, 404)
+        self.client.logout()
+        self.assertEqual(self.client.get(reverse('task:day_panel', args=(2024, 3, 5))).status_code, 302)
+
+    def test_cache_rebuilt_before_commit_is_deleted_on_commit(self):
+        keys = [self.key, caches.heatmap_key(self.user.pk, 2024), caches.stats_key(self.user.pk)]
+        with self.captureOnCommitCallbacks(execute=True):
+            Task.objects.create(created_by=self.user, title='task', created_at=self.day)
+            # コミット前に、ほかのリクエストが古い内容でキャッシュを作り直した
+            cache.set_many({key: {'stale': True} for key in keys})
+        self.assertEqual(cache.get_many(keys), {})
+
+
+class CompletedPageTests(TestCase):
+    def setUp(self):
+        self.user = create_user()
+        self.client.force_login(self.user)
+
+    def add(self, created_at, done_at):
+        return Task.objects.create(
+            created_by=self.user, title=f'{created_at} {done_at}', created_at=created_at, done_at=done_at
+        )
+
+    @mock.patch.object(views, 'COMPLETED_PAGE_SIZE', 3)
+    def test_pages_across_archive_with_ties(self):
+        feb, mar = datetime.date(2024, 2, 10), datetime.date(2024, 3, 10)
+        # アーカイブする2月のタスクと今のタスクが、同じ完了日で交互のIDになるように作る
+        self.add(mar, mar)
+        self.add(feb, mar)
+        self.add(mar, mar)
+        self.add(feb, feb)
+        self.add(feb, feb)
+        self.add(mar, None)
+        self.add(mar, feb)
+        self.add(feb, None)
+        self.add(feb, mar)
+        expected = list(
+            Task.objects.filter(created_by=self.user, done_at__isnull=False)
+                .order_by('-done_at', '-id').values_list('id', 'done_at')
+        )
+        archives.archive_month(self.user, feb)
+        self.assertEqual(Task.objects.filter(created_by=self.user, created_at=feb).count(), 0)
+
+        pages, cursor = [], None
+        while True:
+            tasks, next_cursor = views.get_completed_page(self.user, cursor)
+            pages.append([(task.id, task.done_at) for task in tasks])
+            if next_cursor is None:
+                break
+            cursor = views.decode_completed_cursor(next_cursor)
+
+        self.assertEqual([len(page) for page in pages], [3, 3, 1])
+        self.assertEqual(sum(pages, []), expected)
+
+        # 無限スクロールのJSONも同じカーソルで続きを返す
+        _, next_cursor = views.get_completed_page(self.user)
+        response = self.client.get(reverse('task:completed_more'), {'cursor': next_cursor})
+        self.assertEqual(len(response.json()['tasks']), 3)
+        self.assertEqual(self.client.get(reverse('task:completed_more'), {'cursor': 'x'}).status_code, 400)
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        self.user = create_user()
+        self.client.force_login(self.user)
+        jan, feb = datetime.date(2024, 1, 10), datetime.date(2024, 2, 10)
+        Task.objects.create(created_by=self.user, title='1月', created_at=jan, done_at=jan)
+        Comment.objects.create(created_by=self.user, created_at=jan, body='1月のメモ')
+        Task.objects.create(created_by=self.user, title='2月', created_at=feb)
+        Comment.objects.create(created_by=self.user, created_at=feb, body='2月のメモ')
+        archives.archive_month(self.user, jan)
+        # アーカイブした後に、同じ月に書き込まれたタスク（アーカイブとテーブルの両方から読む）
+        Task.objects.create(created_by=self.user, title='1月・後から', created_at=datetime.date(2024, 1, 5))
+
+    def export(self, **params):
+        response = self.client.get(reverse('task:export'), params)
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content)
+
+    def test_csv_merges_table_and_archive_in_date_order(self):
+        response, content = self.export(format='csv')
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertEqual(content.decode().splitlines(), [
+            'type,date,text,done_at',
+            'task,2024-01-05,1月・後から,',
+            'task,2024-01-10,1月,2024-01-10',
+            'task,2024-02-10,2月,',
+            'comment,2024-01-10,1月のメモ,',
+            'comment,2024-02-10,2月のメモ,',
+        ])
+
+        _, content = self.export(format='csv', start='2024-01-06', end='2024-01-31')
+        self.assertEqual(content.decode().splitlines()[1:], ['task,2024-01-10,1月,2024-01-10', 'comment,2024-01-10,1月のメモ,'])
+
+    def test_gzip_jsonl_round_trip(self):
+        response, content = self.export(format='jsonl', gzip='on')
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        self.assertTrue(response['Content-Disposition'].endswith('.jsonl.gz"'))
+        _, plain = self.export(format='jsonl')
+        self.assertEqual(gzip.decompress(content), plain)
+        self.assertEqual(json.loads(plain.splitlines()[0]), {
+            'type': 'task', 'date': '2024-01-05', 'text': '1月・後から', 'done_at': '',
+        })
+
+        # 書き出したファイルは、そのまま取り込める
+        other = create_user('other@example.com')
+        result = imports.import_records(other, io.BytesIO(content), 'jsonl')
+        self.assertEqual((result['tasks'], result['comments'], result['skipped']), (3, 2, 0))
+        self.assertEqual(list(exports.iter_records(other)), list(exports.iter_records(self.user)))
+
+
+class ImportRecordsTests(TestCase):
+    def setUp(self):
+        self.user = create_user()
+
+    def import_lines(self, lines, import_format='jsonl'):
+        return imports.import_records(self.user, io.BytesIO('\n'.join(lines).encode()), import_format)
+
+    def test_broken_jsonl_line_is_skipped(self):
+        result = self.import_lines([
+            '{"type": "task", "date": "2024-03-01", "text": "a", "done_at": ""}',
+            '{"type": "task", "date": ',
+            '["not", "an", "object"]',
+            '{"type": "task", "date": "2024-03-02", "text": "b", "done_at": "2024-03-02"}',
+        ])
+        self.assertEqual(result['tasks'], 2)
+        self.assertEqual(result['skipped'], 2)
+        self.assertEqual(result['errors'], ['2行目: JSONとして読み込めません', '3行目: JSONのオブジェクトではありません'])
+        self.assertEqual(Task.objects.filter(created_by=self.user).count(), 2)
+
+    def test_comment_on_day_with_comment_is_reported(self):
+        Comment.objects.create(created_by=self.user, created_at=datetime.date(2024, 3, 1), body='before')
+        result = self.import_lines([
+            'type,date,text,done_at',
+            'comment,2024-03-01,dup,',
+            'comment,2024-03-02,new,',
+            'comment,2024-03-02,new again,',
+        ], 'csv')
+        self.assertEqual(result['comments'], 1)
+        self.assertEqual(result['skipped'], 2)
+        self.assertEqual(result['errors'], ['2行目: その日のメモはすでにあります', '4行目: その日のメモはすでにあります'])
+        self.assertEqual(Comment.objects.get(created_by=self.user, created_at=datetime.date(2024, 3, 1)).body, 'before')
+
+    def test_truncated_gzip_is_reported_and_written_rows_are_indexed(self):
+        start = datetime.date(2023, 1, 1)
+        days = [start + datetime.timedelta(days=i) for i in range(300)]
+        # 圧縮しにくい内容にして、途中で切れたファイルでも前半の行は読めるようにする
+        lines = ['type,date,text,done_at'] + [
+            f'task,{day},{hashlib.sha256(str(day).encode()).hexdigest() * 2},{day}' for day in days
+        ]
+        data = gzip.compress('\n'.join(lines).encode())
+        result = imports.import_records(self.user, io.BytesIO(data[:len(data) // 2]), 'csv', batch_size=20)
+
+        self.assertEqual(result['errors'], ['-行目: Compressed file ended before the end-of-stream marker was reached'])
+        self.assertGreater(result['tasks'], 0)
+        self.assertEqual(Task.objects.filter(created_by=self.user).count(), result['tasks'])
+        # 書き込んだ分の集計・検索用トークン・連続記録は作り直されている
+        self.assertEqual(summaries.verify_daily_summaries(self.user), [])
+        self.assertEqual(len(summaries.stored_days(self.user)), result['tasks'])
+        self.assertTrue(SearchToken.objects.filter(user=self.user, date=start).exists())
+        self.assertEqual(ConsecutiveRecord.objects.get(user=self.user).latest_end, days[result['tasks'] - 1])
+
+    def test_failed_batch_still_rebuilds_written_batches(self):
+        lines = ['type,date,text,done_at'] + [f'task,2024-03-{day:02},task {day},' for day in range(1, 5)]
+        save_batch = imports._save_batch
+        calls = []
+
+        def fail_second_batch(*args):
+            calls.append(args)
+            if len(calls) == 2:
+                raise RuntimeError
+            return save_batch(*args)
+
+        with mock.patch.object(imports, '_save_batch', fail_second_batch):
+            with self.assertRaises(RuntimeError):
+                imports.import_records(self.user, io.BytesIO('\n'.join(lines).encode()), 'csv', batch_size=2)
+        self.assertEqual(Task.objects.filter(created_by=self.user).count(), 2)
+        self.assertEqual(summaries.verify_daily_summaries(self.user), [])
+        self.assertEqual(len(summaries.stored_days(self.user)), 2)
+
+
+class TaskJsonTests(TestCase):
+    def setUp(self):
+        self.user = create_user()
+        self.client.force_login(self.user)
+        self.day = datetime.date(2024, 3, 1)
+        self.task = Task.objects.create(created_by=self.user, title='task', created_at=self.day)
+
+    def post(self, url, **kwargs):
+        return self.client.post(url, HTTP_ACCEPT='application/json', **kwargs)
+
+    def test_toggle_returns_state(self):
+        response = self.post(reverse('task:done', args=(self.task.pk, 'true')))
+        self.assertEqual(response.json(), {
+            'task': {'id': self.task.pk, 'done': True, 'deleted': False},
+            'day': {'date': '2024-03-01', 'status': 3, 'has_task': True, 'all_done': True, 'has_comment': False},
+            'consecutive': {'current_consecutive_day': 0, 'most_consecutive_day': 1},
+        })
+
+        response = self.post(reverse('task:done', args=(self.task.pk, 'false')))
+        self.assertEqual(response.json()['task']['done'], False)
+        self.assertEqual(response.json()['day']['status'], daystatus.HAS_TASK)
+        self.assertEqual(response.json()['consecutive']['most_consecutive_day'], 0)
+
+    def test_delete_returns_state(self):
+        url = reverse('task:delete', args=(self.task.pk,))
+        response = self.client.delete(url, HTTP_ACCEPT='application/json')
+        self.assertEqual(response.json()['task'], {'id': self.task.pk, 'done': False, 'deleted': True})
+        self.assertEqual(response.json()['day']['status'], 0)
+        self.assertFalse(Task.objects.filter(pk=self.task.pk).exists())
+
+        self.assertEqual(self.client.delete(url, HTTP_ACCEPT='application/json').status_code, 404)
+
+    def test_other_users_task(self):
+        self.client.force_login(create_user('other@example.com'))
+        response = self.post(reverse('task:done', args=(self.task.pk, 'true')))
+        self.assertEqual(response.status_code, 403)
+        self.assertIn('error', response.json())
+        response = self.client.delete(reverse('task:delete', args=(self.task.pk,)), HTTP_ACCEPT='application/json')
+        self.assertEqual(response.status_code, 403)
+
+        self.task.refresh_from_db()
+        self.assertIsNone(self.task.done_at)
+        # 削除はDELETEでしか受け付けない
+        self.client.force_login(self.user)
+        self.assertEqual(self.post(reverse('task:delete', args=(self.task.pk,))).status_code, 403)
+        self.assertEqual(self.post(reverse('task:done', args=(0, 'true'))).status_code, 404)
+
+
+class TaskBatchTests(TestCase):
+    def setUp(self):
+        self.user = create_user()
+        self.client.force_login(self.user)
+        self.tasks = [
+            Task.objects.create(created_by=self.user, title=f'task {i}', created_at=datetime.date(2024, 3, 1))
+            for i in range(2)
+        ]
+
+    def post(self, data):
+        return self.client.post(reverse('task:batch'), json.dumps(data), content_type='application/json')
+
+    def test_done(self):
+        response = self.post({'action': 'done', 'ids': [task.pk for task in self.tasks]})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['count'], 2)
+        self.assertFalse(Task.objects.filter(created_by=self.user, done_at__isnull=True).exists())
+
+    def test_ids_must_be_list_of_integers(self):
+        pk = self.tasks[0].pk
+        for ids in (str(pk), [str(pk)], [pk + 0.5], [True], {'id': pk}):
+            with self.subTest(ids=ids):
+                self.assertEqual(self.post({'action': 'done', 'ids': ids}).status_code, 400)
+        self.assertFalse(Task.objects.filter(done_at__isnull=False).exists())
+
+
+class DailySummaryTests(TestCase):
+    def setUp(self):
+        self.user = create_user()
+        self.day = datetime.date(2024, 3, 1)
+
+    def stored(self):
+        return summaries.stored_days(self.user).get(self.day)
+
+    def test_signals_keep_summary_in_sync(self):
+        tasks = [Task.objects.create(created_by=self.user, title=f'task {i}', created_at=self.day) for i in range(2)]
+        self.assertEqual(self.stored(), (2, 0, False))
+
+        for task in tasks:
+            task.done_at = timezone.now()
+            task.save()
+        self.assertEqual(self.stored(), (2, 2, False))
+        self.assertEqual(ConsecutiveRecord.objects.get(user=self.user).latest_end, self.day)
+
+        comment = Comment.objects.create(created_by=self.user, created_at=self.day, body='memo')
+        self.assertEqual(self.stored(), (2, 2, True))
+
+        tasks[0].delete()
+        comment.delete()
+        tasks[1].delete()
+        self.assertIsNone(self.stored())
+        self.assertEqual(summaries.verify_daily_summaries(self.user), [])
+
+    def test_refresh_day_recounts_after_update(self):
+        Task.objects.create(created_by=self.user, title='task', created_at=self.day)
+        # update() ではシグナルが送られないので、集計は古いままになる
+        Task.objects.filter(created_by=self.user).update(done_at=timezone.now())
+        self.assertEqual(summaries.verify_daily_summaries(self.user), [(self.day, (1, 0, False), (1, 1, False))])
+
+        summaries.refresh_day(self.user.pk, self.day)
+        self.assertEqual(self.stored(), (1, 1, False))
+        self.assertEqual(summaries.verify_daily_summaries(self.user), [])
+
+    def test_deferred_refresh_counts_once_per_day(self):
+        with summaries.deferred_refresh():
+            for i in range(3):
+                Task.objects.create(created_by=self.user, title=f'task {i}', created_at=self.day)
+        self.assertEqual(self.stored(), (3, 0, False))
+
+    def test_skip_refresh_leaves_summary(self):
+        task = Task.objects.create(created_by=self.user, title='task', created_at=self.day)
+        with summaries.skip_refresh():
+            task.delete()
+        self.assertEqual(self.stored(), (1, 0, False))
+
+
+class SearchIndexTests(TestCase):
+    def setUp(self):
+        self.user = create_user()
+
+    def test_resave_without_changes_only_reads(self):
+        task = Task.objects.create(created_by=self.user, title='東京都の予定')
+        self.assertEqual(
+            set(SearchToken.objects.filter(task=task).values_list('date', flat=True)), {caches.to_date(task.created_at)}
+        )
+        # created_at がまだ datetime のままのインスタンスでも、トークンを書き直さない
+        with CaptureQueriesContext(connection) as queries:
+            search.update_search_index(task)
+        self.assertFalse([q['sql'] for q in queries if not q['sql'].startswith(('SELECT', 'SAVEPOINT', 'RELEASE'))])
+
+    def test_title_change_updates_tokens(self):
+        task = Task.objects.create(created_by=self.user, title='東京', created_at=datetime.date(2024, 3, 1))
+        task.title = '京都'
+        task.save()
+        self.assertEqual(set(SearchToken.objects.filter(task=task).values_list('token', flat=True)), {'京', '都', '京都'})
+        results, _ = search.search(self.user, '京都')
+        self.assertEqual([result['text'] for result in results], ['京都'])
+
+
+class AsyncViewTests(TransactionTestCase):
+    """非同期版のビューは、クエリを別のスレッド（別の接続）で実行するので、データをコミットしておく"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = create_user()
+        self.day = datetime.date(2024, 3, 5)
+        self.task = Task.objects.create(created_by=self.user, title='task', created_at=self.day)
+        Task.objects.create(created_by=self.user, title='done', created_at=self.day, done_at=timezone.now())
+        Comment.objects.create(created_by=self.user, created_at=self.day, body='memo')
+        self.client.force_login(self.user)
+        self.async_client = AsyncClient()
+        self.async_client.force_login(self.user)
+        # urls.py は ASYNC_VIEWS を読み込んだ時に見るので、非同期版のビューで読み込み直す
+        self.use_async_urls(True)
+        self.addCleanup(self.use_async_urls, False)
+
+    def async_request(self, method, path, **headers):
+        """AsyncClient で送る（Django 3.2 の AsyncClient は、ヘッダーを小文字のヘッダー名で受け取る）"""
+        async def request():
+            return await getattr(self.async_client, method)(path, **headers)
+        return async_to_sync(request)()
+
+    def use_async_urls(self, enabled):
+        with self.settings(ASYNC_VIEWS=enabled):
+            importlib.reload(task_urls)
+            importlib.reload(config_urls)
+        clear_url_caches()
+
+    def test_day_view_matches_sync_view(self):
+        path = reverse('task:day', args=(2024, 3, 5))
+        self.assertIs(resolve(path).func, async_views.day_view)
+        expected = self.client.get(path)
+        response = self.async_request('get', path)
+
+        self.assertEqual(response.status_code, 200)
+        for key in ('month_day_tasks', 'consecutive', 'comment', 'archived'):
+            self.assertEqual(response.context[key], expected.context[key], key)
+        self.assertEqual(list(response.context['tasks_of_the_day']), list(expected.context['tasks_of_the_day']))
+        self.assertEqual(response['ETag'], expected['ETag'])
+
+        response = self.async_request('get', path, **{'if-none-match': response['ETag']})
+        self.assertEqual(response.status_code, 304)
+
+    def test_toggle_matches_sync_view(self):
+        path = reverse('task:done', args=(self.task.pk, 'true'))
+        self.assertIs(resolve(path).func, async_views.task_done)
+        response = self.async_request('post', path, accept='application/json')
+        self.assertTrue(Task.objects.get(pk=self.task.pk).done_at)
+
+        Task.objects.filter(pk=self.task.pk).update(done_at=None)
+        summaries.refresh_day(self.user.pk, self.day)
+        self.use_async_urls(False)
+        expected = self.client.post(path, HTTP_ACCEPT='application/json')
+        self.assertEqual(response.json(), expected.json())
+        self.assertTrue(response.json()['day']['all_done'])
+
+
+def create_image(name='avatar.png', size=(300, 200), color='red'):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, color).save(buffer, 'PNG')
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/png')
+
+
+def use_temporary_media_root(test_case):
+    """アップロードしたファイルを、テストが終わったら消える一時ディレクトリに置く"""
+    media_root = tempfile.TemporaryDirectory()
+    test_case.addCleanup(media_root.cleanup)
+    override = override_settings(MEDIA_ROOT=media_root.name)
+    override.enable()
+    test_case.addCleanup(override.disable)
+
+
+class PageValidatorTests(TestCase):
+    def setUp(self):
+        use_temporary_media_root(self)
+        cache.clear()
+        self.user = create_user()
+        self.client.force_login(self.user)
+        self.task = Task.objects.create(created_by=self.user, title='task', created_at=datetime.date(2024, 3, 5))
+        self.path = reverse('task:day', args=(2024, 3, 5))
+
+    def get_etag(self, path=None):
+        # 表示待ちのメッセージがある時はETagを付けないので、メッセージを表示してからもう一度読む
+        for _ in range(2):
+            response = self.client.get(path or self.path)
+            self.assertEqual(response.status_code, 200)
+            if response.has_header('ETag'):
+                return response['ETag']
+        self.fail('ETagがありません')
+
+    def test_repeat_get_returns_304(self):
+        for path in (self.path, reverse('task:completed')):
+            with self.subTest(path=path):
+                etag = self.get_etag(path)
+                response = self.client.get(path, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 304)
+                self.assertIn('no-cache', response['Cache-Control'])
+        # 別の日は別のETagになる
+        self.assertNotEqual(self.get_etag(reverse('task:day', args=(2024, 3, 6))), self.get_etag())
+
+    def test_etag_changes_after_changes(self):
+        changes = {
+            'toggle': lambda: self.client.post(
+                reverse('task:done', args=(self.task.pk, 'true')), HTTP_ACCEPT='application/json'
+            ),
+            'batch': lambda: self.client.post(
+                reverse('task:batch'), json.dumps({'action': 'done', 'ids': [self.task.pk]}),
+                content_type='application/json',
+            ),
+            'import': lambda: self.client.post(reverse('task:import'), {
+                'file': SimpleUploadedFile('tasks.csv', b'type,date,text,done_at\ntask,2024-03-05,imported,\n'),
+            }),
+            'avatar': lambda: self.client.post(reverse('account:edit'), {
+                'username': 'user', 'email': self.user.email, 'avatar': create_image(),
+            }),
+        }
+        for name, change in changes.items():
+            with self.subTest(change=name):
+                etag = self.get_etag()
+                response = change()
+                self.assertIn(response.status_code, (200, 302))
+                self.assertNotEqual(self.client.get(self.path, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+                self.assertNotEqual(self.get_etag(), etag)
+
+        self.assertTrue(Task.objects.filter(created_by=self.user, title='imported').exists())
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.avatar)
+
+
+class RecurringTests(TestCase):
+    def setUp(self):
+        self.user = create_user()
+        self.start = datetime.date(2024, 3, 4)  # 月曜日
+
+    def add(self, rule, interval=1):
+        return RecurringTask.objects.create(
+            created_by=self.user, title=rule, rule=rule, interval=interval, start_date=self.start
+        )
+
+    def pending_days(self, start, end):
+        return {
+            day: sorted(recurrence.title for recurrence in recurrences)
+            for day, recurrences in recurring.get_pending_occurrences(self.user, start, end).items()
+        }
+
+    def test_rules(self):
+        recurrence = RecurringTask(start_date=datetime.date(2024, 1, 31), rule=RecurringTask.MONTHLY, interval=1)
+        self.assertEqual(
+            recurring.get_occurrences(recurrence, datetime.date(2024, 1, 1), datetime.date(2024, 4, 30)),
+            [
+                datetime.date(2024, 1, 31), datetime.date(2024, 2, 29),
+                datetime.date(2024, 3, 31), datetime.date(2024, 4, 30),
+            ],
+        )
+        recurrence = RecurringTask(start_date=self.start, rule=RecurringTask.WEEKDAYS, interval=1)
+        self.assertEqual(
+            len(recurring.get_occurrences(recurrence, self.start, self.start + datetime.timedelta(days=13))), 10
+        )
+
+    def test_pending_excludes_created_and_skipped_days(self):
+        self.add(RecurringTask.DAILY)
+        self.add(RecurringTask.INTERVAL, interval=2)
+        end = self.start + datetime.timedelta(days=3)
+        self.assertEqual(self.pending_days(self.start, end), {
+            self.start: [RecurringTask.DAILY, RecurringTask.INTERVAL],
+            self.start + datetime.timedelta(days=1): [RecurringTask.DAILY],
+            self.start + datetime.timedelta(days=2): [RecurringTask.DAILY, RecurringTask.INTERVAL],
+            self.start + datetime.timedelta(days=3): [RecurringTask.DAILY],
+        })
+
+        created = recurring.materialize(self.user, self.start)
+        self.assertEqual(len(created), 2)
+        self.assertEqual(recurring.materialize(self.user, self.start), [])
+        self.assertNotIn(self.start, self.pending_days(self.start, end))
+
+        next_day = self.start + datetime.timedelta(days=1)
+        task = recurring.materialize(self.user, next_day)[0]
+        recurring.skip_occurrence(task)
+        task.delete()
+        self.assertNotIn(next_day, self.pending_days(self.start, end))
+        self.assertEqual(recurring.materialize(self.user, next_day), [])
+
+    def test_batch_delete_skips_occurrences(self):
+        self.add(RecurringTask.DAILY)
+        tasks = recurring.materialize(self.user, self.start)
+        self.client.force_login(self.user)
+        response = self.client.post(
+            reverse('task:batch'), json.dumps({'action': 'delete', 'ids': [task.pk for task in tasks]}),
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn(self.start, self.pending_days(self.start, self.start))
+        self.assertEqual(recurring.materialize(self.user, self.start), [])
+
+
+class ArchiveTests(TestCase):
+    def setUp(self):
+        self.user = create_user()
+        self.client.force_login(self.user)
+        self.month = datetime.date(2024, 3, 1)
+        self.day = datetime.date(2024, 3, 5)
+        done_at = timezone.make_aware(datetime.datetime(2024, 3, 5, 12))
+        self.tasks = [
+            Task.objects.create(created_by=self.user, title='アーカイブ済み', created_at=self.day, done_at=done_at),
+            Task.objects.create(created_by=self.user, title='未完了', created_at=self.day),
+            Task.objects.create(created_by=self.user, title='別の日', created_at=datetime.date(2024, 3, 20)),
+        ]
+        self.comment = Comment.objects.create(created_by=self.user, created_at=self.day, body='アーカイブのメモ')
+        self.summaries = summaries.stored_days(self.user)
+
+    def rows(self):
+        return (
+            sorted(Task.objects.filter(created_by=self.user).values_list('id', 'created_at', 'title', 'done_at')),
+            sorted(Comment.objects.filter(created_by=self.user).values_list('id', 'created_at', 'body')),
+        )
+
+    def test_round_trip(self):
+        before = self.rows()
+        archive = archives.archive_month(self.user, self.day)
+        self.assertEqual((archive.task_count, archive.done_count, archive.comment_count), (3, 1, 1))
+        self.assertFalse(Task.objects.filter(created_by=self.user).exists())
+        self.assertFalse(SearchToken.objects.filter(user=self.user).exists())
+        # 集計はアーカイブの前後で変わらない
+        self.assertEqual(summaries.stored_days(self.user), self.summaries)
+        self.assertEqual(summaries.verify_daily_summaries(self.user), [])
+        self.assertEqual([task.pk for task in archives.get_done_tasks(self.user)], [self.tasks[0].pk])
+
+        self.assertTrue(archives.restore_month(self.user, self.day))
+        self.assertFalse(archives.restore_month(self.user, self.day))
+        self.assertEqual(self.rows(), before)
+        self.assertEqual(summaries.verify_daily_summaries(self.user), [])
+        results, _ = search.search(self.user, 'アーカイブ')
+        self.assertEqual(len(results), 2)
+
+    def test_archive_merges_rows_left_in_table(self):
+        archives.archive_month(self.user, self.day)
+        task = Task.objects.create(created_by=self.user, title='後から', created_at=datetime.date(2024, 3, 31))
+        archive = archives.archive_month(self.user, self.day)
+        self.assertEqual((archive.task_count, archive.comment_count), (4, 1))
+        self.assertEqual(TaskArchive.objects.filter(user=self.user).count(), 1)
+        archives.restore_month(self.user, self.day)
+        self.assertTrue(Task.objects.filter(pk=task.pk, title='後から').exists())
+
+    def test_day_view_reads_archive_without_restoring(self):
+        archives.archive_month(self.user, self.day)
+        response = self.client.get(reverse('task:day', args=(2024, 3, 5)))
+        self.assertContains(response, 'アーカイブ済み')
+        self.assertContains(response, 'アーカイブのメモ')
+        self.assertNotContains(response, reverse('task:delete', kwargs={'task_id': self.tasks[0].pk}))
+
+        response = self.client.get(reverse('task:day_panel', args=(2024, 3, 5)), HTTP_ACCEPT='application/json')
+        self.assertIn('未完了', response.json()['html'])
+
+        self.assertTrue(TaskArchive.objects.filter(user=self.user, month=self.month).exists())
+        self.assertFalse(Task.objects.filter(created_by=self.user).exists())
+
+    def test_writing_to_archived_day_restores_month(self):
+        archives.archive_month(self.user, self.day)
+        response = self.client.post(reverse('task:day', args=(2024, 3, 5)), {'title': '追加'})
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(TaskArchive.objects.filter(user=self.user).exists())
+        self.assertEqual(Task.objects.filter(created_by=self.user, created_at=self.day).count(), 3)
+        self.assertEqual(summaries.stored_days(self.user)[self.day], (3, 1, True))
+
+
+class SyncTests(TestCase):
+    def setUp(self):
+        self.user = create_user()
+        self.day = datetime.date(2024, 3, 5)
+
+    def create_tasks(self, count, day=None):
+        return [
+            Task.objects.create(created_by=self.user, title=f'task {i}', created_at=day or self.day)
+            for i in range(count)
+        ]
+
+    def sync_all(self, cursor=None, limit=sync.PAGE_SIZE):
+        """has_more が false になるまで読んで、(タスクのID, メモのID, 削除したタスクのID, カーソル, ページ数) を返す"""
+        tasks, comments, deleted, pages = set(), set(), set(), 0
+        while True:
+            changes = sync.get_changes(self.user, cursor, limit)
+            pages += 1
+            tasks |= {task['id'] for task in changes['tasks']}
+            comments |= {comment['id'] for comment in changes['comments']}
+            deleted |= set(changes['deleted']['tasks'])
+            cursor = changes['cursor']
+            if not changes['has_more']:
+                return tasks, comments, deleted, cursor, pages
+
+    def test_changes_since_cursor(self):
+        first, second = self.create_tasks(2)
+        comment = Comment.objects.create(created_by=self.user, created_at=self.day, body='memo')
+        tasks, comments, deleted, cursor, _ = self.sync_all()
+        self.assertEqual((tasks, comments, deleted), ({first.pk, second.pk}, {comment.pk}, set()))
+        self.assertEqual(self.sync_all(cursor)[:4], (set(), set(), set(), cursor))
+
+        first.done_at = timezone.now()
+        first.save()
+        second_pk = second.pk
+        second.delete()
+        tasks, comments, deleted, cursor, _ = self.sync_all(cursor)
+        self.assertEqual((tasks, comments, deleted), ({first.pk}, set(), {second_pk}))
+        changes = sync.get_changes(self.user, cursor)
+        self.assertEqual((changes['tasks'], changes['has_more']), ([], False))
+
+    def test_paging_does_not_split_a_version(self):
+        tasks = self.create_tasks(5)
+        _, _, _, cursor, pages = self.sync_all(limit=2)
+        self.assertEqual(pages, 3)
+
+        # まとめて完了にしたタスクは同じ版になるので、limit より多くても1ページで返す
+        self.client.force_login(self.user)
+        self.client.post(
+            reverse('task:batch'), json.dumps({'action': 'done', 'ids': [task.pk for task in tasks[:3]]}),
+            content_type='application/json',
+        )
+        changes = sync.get_changes(self.user, cursor, limit=2)
+        self.assertEqual(len(changes['tasks']), 3)
+        self.assertFalse(changes['has_more'])
+
+    def test_archive_and_restore_keep_versions(self):
+        self.create_tasks(2)
+        Comment.objects.create(created_by=self.user, created_at=self.day, body='memo')
+        full = self.sync_all()
+        cursor = full[3]
+
+        # アーカイブ・戻すだけでは、クライアントから見た変更は無い
+        archive = archives.archive_month(self.user, self.day)
+        self.assertEqual(archive.version, cursor)
+        self.assertEqual(self.sync_all(cursor)[:4], (set(), set(), set(), cursor))
+        self.assertEqual(self.sync_all()[:3], full[:3])
+        self.assertFalse(Tombstone.objects.filter(user=self.user).exists())
+
+        archives.restore_month(self.user, self.day)
+        self.assertEqual(self.sync_all(cursor)[:4], (set(), set(), set(), cursor))
+        self.assertEqual(self.sync_all()[:3], full[:3])
+
+    def test_sync_view(self):
+        self.create_tasks(1)
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('task:sync'))
+        self.assertEqual(len(response.json()['tasks']), 1)
+        self.assertEqual(self.client.get(reverse('task:sync'), {'cursor': 'x'}).status_code, 400)
+
+    def test_deleting_user_writes_no_tombstones(self):
+        self.create_tasks(2)
+        self.user.delete()
+        self.assertFalse(Tombstone.objects.exists())
+        self.assertFalse(ChangeCounter.objects.exists())
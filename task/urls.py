@@ -1,13 +1,36 @@
+from django.conf import settings
 from django.urls import path
-from .views import task_delete, task_done, TopView, delete_comment, completed_task_view
+
+from .views import task_delete, task_done, task_batch, TopView, day_panel_view, HeatmapView, stats_view, search_view, recurring_view, recurring_stop, delete_comment, completed_task_view, completed_task_json, \
+    sync_view, export_view, import_view, metrics_view
 
 app_name = 'task'
 
+if settings.ASYNC_VIEWS:
+    # ASGIで動かす時は、日ごとの表示と完了の切り替えを非同期版にする
+    from .async_views import day_view as top_view, task_done as task_done_view
+else:
+    top_view = TopView.as_view()
+    task_done_view = task_done
+
 urlpatterns = [
-    path('', TopView.as_view(), name='top'),
-    path('<int:year>/<int:month>/<int:day>/', TopView.as_view(), name='day'),
+    path('', top_view, name='top'),
+    path('<int:year>/<int:month>/<int:day>/', top_view, name='day'),
+    path('day_panel/<int:year>/<int:month>/<int:day>/', day_panel_view, name='day_panel'),
     path('delete/<int:task_id>/', task_delete, name='delete'),
-    path('done/<int:task_id>/<str:status>/', task_done, name='done'),
+    path('done/<int:task_id>/<str:status>/', task_done_view, name='done'),
+    path('batch/', task_batch, name='batch'),
     path('delete_co/<int:year>/<int:month>/<int:day>/', delete_comment, name='delete_co'),
+    path('heatmap/', HeatmapView.as_view(), name='heatmap'),
+    path('heatmap/<int:year>/', HeatmapView.as_view(), name='heatmap_year'),
+    path('stats/', stats_view, name='stats'),
+    path('search/', search_view, name='search'),
+    path('recurring/', recurring_view, name='recurring'),
+    path('recurring/<int:recurrence_id>/stop/', recurring_stop, name='recurring_stop'),
     path('completed/', completed_task_view, name='completed'),
+    path('completed/more/', completed_task_json, name='completed_more'),
+    path('sync/', sync_view, name='sync'),
+    path('export/', export_view, name='export'),
+    path('import/', import_view, name='import'),
+    path('metrics/', metrics_view, name='metrics'),
 ]
\ No newline at end of file
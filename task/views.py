@@ -1,83 +1,325 @@
 import datetime
+import hashlib
+import json
 
+from django.conf import settings
+from django.contrib import messages
 from django.utils import timezone
-from django.http import HttpResponse
+from django.db import transaction
+from django.db.models import Q
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.utils.formats import date_format
 from django.shortcuts import render, redirect, get_object_or_404
+from django.template.loader import render_to_string
+from django.urls import reverse
+from django.utils.decorators import method_decorator
+from django.views.decorators.cache import cache_control
 from django.views.decorators.csrf import csrf_protect
+from django.views.decorators.http import condition, require_POST
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import login_required
+from django.contrib.auth.mixins import LoginRequiredMixin
 from django.views import generic
 
-from . import mixins
-from .models import Task, Comment
-from .forms import AddTaskForm, AddCommentForm
+from . import archives, caches, consecutive, daystatus, exports, imports, metrics, mixins, recurring, search, stats, summaries, sync
+from .models import Task, Comment, RecurringTask
+from .forms import AddTaskForm, AddCommentForm, ExportForm, ImportForm
+
+
+def wants_json(request):
+    """fetch()などからJSONでの応答を求められているか"""
+    return 'application/json' in request.headers.get('Accept', '')
+
+
+def get_page_validators(request):
+    """ログインユーザーのページの (ETag, Last-Modified) を返す。条件付きGETを使わない時は (None, None)
+
+    ETagはユーザーの watermark（タスク・メモ・プロフィールの変更で更新される）、URL（表示する日やカーソル）、
+    週の始まりと今日の日付から作るので、ページの内容が変わりうる時は必ず変わる。
+    表示待ちのメッセージがある時は、304を返すとメッセージが表示されないので使わない。
+    """
+    if hasattr(request, '_page_validators'):
+        return request._page_validators
+
+    validators = (None, None)
+    user = request.user
+    if user.is_authenticated and not len(messages.get_messages(request)):
+        watermark = caches.get_watermark(user.pk)
+        today = datetime.date.today()
+        key = f'{settings.PAGE_ETAG_VERSION}:{user.pk}:{watermark!r}:{request.get_full_path()}:{user.week_status}:{today}'
+        # 日付が変わると「今日」の表示も変わるので、Last-Modified は今日の0時より前にしない
+        last_modified = max(
+            datetime.datetime.fromtimestamp(watermark, tz=datetime.timezone.utc),
+            timezone.make_aware(datetime.datetime.combine(today, datetime.time())),
+        )
+        validators = (hashlib.sha1(key.encode()).hexdigest(), last_modified)
+
+    # condition() は etag_func と last_modified_func を別々に呼ぶので、1回だけ作る
+    request._page_validators = validators
+    return validators
+
+
+def page_etag(request, *args, **kwargs):
+    return get_page_validators(request)[0]
+
+
+def page_last_modified(request, *args, **kwargs):
+    return get_page_validators(request)[1]
+
+
+# ページが変わっていなければ、ビューの処理をせずに304を返す
+page_condition = condition(etag_func=page_etag, last_modified_func=page_last_modified)
+# ブラウザにキャッシュしたページを使わせる時は、毎回ETagで確認させる（304にも付ける）
+page_cache_control = cache_control(private=True, no_cache=True)
+
+
+def task_state_response(request, task, deleted=False, status=None, consecutive=None):
+    """タスクの状態・その日のカレンダーの状態・連続記録だけをJSONで返す
+
+    ページ全体を描画し直さずに、画面の該当箇所だけを書き換えるためのレスポンス。
+    その日の状態(status)と連続記録(consecutive)は、読み込み済みなら渡せる。
+    """
+    day = task.created_at
+    if status is None:
+        status = daystatus.get_status_of_day(request.user, day)
+    if consecutive is None:
+        consecutive = get_consecutive_summary(request.user)
+    return JsonResponse({
+        'task': {
+            'id': task.id,
+            'done': task.done_at is not None,
+            'deleted': deleted,
+        },
+        'day': daystatus.status_to_dict(day, status),
+        'consecutive': consecutive,
+    })
+
+
+def get_consecutive_summary(user):
+    """JSONで返す連続記録。記録が無い時も0日として返す"""
+    record = consecutive.get_consecutive_record(user)
+    return consecutive.summarize_consecutive_record(record) or {
+        'current_consecutive_day': 0,
+        'most_consecutive_day': 0,
+    }
 
 
 @csrf_protect
 def task_delete(request, task_id):
     task = get_object_or_404(Task, pk=task_id)
 
-    if request.method == 'DELETE' and request.user == task.created_by:
-        task.delete()
+    if request.method == 'DELETE' and request.user.pk == task.created_by_id:
+        task_pk = task.pk
+        # 日ごとの集計・連続記録もシグナルから同じトランザクションで更新される
+        with transaction.atomic():
+            # 繰り返しのタスクは、この日の分をもう作らないようにする
+            recurring.skip_occurrence(task)
+            task.delete()
+        if wants_json(request):
+            # delete()でpkはNoneになるので戻しておく
+            task.pk = task_pk
+            return task_state_response(request, task, deleted=True)
         return redirect('task:top')
+    elif wants_json(request):
+        return JsonResponse({'error': "You can't delete a task this way."}, status=403)
     else:
         return HttpResponse("<h1>You can't delete a task this way.😅</h1>")
 
 
-@csrf_protect
-def task_done(request, task_id, status):
+def toggle_task(request, task_id, status):
+    """タスクの完了・未完了を切り替える。(タスク, エラー時のレスポンス) を返す"""
     task = get_object_or_404(Task, pk=task_id)
 
-    if request.method == 'POST' and request.user == task.created_by:
+    if request.method == 'POST' and request.user.pk == task.created_by_id:
         if status == 'true':
             task.done_at = timezone.now()
         else:
             task.done_at = None
-        task.save()
-        return redirect('task:top')
+        with transaction.atomic():
+            task.save()
+        return task, None
+    elif wants_json(request):
+        return task, JsonResponse({'error': 'What are you doing here...'}, status=403)
     else:
-        return HttpResponse('<h1>What are you doing here...😅</h1>')
+        return task, HttpResponse('<h1>What are you doing here...😅</h1>')
 
 
+@csrf_protect
+def task_done(request, task_id, status):
+    task, error = toggle_task(request, task_id, status)
+    if error is not None:
+        return error
+    if wants_json(request):
+        return task_state_response(request, task)
+    return redirect('task:top')
+
+
+BATCH_ACTIONS = ('done', 'undone', 'delete')
+
+
+@login_required
+@require_POST
+def task_batch(request):
+    """複数のタスクをまとめて完了・未完了・削除する
+
+    {"action": "done" | "undone" | "delete", "ids": [1, 2, ...]} のJSONを受け取り、
+    所有者の確認を1クエリで行ってから、created_by で絞ったUPDATE / DELETEでまとめて処理する。
+    """
+    try:
+        data = json.loads(request.body)
+        action = data['action']
+        ids = data['ids']
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({'error': 'invalid request'}, status=400)
+
+    # 文字列や小数を受け付けると、"12" が [1, 2] になるなど、別のタスクを処理してしまう
+    if not isinstance(ids, list) or not all(isinstance(i, int) and not isinstance(i, bool) for i in ids):
+        return JsonResponse({'error': 'invalid request'}, status=400)
+    ids = set(ids)
+
+    if action not in BATCH_ACTIONS or not ids:
+        return JsonResponse({'error': 'invalid request'}, status=400)
+
+    tasks = Task.objects.filter(pk__in=ids, created_by=request.user)
+
+    # 他のユーザーのタスクや存在しないタスクが含まれていたら何もしない
+    affected = dict(tasks.values_list('id', 'created_at'))
+    if len(affected) != len(ids):
+        return JsonResponse({'error': 'task not found', 'ids': sorted(ids - set(affected))}, status=404)
+
+    days = sorted(set(affected.values()))
+
+    with transaction.atomic():
+        # 集計の行は、書き込む前に日付の順にロックする
+        for day in days:
+            summaries.lock_day(request.user.pk, day)
+        if action == 'delete':
+            # 削除はシグナル（集計・カレンダーキャッシュの更新）を送るため、QuerySet.delete()で行う
+            # 集計と連続記録の更新は日ごとに1回だけ、削除の記録は最後にまとめて作る
+            with summaries.deferred_refresh(), sync.deferred_tombstones():
+                # 繰り返しのタスクは、その日の分をもう作らないようにする
+                recurring.skip_occurrences(tasks)
+                tasks.delete()
+        else:
+            # update()ではシグナルが送られないので、変更の版を付け、集計とキャッシュを日ごとに更新する
+            tasks.update(
+                done_at=timezone.now() if action == 'done' else None,
+                version=sync.next_version(request.user.pk),
+            )
+            for day in days:
+                summaries.refresh_day(request.user.pk, day)
+            caches.invalidate_task_days(request.user.pk, *days)
+
+    return JsonResponse({
+        'action': action,
+        'ids': sorted(affected),
+        'count': len(affected),
+        'days': [daystatus.status_to_dict(day, daystatus.get_status_of_day(request.user, day)) for day in days],
+        'consecutive': get_consecutive_summary(request.user),
+    })
+
+
+def get_day_panel_context(the_day, tasks, comment, form=None, archived=False):
+    """日ごとの表示のうち、その日の部分（前日・翌日のリンク、タスク、メモ）のコンテキスト
+
+    archived が True なら、アーカイブから読んだタスクなので、完了の切り替えや削除をさせない。
+    """
+
+    # 明日と昨日を取得
+    yesterday = the_day - datetime.timedelta(days=1)
+    tomorrow = the_day + datetime.timedelta(days=1)
+
+    return {
+        'tasks_of_the_day': tasks,
+        'form': form or AddTaskForm(),
+        'today': datetime.date.today(),
+        'yesterday': yesterday,
+        'tomorrow': tomorrow,
+        'the_day': the_day,
+        # コメントが存在すれば編集モードに
+        'comment_form': AddCommentForm(instance=comment),
+        'comment': comment,
+        'archived': archived,
+    }
+
+
+def get_tasks_of_the_day(user, the_day, maybe_archived=True, maybe_recurring=True):
+    """その日の (タスク, メモ, アーカイブから読んだか) を返す
+
+    アーカイブした月の日は、戻さずにアーカイブから読む。月間カレンダーから、アーカイブした月ではない・
+    まだ作っていない繰り返しのタスクが無いとわかっている時は、maybe_archived / maybe_recurring を False にする。
+    """
+    if maybe_archived:
+        archived_day = archives.get_archived_day(user, the_day)
+        if archived_day is not None:
+            return (*archived_day, True)
+
+    # まだ作っていない繰り返しのタスクがあれば、この日の分を作る
+    if maybe_recurring:
+        recurring.materialize(user, the_day)
+    tasks = list(Task.objects.filter(created_by=user, created_at=the_day))
+    comment = Comment.objects.filter(created_by=user, created_at=the_day).first()
+    return tasks, comment, False
+
+
+@method_decorator([page_cache_control, page_condition], name='dispatch')
 class TopView(mixins.MonthWithTaskMixin, generic.TemplateView):
     template_name = 'task/top.html'
     model = Task
     date_field = 'created_at'
 
-    def dispatch(self, request, *args, **kwargs):
-
-        today = datetime.date.today()
-
-        # 日付のパラメータが無い時（トップページ）は今日を表示
+    def get_the_day(self, kwargs):
+        """表示する日を返す。日付のパラメータが無い時（トップページ）は今日を表示"""
         if kwargs.get('year') is None:
+            today = datetime.date.today()
             kwargs['year'] = today.year
             kwargs['month'] = today.month
             kwargs['day'] = today.day
 
-        the_day = datetime.date(kwargs['year'], kwargs['month'], kwargs['day'])
+        return datetime.date(kwargs['year'], kwargs['month'], kwargs['day'])
+
+    def setup_user(self, user):
+        # 週の始まり設定 True : 日曜日   False : 月曜日
+        if user.week_status:
+            self.first_weekday = 6
+
+    def get_day_context(self, the_day, tasks, comment, consecutive, calendar_context, form=None, archived=False):
+        """表示する日のタスク・コメント・連続記録と、月間カレンダーからテンプレートのコンテキストを作る"""
+        context = super().get_context_data(**self.kwargs)
+        context.update(get_day_panel_context(the_day, tasks, comment, form, archived))
+        context['consecutive'] = consecutive
+        context.update(calendar_context)
+        return context
+
+    def dispatch(self, request, *args, **kwargs):
+
+        today = datetime.date.today()
+        the_day = self.get_the_day(self.kwargs)
 
         if request.user.is_authenticated:
-            # 週の始まり設定 True : 日曜日   False : 月曜日
-            if request.user.week_status:
-                self.first_weekday = 6
+            self.setup_user(request.user)
 
-            tasks = Task.objects.filter(created_by=request.user, created_at=the_day)
             form = AddTaskForm(request.POST or None)
 
-            # コメントを取得、なければNoneを入れておく
-            try:
-                comment = Comment.objects.filter(created_by=request.user, created_at=the_day)[0]
-            except IndexError:
-                comment = None
+            if request.method == 'POST':
+                # アーカイブした月に書き込む時は、先にタスク・メモを戻す
+                archives.restore_month(request.user, the_day)
 
-            # コメントが存在すれば編集モードに
-            if comment:
-                comment_form = AddCommentForm(request.POST or None, instance=comment)
-            else:
-                comment_form = AddCommentForm(request.POST or None)
+                # コメントを取得、なければNoneを入れておく（コメントは1日1つまで）
+                comment = Comment.objects.filter(created_by=request.user, created_at=the_day).first()
+                comment_form = AddCommentForm(request.POST, instance=comment)
 
-            if request.method == 'POST':
                 # タスクフォーム処理開始
-                if form.is_valid():
+                if form.is_valid() and form.cleaned_data['repeat']:
+                    # 繰り返しを追加する。この日のタスクも、繰り返しの日なら一緒に作られる
+                    recurring.create_recurring_task(
+                        request.user,
+                        form.cleaned_data['title'],
+                        form.cleaned_data['repeat'],
+                        form.cleaned_data['interval'] or 1,
+                        the_day,
+                    )
+                elif form.is_valid():
                     form = form.save(commit=False)
                     form.created_by = request.user
 
@@ -85,61 +327,288 @@ class TopView(mixins.MonthWithTaskMixin, generic.TemplateView):
                     if today != the_day:
                         form.created_at = the_day
 
-                    form.save()
+                    # 日ごとの集計・連続記録もシグナルから同じトランザクションで更新される
+                    with transaction.atomic():
+                        form.save()
 
                 # コメントフォーム処理開始
+                # (created_by, created_at)の一意インデックスを使って、その日のコメントを作成・更新する
                 if comment_form.is_valid():
-                    comment_form = comment_form.save(commit=False)
-                    comment_form.created_by = request.user
+                    Comment.objects.update_or_create(
+                        created_by=request.user,
+                        created_at=the_day,
+                        defaults={'body': comment_form.cleaned_data['body']},
+                    )
+
+                return redirect('task:day', the_day.year, the_day.month, the_day.day)
 
-                    # 今日以外では「選択されている日」をコメントの作成日に入れる
-                    if today != the_day:
-                        comment_form.created_at = the_day
-
-                    comment_form.save()
-
-                return redirect('task:day', kwargs['year'], kwargs['month'], kwargs['day'])
-
-            # 明日と昨日を取得
-            yesterday = the_day - datetime.timedelta(days=1)
-            tomorrow = the_day + datetime.timedelta(days=1)
-
-            task_context = {
-                'tasks_of_the_day': tasks,
-                'form': form,
-                'today': today,
-                'yesterday': yesterday,
-                'tomorrow': tomorrow,
-                'the_day': the_day,
-                'comment_form': comment_form,
-                'comment': comment,
-                'consecutive': self.get_best_consecutive(),
-            }
-
-            context = super().get_context_data(**kwargs)
-            context.update(task_context)
             calendar_context = self.get_month_calendar()
-            context.update(calendar_context)
 
+            # アーカイブした月の日は、戻さずにアーカイブから読む
+            # 集計はカレンダーの表示にだけ使い、その日のタスク・コメントは毎回読む
+            # （集計やキャッシュが古くても、タスクが見えなくならないように）
+            tasks, comment, archived = get_tasks_of_the_day(
+                request.user, the_day,
+                maybe_archived=the_day.replace(day=1) in calendar_context.get('archived_months', ()),
+                maybe_recurring=the_day in calendar_context.get('recurring_days', ()),
+            )
+
+            context = self.get_day_context(
+                the_day, tasks, comment, self.get_best_consecutive(), calendar_context, form=form, archived=archived
+            )
             return self.render_to_response(context)
         else:
             return render(request, 'task/top_guest.html')
 
 
+@login_required
+def day_panel_view(request, year, month, day):
+    """その日の部分(task/day_panel.html)だけを描画してJSONで返す
+
+    同じ月の中で前日・翌日に移動する時に、top.js がページの一部だけを書き換えるために使う。
+    カレンダーと連続記録は変わらないので作らず、その日のタスクとメモ（とアーカイブ・繰り返し）のクエリだけで済ませる。
+    """
+    try:
+        the_day = datetime.date(year, month, day)
+    except ValueError:
+        raise Http404
+
+    tasks, comment, archived = get_tasks_of_the_day(request.user, the_day)
+    html = render_to_string(
+        'task/day_panel.html', get_day_panel_context(the_day, tasks, comment, archived=archived), request=request
+    )
+    return JsonResponse({
+        'date': the_day.isoformat(),
+        'url': reverse('task:day', args=(the_day.year, the_day.month, the_day.day)),
+        'title': f'{date_format(the_day)} | DoneList',
+        'html': html,
+    })
+
+
+class HeatmapView(LoginRequiredMixin, mixins.YearWithTaskMixin, generic.TemplateView):
+    """1年分のタスクの完了度を、ヒートマップで表示する"""
+    template_name = 'task/heatmap.html'
+
+    def get_context_data(self, **kwargs):
+        if not datetime.MINYEAR < self.get_current_year() < datetime.MAXYEAR:
+            raise Http404
+
+        # 週の始まり設定 True : 日曜日   False : 月曜日
+        if self.request.user.week_status:
+            self.first_weekday = 6
+
+        context = super().get_context_data(**kwargs)
+        context.update(self.get_year_heatmap())
+        context['level_labels'] = daystatus.LEVEL_LABELS
+        return context
+
+
+@login_required
+def stats_view(request):
+    """週ごと・月ごと・曜日ごとの完了率などの統計を表示"""
+    return render(request, 'task/stats.html', {'stats': stats.get_stats(request.user)})
+
+
+@login_required
+def search_view(request):
+    """タスク名・メモを検索する"""
+    query = request.GET.get('q', '').strip()
+    try:
+        offset = max(0, int(request.GET.get('offset', 0)))
+    except ValueError:
+        offset = 0
+
+    results, next_offset = search.search(request.user, query, offset) if query else ([], None)
+    return render(request, 'task/search.html', {
+        'query': query,
+        'results': results,
+        'next_offset': next_offset,
+        'max_length': search.MAX_QUERY_LENGTH,
+    })
+
+
+@login_required
+def recurring_view(request):
+    """繰り返しのタスクの一覧"""
+    today = datetime.date.today()
+    recurrences = (
+        RecurringTask.objects.filter(created_by=request.user)
+            .exclude(end_date__lt=today)
+            .order_by('start_date', 'id')
+    )
+    return render(request, 'task/recurring.html', {'recurrences': recurrences})
+
+
+@login_required
+@require_POST
+def recurring_stop(request, recurrence_id):
+    """繰り返しを今日から止める"""
+    recurrence = get_object_or_404(RecurringTask, pk=recurrence_id, created_by=request.user)
+    recurring.stop_recurring_task(recurrence)
+    messages.add_message(request, messages.SUCCESS, f'「{recurrence.title}」の繰り返しを止めました。')
+    return redirect('task:recurring')
+
+
 @login_required
 def delete_comment(request, year, month, day):
     """コメントをGETアクセスから削除"""
 
     the_day = datetime.date(year, month, day)
+    # アーカイブした月のメモは、戻してから消す
+    archives.restore_month(request.user, the_day)
     comment = get_object_or_404(Comment, created_by=request.user, created_at=the_day)
 
     comment.delete()
     return redirect('task:day', year, month, day)
 
 
+# 完了済みタスク一覧で、一度に表示する件数
+COMPLETED_PAGE_SIZE = 50
+
+
+def decode_completed_cursor(cursor):
+    """'2021-09-01.123' の形式のカーソルを (完了日, タスクID) にする。不正な値ならNoneを返す"""
+    try:
+        done_at, task_id = cursor.split('.')
+        return datetime.date.fromisoformat(done_at), int(task_id)
+    except ValueError:
+        return None
+
+
+def get_completed_page(user, cursor=None):
+    """完了済みタスクを、完了日の新しい順に1ページ分返す
+
+    (done_at, id) をカーソルにしたキーセットページングなので、何ページ目でも
+    (created_by, done_at) のインデックスを範囲検索するだけで済む。
+    アーカイブしたタスクも元のIDを持っているので、同じカーソルで読んで並べ直す。
+
+    Returns:
+        tuple[list[Task], str | None]: タスクのリストと、次のページのカーソル
+    """
+    tasks = Task.objects.filter(done_at__isnull=False, created_by=user)
+
+    if cursor:
+        done_at, task_id = cursor
+        # done_at <= カーソル を先に書くことで、インデックスの範囲検索になる
+        tasks = tasks.filter(Q(done_at__lte=done_at), Q(done_at__lt=done_at) | Q(id__lt=task_id))
+
+    tasks = list(tasks.order_by('-done_at', '-id')[:COMPLETED_PAGE_SIZE + 1])
+    archived = archives.get_done_tasks(user, cursor, COMPLETED_PAGE_SIZE + 1)
+    if archived:
+        tasks = sorted(tasks + archived, key=lambda task: (task.done_at, task.id), reverse=True)
+        tasks = tasks[:COMPLETED_PAGE_SIZE + 1]
+
+    next_cursor = None
+    if len(tasks) > COMPLETED_PAGE_SIZE:
+        tasks = tasks[:COMPLETED_PAGE_SIZE]
+        next_cursor = f'{tasks[-1].done_at.isoformat()}.{tasks[-1].id}'
+
+    return tasks, next_cursor
+
+
 @login_required
+@page_cache_control
+@page_condition
 def completed_task_view(request):
     """完了済みタスクの一覧を表示"""
 
-    done_tasks = Task.objects.filter(done_at__isnull=False, created_by=request.user)
-    return render(request, 'task/completed.html', {'done_tasks': done_tasks})
+    cursor = decode_completed_cursor(request.GET.get('cursor', ''))
+    done_tasks, next_cursor = get_completed_page(request.user, cursor)
+    return render(request, 'task/completed.html', {'done_tasks': done_tasks, 'next_cursor': next_cursor})
+
+
+@login_required
+def completed_task_json(request):
+    """完了済みタスクの続きをJSONで返す（無限スクロール用）"""
+
+    cursor = decode_completed_cursor(request.GET.get('cursor', ''))
+    if cursor is None:
+        return JsonResponse({'error': 'invalid cursor'}, status=400)
+
+    done_tasks, next_cursor = get_completed_page(request.user, cursor)
+    return JsonResponse({
+        'tasks': [{'title': task.title, 'done_at': date_format(task.done_at)} for task in done_tasks],
+        'next_cursor': next_cursor,
+    })
+
+
+@login_required
+def sync_view(request):
+    """前回の同期より後のタスク・メモの変更をJSONで返す（オフラインのクライアント用）
+
+    cursor には前回受け取った cursor を渡す（最初は省略する）。has_more が true の間は、
+    受け取った cursor で続きを読む。クライアントは tasks / comments をIDで上書きしてから、deleted のものを消す。
+    """
+    cursor = request.GET.get('cursor', '')
+    if cursor:
+        try:
+            cursor = int(cursor)
+        except ValueError:
+            return JsonResponse({'error': 'invalid cursor'}, status=400)
+    else:
+        cursor = None
+
+    return JsonResponse(sync.get_changes(request.user, cursor))
+
+
+@login_required
+def export_view(request):
+    """タスク・メモの履歴をCSV / JSON Linesでダウンロードする
+
+    パラメータが無い時は条件を選ぶフォームを表示する。
+    """
+    form = ExportForm(request.GET or None)
+
+    if not form.is_valid():
+        return render(request, 'task/export.html', {'form': form})
+
+    export_format = form.cleaned_data['format']
+    gzip = form.cleaned_data['gzip']
+    stream = exports.export_stream(
+        request.user,
+        export_format,
+        start=form.cleaned_data['start'],
+        end=form.cleaned_data['end'],
+        gzip=gzip,
+    )
+
+    filename = f"donelist-{datetime.date.today():%Y%m%d}.{export_format}"
+    if gzip:
+        filename += '.gz'
+        content_type = 'application/gzip'
+    elif export_format == 'csv':
+        content_type = 'text/csv; charset=utf-8'
+    else:
+        content_type = 'application/x-ndjson; charset=utf-8'
+
+    response = StreamingHttpResponse(stream, content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+@login_required
+def import_view(request):
+    """CSV / JSON Linesからタスク・メモを一括で取り込む"""
+    form = ImportForm(request.POST or None, request.FILES or None)
+
+    if request.method == 'POST' and form.is_valid():
+        result = imports.import_records(request.user, form.cleaned_data['file'], form.cleaned_data['format'])
+
+        messages.add_message(
+            request, messages.SUCCESS,
+            f"タスク{result['tasks']}件・メモ{result['comments']}件を取り込みました。（{result['seconds']:.1f}秒）"
+        )
+        if result['skipped']:
+            messages.add_message(
+                request, messages.WARNING,
+                f"{result['skipped']}件は取り込めませんでした。" + ' / '.join(result['errors'][:10])
+            )
+        return redirect('task:top')
+
+    return render(request, 'task/import.html', {'form': form})
+
+
+@staff_member_required
+def metrics_view(request):
+    """このプロセスで処理したリクエストの、URL名ごとの処理時間・クエリ数をJSONで返す（スタッフ用）"""
+    return JsonResponse(metrics.store.snapshot())